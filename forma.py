@@ -21,11 +21,17 @@
 
 
 import argparse
+import atexit
+import contextlib
+import shutil
+import tempfile
 import sys 
 import glob, os
 import re
 import fnmatch
 
+import multiprocessing as mp
+
 import numpy as np
 
 import logging
@@ -36,41 +42,50 @@ from pydumpi import util
 from tabulate import tabulate
 
 import forma_trace as ft
+import forma_dumpi as fdr
+import forma_footer as ff
+import forma_opdata as fod
+import forma_cache as fc
 import forma_parse as fp
 import forma_stats as fs
 import forma_prints as fo
+import forma_export as fe
+import forma_profile as fpr
+import forma_progress as fpg
+import forma_select as fsel
+import forma_api as fapi
+import forma_partial as fpt
+import forma_compare as fcmp
 
+## library API, cf. forma_api.py
+from forma_api import FormaError, FormaTraces, FormaResults
 
-rma_tracked_calls = ['MPI_Win_create', 'MPI_Get', 'MPI_Put', 'MPI_Accumulate', 'MPI_Win_free', 'MPI_Win_fence']
+load = fapi.forma_load
+load_partials = fapi.forma_load_partials
+analyze = fapi.forma_analyze
+compare = fcmp.forma_compare
 
 
-def check_filepaths(dirname, timestamp):
-
-	ordered_files_all = sorted(os.listdir(format(str(dirname))))
-	ordered_files = []
-	ordered_ascii_files = []
+rma_tracked_calls = ['MPI_Win_create', 'MPI_Get', 'MPI_Put', 'MPI_Accumulate', 'MPI_Win_free', 'MPI_Win_fence']
 
-	total_file_size = 0
+## size of the write buffer of each output file, so that the rows of a report 
+## are written out in large blocks rather than one at a time
+report_buffer_size = 1 << 20
 
-	for filename in ordered_files_all:
-		if fnmatch.fnmatch(filename, 'dumpi-'+format(str(timestamp))+'*.bin'):
-			filepath = format(str(dirname))+'/'+format(str(filename))
+## output file of each report, as named in profiles
+report_files = {'per_epoch_stats_to_file': 'epochs.txt', 'fence_stats_to_file': 'fences.txt', 'per_op_durations_to_file': 'calls.txt'}
 
-			total_file_size = total_file_size + os.path.getsize(filepath)
+## rough parse throughput of each reader, in trace records per second and 
+## worker process (cf. forma_bench.py), for the parse time estimate of --quick
+parse_records_per_sec = {'native': 1000000, 'pydumpi': 100000}
 
-			ordered_files.append(filepath)
 
-	#print(ordered_files)
-	total_file_size = round(total_file_size/1024)
-	if total_file_size == 0:
-		print('Trace files seem empty. Make sure that you are using well-formatted SST Dumpi outputs.')
-		sys.exit(1)
+def check_filepaths(dirname, timestamp):
 
-	## Read metafile and print it -- TODO: to be used more extensively later
 	try:
-		metafile = util.read_meta_file(str(dirname)+'/dumpi-'+format(str(timestamp))+'.meta')
-	except FileNotFoundError:
-		print('Trace files not found. Check timestamp formatting.\n\n')
+		ordered_files, total_file_size = fapi.forma_api_tracefiles(dirname, timestamp)
+	except FormaError as e:
+		print(e)
 		sys.exit(1)
 
 	print(f'\nAbout to parse a total of {total_file_size} KBytes of binary trace files size.\n')
@@ -78,69 +93,153 @@ def check_filepaths(dirname, timestamp):
 	return(ordered_files)
 
 
-def check_mem_capacity(tracefiles, rma_tracked_calls, rma_callcount_per_rank):
+def available_memory():
+
+	""" returns the memory (Bytes) available to foRMA, or None if unknown """
+
+	try:
+		with open('/proc/meminfo') as f:
+			for line in f:
+				if line.startswith('MemAvailable:'):
+					return int(line.split()[1])*1024
+	except (OSError, ValueError, IndexError):
+		pass
+
+	try:
+		return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+	except (ValueError, OSError, AttributeError):
+		return None
+
+
+def estimate_mem_use(tracefiles, call_counts_per_rank, version='m', jobs=1, native=True):
 
+	""" predicts the peak memory use (Bytes) of parsing (and, for the in-memory 
+		version, keeping) the RMA op data of tracefiles, out of the call counts 
+		of their footers. Returns None for the incremental version, which keeps 
+		no per-op data. 
+	"""
+
+	per_rank_bytes = []
 	total_rma_occurrences = 0
 
+	for tf, call_counts in zip(tracefiles, call_counts_per_rank):
+		rma_occurrences_for_rank = sum([call_counts[fid] for fid in [fdr.dumpi_get, fdr.dumpi_put, fdr.dumpi_accumulate, fdr.dumpi_win_fence]])
+		total_rma_occurrences += rma_occurrences_for_rank
 
-	for tf in tracefiles:
-
-		rma_occurrences_for_rank = [0,0,0,0]
-
-		with ft.FormaIMTrace(tf) as trace:
-			print(f'Reading footer of {tf}.')
-			#trace.print_footer()
-			fcalls, icalls = trace.read_footer()
-			
-			for name, count in fcalls.items():
-				#if name in {"on_get", "on_put", "on_accumulate", "on_win_fence"}:
-				if name == "on_get": 
-					print("  {0}: {1}".format(name, count))
-					rma_occurrences_for_rank[0] = count
-					total_rma_occurrences += count
-				if name == "on_put": 
-					print("  {0}: {1}".format(name, count))
-					rma_occurrences_for_rank[1] = count
-					total_rma_occurrences += count
-				if name == "on_accumulate": 
-					print("  {0}: {1}".format(name, count))
-					rma_occurrences_for_rank[2] = count
-					total_rma_occurrences += count
-				if name == "on_win_fence": 
-					print("  {0}: {1}".format(name, count))
-					rma_occurrences_for_rank[3] = count
-					total_rma_occurrences += count
-
-		rma_callcount_per_rank.append(rma_occurrences_for_rank)
-
-	in_mem_estimate = (total_rma_occurrences * 32) / 1024 ## how many KByte for in-memory version? (assuming 32 byte needed per op)
-
-	#print(f'Total RMA occurrences to be considered: {total_rma_occurrences}')
-
-	if in_mem_estimate > 9.766e+6: ## for now, checking whether I need more than 10 Giga
-		return True
-	else:
+		## the native reader also holds the whole trace file and a few Bytes per record
+		rank_bytes = fod.FormaOpdata.parse_bytes(rma_occurrences_for_rank)
+		if native:
+			rank_bytes += os.path.getsize(tf) + sum(call_counts)*fdr.dumpi_bytes_per_record
+		per_rank_bytes.append(rank_bytes)
+
+	## up to jobs ranks are parsed at the same time
+	parse_bytes = sum(sorted(per_rank_bytes)[-max(jobs, 1):])
+
+	if version == 'm':
+		## the stores of all ranks, and then their concatenation
+		return parse_bytes + 2 * total_rma_occurrences * fod.FormaOpdata.bytes_per_op
+	elif version == 'o':
+		return parse_bytes
+
+	return None
+
+
+def estimate_parse_time(call_counts_per_rank, jobs=1, reader='native'):
+
+	""" roughly estimates the time (sec) it takes to parse trace files with 
+		the given footer call counts, with up to jobs of them at the same time 
+	"""
+
+	per_rank_secs = [sum(call_counts)/parse_records_per_sec[reader] for call_counts in call_counts_per_rank]
+	if not per_rank_secs:
+		return 0.0
+
+	## workers beyond the number of cores do not parse any faster
+	workers = min(max(jobs, 1), os.cpu_count() or 1, len(per_rank_secs))
+
+	return max(max(per_rank_secs), sum(per_rank_secs)/workers)
+
+
+def check_mem_capacity(tracefiles, rma_callcount_per_rank, version='m', jobs=1, native=True):
+
+	""" predicts the peak memory use of parsing (and, for the in-memory 
+		version, keeping) the RMA op data of tracefiles, out of the call 
+		counts found in their footers, i.e. before any parsing. The RMA 
+		call counts of each rank (MPI_Get, MPI_Put, MPI_Accumulate, 
+		MPI_Win_fence) are appended to rma_callcount_per_rank. Returns 
+		True if the prediction exceeds the available memory. 
+	"""
+
+	call_counts_per_rank = ff.forma_footer_scan(tracefiles)
+	for tf, call_counts in zip(tracefiles, call_counts_per_rank):
+		if call_counts is None:
+			logging.debug(f'Could not read footer of {tf}, skipping memory check.')
+			return False
+		rma_callcount_per_rank.append([call_counts[fid] for fid in [fdr.dumpi_get, fdr.dumpi_put, fdr.dumpi_accumulate, fdr.dumpi_win_fence]])
+
+	in_mem_estimate = estimate_mem_use(tracefiles, call_counts_per_rank, version, jobs, native)
+	if in_mem_estimate is None:
 		return False
 
+	available = available_memory()
+	logging.debug(f'Predicted peak memory use: {in_mem_estimate/1048576:.1f} MB '+
+				f'(available: {"unknown" if available is None else f"{available/1048576:.1f} MB"}).')
+
+	return available is not None and in_mem_estimate > available
 
-def check_consistency(ranks, wins, opdata_per_rank):
+
+def quick_summary(tracefiles, version='m', jobs=1, reader='native'):
+
+	""" prints the call counts of the execution summary, together with memory 
+		use and parse time estimates, out of the footers of tracefiles only 
+		(--quick). Returns False if a footer cannot be read. 
+	"""
+
+	call_counts_per_rank = ff.forma_footer_scan(tracefiles)
+	for tf, call_counts in zip(tracefiles, call_counts_per_rank):
+		if call_counts is None:
+			print(f'Could not read the footer of trace file {tf}.')
+			return False
+
+	ranks = len(tracefiles)
+	wins = call_counts_per_rank[0][fdr.dumpi_win_create] if ranks > 0 else 0
+	callcount_per_opcode = ff.forma_footer_totals(call_counts_per_rank, [fdr.dumpi_get, fdr.dumpi_put, fdr.dumpi_accumulate, fdr.dumpi_win_fence, 
+																		fdr.dumpi_win_create, fdr.dumpi_win_free, fdr.dumpi_init, fdr.dumpi_finalize])
+
+	trace_bytes = sum([os.path.getsize(tf) for tf in tracefiles])
+	records = sum([sum(call_counts) for call_counts in call_counts_per_rank])
+	available = available_memory()
+	mem_estimates = [estimate_mem_use(tracefiles, call_counts_per_rank, v, jobs, reader == 'native') for v in ['m', 'o']]
+
+	print("\n\n\n")
+	fo.forma_print_callcounts(ranks, wins, callcount_per_opcode)
+
+	print('------------------------------------------------------------------------------------------\n' +
+		'----------------------------- ESTIMATES (from footers) -----------------------------------\n' +
+		'------------------------------------------------------------------------------------------\n' +
+		'\n' +
+		f'-- Trace size (MB)\t\t\t:   {trace_bytes/1048576:.1f}\n' +
+		f'-- # of trace records\t\t\t:   {records}\n' +
+		f'-- Peak memory, in-memory (MB)\t\t:   {mem_estimates[0]/1048576:.1f}{" (*)" if version == "m" else ""}\n' +
+		f'-- Peak memory, out-of-core (MB)\t:   {mem_estimates[1]/1048576:.1f}{" (*)" if version == "o" else ""}\n' +
+		f'-- Peak memory, incremental (MB)\t:   no per-op data kept{" (*)" if version == "i" else ""}\n' +
+		f'-- Available memory (MB)\t\t:   {"unknown" if available is None else f"{available/1048576:.1f}"}\n' +
+		f'-- Parse time (sec)\t\t\t:   {estimate_parse_time(call_counts_per_rank, jobs, reader):.1f} ({reader} reader, {jobs} job{"s" if jobs > 1 else ""})\n' +
+		'\n' +
+		'(*) selected version. Parse time is a rough estimate, which depends on the machine.\n')
+
+	return True
+
+
+def check_consistency(ranks, wins, opdata):
 
 	print("Performing a format sanity check on extracted trace data...\t", end="")
 
-	if len(opdata_per_rank) != ranks:
-		return 1
-	else:
-		for i in range(ranks):
-			if len(opdata_per_rank[i]) != wins:
-				return 2
-		for j in range(wins):
-			epoch_cnt = len(opdata_per_rank[0][j])
-			for i in range(ranks):
-				if len(opdata_per_rank[i][j]) != epoch_cnt:
-					return 3
-	
-	print("Sanity check ok.\n")
-	return 0
+	sanity_check = fp.forma_check_consistency(ranks, wins, opdata)
+	if sanity_check == 0:
+		print("Sanity check ok.\n")
+
+	return sanity_check
 
 
 
@@ -166,78 +265,209 @@ def set_log_level(option):
 
 	return level
 
+def profile_phase(profile, name):
+
+	""" returns the context manager that records phase name in profile, 
+		or one that does nothing if foRMA is not being profiled 
+	"""
+
+	if profile is None:
+		return contextlib.nullcontext()
+
+	return profile.phase(name)
+
+
+def report_profile(profile, filename):
+
+	profile.print()
+	try:
+		profile.save(filename)
+		print(f'Profile can be found in file {filename}\n')
+	except OSError as e:
+		print(f'Could not write profile: {e}')
+
+
+def run_report(report, args, profile=None, queue=None):
+
+	""" produces a single report, as a phase of profile, if given. In a 
+		forked process, the phase is handed back through queue. 
+	"""
+
+	with profile_phase(profile, f'report {report_files.get(report.__name__, report.__name__)}'):
+		report(*args)
+
+	if profile is not None and queue is not None:
+		queue.put(profile.phases[-1])
+
+
+def run_reports(reports, profile=None):
+
+	""" produces the given reports, each given as a (function, arguments) pair. 
+		Reports write to their own output file and share only read-only data, 
+		so when there is more than one of them, each report is produced by a 
+		forked process of its own and they are all produced concurrently. 
+		Where fork is not available, or on a single core, reports are produced 
+		one after the other. 
+	"""
+
+	if len(reports) < 2 or (os.cpu_count() or 1) < 2 or 'fork' not in mp.get_all_start_methods():
+		for report, args in reports:
+			run_report(report, args, profile)
+		return
+
+	## anything still buffered would otherwise be written out by every child
+	sys.stdout.flush()
+	sys.stderr.flush()
+
+	ctx = mp.get_context('fork')
+	queue = ctx.Queue() if profile is not None else None
+	procs = [ctx.Process(target=run_report, args=(report, args, profile, queue)) for report, args in reports]
+	with profile_phase(profile, 'reports'):
+		for p in procs:
+			p.start()
+		for p in procs:
+			p.join()
+
+	if any([p.exitcode != 0 for p in procs]):
+		print('ERROR: could not produce all of the requested results.')
+		sys.exit(1)
+
+	if profile is not None:
+		for p in procs:
+			profile.add_phase(*queue.get())
+
+
+class FormaSession:
+
+	""" the reports of the interactive prompt. The analysed data do not change 
+		during a session, so each report is produced only once, into a directory 
+		of the session, and is then copied to the current directory whenever it 
+		is requested. Reports can be started in the background (as forked 
+		processes, cf. run_reports()), e.g. while the summary is being read. 
+	"""
+
+	def __init__(self, reports, profile=None):
+
+		## (function, arguments) of each report, indexed by output file
+		self.reports = reports
+		self.profile = profile
+
+		self.session_dir = tempfile.mkdtemp(prefix='forma-session-')
+		atexit.register(shutil.rmtree, self.session_dir, True)
+
+		## output files already produced in session_dir, and the processes 
+		## producing the rest in the background, with the queue each one 
+		## hands its profile phase back through, indexed by output file
+		self.produced = set()
+		self.procs = dict()
+
+
+	def run(self, report, args, queue=None):
+
+		os.chdir(self.session_dir)
+		run_report(report, args, self.profile, queue)
+
+
+	def start(self):
+
+		""" starts producing all reports in the background, where fork is available """
+
+		if 'fork' not in mp.get_all_start_methods():
+			return
+
+		sys.stdout.flush()
+		sys.stderr.flush()
+
+		ctx = mp.get_context('fork')
+		for filename, (report, args) in self.reports.items():
+			queue = ctx.Queue() if self.profile is not None else None
+			## daemonic, so that quitting does not wait for reports nobody asked for
+			p = ctx.Process(target=self.run, args=(report, args, queue), daemon=True)
+			p.start()
+			self.procs[filename] = [p, queue]
+
+
+	def produce(self, filenames):
+
+		""" writes the reports of filenames to the current directory, waiting for 
+			the ones still being produced in the background, and producing the ones 
+			that have not been (or could not be) produced yet 
+		"""
+
+		for filename in filenames:
+			p, queue = self.procs.pop(filename, [None, None])
+			if p is None:
+				continue
+			p.join()
+			if p.exitcode == 0:
+				self.produced.add(filename)
+				if queue is not None:
+					self.profile.add_phase(*queue.get())
+
+		missing = [f for f in filenames if f not in self.produced]
+		if missing:
+			cwd = os.getcwd()
+			os.chdir(self.session_dir)
+			try:
+				run_reports([self.reports[f] for f in missing], self.profile)
+			finally:
+				os.chdir(cwd)
+			self.produced.update(missing)
+
+		for filename in filenames:
+			shutil.copyfile(os.path.join(self.session_dir, filename), filename)
+
+
 """
 Outputs data transfer bounds and data volume information into 
 file epochs.txt. Data is calculated by memory window found in 
 the execution. For each memory window, the relevant information 
 is organized by synchronization epochs on that window. 
 """
-def per_epoch_stats_to_file(ranks, wins, per_window_data_vol, opdata_per_rank, all_window_durations_per_rank):
+def per_epoch_stats_to_file(ranks, wins, per_window_data_vol, opdata, all_window_durations_per_rank, per_epoch_data=None):
 
-	opdata_for_epoch = []
-	per_opcode_dt_bound_aggregates_for_window = [0 for i in range(3)]
-	per_opcode_count_for_window = [0 for i in range(4)]
-	per_opcode_duration_aggregates_for_window = [0 for i in range(4)]
-	epoch_data_vol_sum = 0
 	win_duration = [[0,1,2,3], [4,5,6,7]]
 
 	labels = ["- MPI_Get", "- MPI_Put", "- MPI_Accumulate", "- MPI_Win_fence"]
 
-	original_stdout = sys.stdout # Save a reference to the original standard output
-	with open('epochs.txt', 'w') as f:
-		sys.stdout = f # Change the standard output to the file we created.
+	## statistics of all epochs at once, cf. fs.forma_per_epoch_data(); the 
+	## incremental and out-of-core versions provide them along with the rest
+	if per_epoch_data is None:
+		per_epoch_data = fs.forma_break_down_per_epoch(wins, opdata)
+
+	with open('epochs.txt', 'w', buffering=report_buffer_size) as f:
 		print('------------------------------------------------------------------------------------------\n' + 
 		'----------- RMA data transfer bounds - statistics per window per epoch -------------------\n' + 
-		'------------------------------------------------------------------------------------------\n')
+		'------------------------------------------------------------------------------------------\n', file=f)
 
 		for win_id in range(wins):
+			win_total_epochs = opdata.epochs_per_window[0][win_id]
 			print(f'WINDOW ID: {win_id} \n\n' +
 				f'-- Total bytes transferred\t:   {per_window_data_vol[win_id]}\n' +
-				f'-- Total epochs\t\t\t:   {len(opdata_per_rank[0][win_id])-1}\n')
-			for epoch in range(len(opdata_per_rank[0][win_id])-1):
-				for rank in range(ranks):
-					for op in opdata_per_rank[rank][win_id][epoch]:
-						#print(f'value is {opdata_per_rank[rank][win_id][epoch]}')
-						opdata_for_epoch.append(op)
-				#print(f'opdata_for_epoch: {opdata_for_epoch}')
-				per_opcode_dt_bounds_for_epoch, per_opcode_durations_for_epoch, epoch_data_vol_sum = fs.forma_merge_dt_op_durations_for_epoch(opdata_for_epoch)
-
-				##
-				per_opcode_count_for_window = [sum(i) for i in zip(per_opcode_count_for_window, [len(x) for x in per_opcode_durations_for_epoch])]
-				#print(f'per_opcode_count_for_window: {per_opcode_count_for_window}')
-				##
-
-				#dtbound_stats_for_epoch = fs.forma_calculate_dtbounds_stats_for_epoch(per_opcode_dt_bounds_for_epoch)
-				##
-				opduration_stats_for_epoch, dtbound_stats_for_epoch = fs.forma_calculate_opduration_dtbounds_stats_for_epoch(per_opcode_durations_for_epoch, per_opcode_dt_bounds_for_epoch)
-				##
-
-				#per_opcode_duration_aggregates_for_window = [sum(i) for i in zip(per_opcode_duration_aggregates_for_window, opduration_stats_for_epoch[:0])]
-				#per_opcode_dt_bound_aggregates_for_window = [sum(i) for i in zip(per_opcode_dt_bound_aggregates_for_window, dtbound_stats_for_epoch[:0])]
-
-				for i in range(4): # i is the opcode in range 0 - MPI_Get, 1 - MPI_Put, 2 - MPI_Acc, 3 - MPI_Win_fence
-					if i != 3:
-						per_opcode_duration_aggregates_for_window[i] = per_opcode_duration_aggregates_for_window[i]+opduration_stats_for_epoch[i][0]
-						per_opcode_dt_bound_aggregates_for_window[i] = per_opcode_dt_bound_aggregates_for_window[i]+dtbound_stats_for_epoch[i][0]
-					else:
-						per_opcode_duration_aggregates_for_window[i] = per_opcode_duration_aggregates_for_window[i]+opduration_stats_for_epoch[i][1]
+				f'-- Total epochs\t\t\t:   {win_total_epochs}\n', file=f)
 
+			per_opcode_dt_bounds_per_epoch, per_opcode_durations_per_epoch, data_vol_per_epoch = per_epoch_data[win_id]
+			dtbound_stats_per_epoch = fs.forma_epoch_stats_x4(per_opcode_dt_bounds_per_epoch)
+			opduration_stats_per_epoch = fs.forma_epoch_stats_x4(per_opcode_durations_per_epoch)
 
+			for epoch, epoch_data_vol_sum in enumerate(data_vol_per_epoch.tolist()):
 				print(f'-------> Epoch {epoch} \n\n' + 
 					f'Total bytes transferred\t\t :   {epoch_data_vol_sum}\n\n' +
 					'DT bound statistics\n' +
-					'-------------------')
-				fo.forma_print_dtbounds_stats_for_epoch(dtbound_stats_for_epoch)
+					'-------------------', file=f)
+				fo.forma_print_dtbounds_stats_for_epoch(dtbound_stats_per_epoch[epoch], file=f)
 
 				##
 				print('Op duration statistics\n' +
-					'-------------------')
-				fo.forma_print_opduration_stats_for_epoch(opduration_stats_for_epoch)
-
-				##
+					'-------------------', file=f)
+				fo.forma_print_opduration_stats_for_epoch(opduration_stats_per_epoch[epoch], file=f)
 
-				opdata_for_epoch = []
-				epoch_data_vol_sum = 0
+			## op counts and aggregates over the epochs of the window; for 
+			## MPI_Win_fence, the aggregate is taken over the per epoch minimum
+			per_opcode_count_for_window = per_opcode_durations_per_epoch[0].sum(axis=0).tolist()
+			per_opcode_duration_aggregates_for_window = per_opcode_durations_per_epoch[1].sum(axis=0).tolist()
+			per_opcode_duration_aggregates_for_window[3] = int(per_opcode_durations_per_epoch[2][:, 3].sum())
+			per_opcode_dt_bound_aggregates_for_window = per_opcode_dt_bounds_per_epoch[1].sum(axis=0).tolist()
 
 			window_summary_rows = [[0 for i in range(3)] for j in range(4)]
 
@@ -255,23 +485,13 @@ def per_epoch_stats_to_file(ranks, wins, per_window_data_vol, opdata_per_rank, a
 			print('------------------------------------------------------------------------------------------\n' + 
 				f'SUMMARY for Window {win_id}:\n\n' + 
 				f'-- Total bytes transferred\t:   {per_window_data_vol[win_id]}\n' +
-				f'-- Total epochs\t\t\t:   {len(opdata_per_rank[0][win_id])-1}\n\n' +
-				'-- Op duration and DT bound averages per op code --')
-			print(f'{tabulate([[labels[i]]+window_summary_rows[i] for i in range(4)], headers=["instances", "average duration", "average DT bound"])}\n')
-			print(f'{tabulate([["MPI_Win_create duration"]+win_duration[0], ["Window lifetime"]+win_duration[1]], headers=["aggregate", "min", "max", "average"])}\n')
-			print('------------------------------------------------------------------------------------------\n')
+				f'-- Total epochs\t\t\t:   {win_total_epochs}\n\n' +
+				'-- Op duration and DT bound averages per op code --', file=f)
+			print(f'{tabulate([[labels[i]]+window_summary_rows[i] for i in range(4)], headers=["instances", "average duration", "average DT bound"])}\n', file=f)
+			print(f'{tabulate([["MPI_Win_create duration"]+win_duration[0], ["Window lifetime"]+win_duration[1]], headers=["aggregate", "min", "max", "average"])}\n', file=f)
+			print('------------------------------------------------------------------------------------------\n', file=f)
 
-			##
-			# per_opcode_dt_bounds_for_window = []
-			# per_opcode_durations_for_window = []
-			##
 
-			per_opcode_duration_aggregates_for_window = [0 for i in range(4)]
-			per_opcode_dt_bound_aggregates_for_window = [0 for i in range(3)	]
-			per_opcode_count_for_window = [0 for i in range(4)]
-
-
-	sys.stdout = original_stdout # Reset the standard output to its original value
 	
 	return True
 
@@ -281,35 +501,42 @@ last arrival to MPI_Win_fence instances in execution, into
 file fences.txt. Information is provided both as timestamp 
 and rank ID.  
 """
-def fence_stats_to_file(ranks, wins, per_window_data_vol, all_window_sizes, opdata_per_rank):
+def fence_stats_to_file(ranks, wins, per_window_data_vol, all_window_sizes, opdata):
 
-	timestamps_ranks = [0]*6
+	## fence_starts[rank, win, epoch] is the arrival time of rank to the 
+	## fence that closes epoch of window win
+	fence_rows = opdata.fence_rows(ranks, wins)
+	fence_starts = opdata.start[fence_rows]
 
-	original_stdout = sys.stdout # Save a reference to the original standard output
-	with open('fences.txt', 'w') as f:
-		sys.stdout = f # Change the standard output to the file we created.
+	## earliest and latest ranks and skew of the fences of all windows
+	all_stragglers = [[np.zeros(0, dtype=np.int64)] for i in range(3)]
+
+	with open('fences.txt', 'w', buffering=report_buffer_size) as f:
 		print('------------------------------------------------------------------------------------------\n' + 
 		'----------------------- Rank arrivals to fences per window  ------------------------------\n' + 
 		'------------------------------------------------------------------------------------------\n' +
 		f'-- Total ranks\t\t:   {ranks}\n' +
-		f'-- Total windows\t:   {wins}\n\n')
+		f'-- Total windows\t:   {wins}\n\n', file=f)
 
 		for win_id in range(wins):	
-			print(f'WINDOW ID:  {win_id}\n\n')
-			win_total_epochs = len(opdata_per_rank[0][win_id])-1
+			print(f'WINDOW ID:  {win_id}\n\n', file=f)
+			win_total_epochs = opdata.epochs_per_window[0][win_id]
 			#print(f'all_window_sizes[win_id]: {all_window_sizes[win_id]}, win_total_epochs: {win_total_epochs}, per_window_data_vol[win_id]: {per_window_data_vol[win_id]}')
-			fo.forma_print_window_info([all_window_sizes[win_id], win_total_epochs, per_window_data_vol[win_id]])
+			fo.forma_print_window_info([all_window_sizes[win_id], win_total_epochs, per_window_data_vol[win_id]], file=f)
+
+			## all fences of the window at once, cf. fs.forma_fence_stragglers()
+			stragglers = fs.forma_fence_stragglers(fence_starts[:, win_id, :win_total_epochs])
+			arrival_order, first, first_rank, last, last_rank, skew = [a.tolist() for a in stragglers]
 			for epoch in range(win_total_epochs):
-				fence_arrivals_for_epoch = []
-				for rank in range(ranks):
-					fence_arrivals_for_epoch.append(opdata_per_rank[rank][win_id][epoch][-1][1])
+				fo.forma_print_timestamps_ranks([epoch, first[epoch], first_rank[epoch], last[epoch], last_rank[epoch], skew[epoch]], file=f)
+				print(f'Arrival order: {arrival_order[epoch]}\n', file=f)
 
-				timestamps_ranks, arrival_order = fs.forma_calculate_stragglers_for_fence(fence_arrivals_for_epoch)
-				timestamps_ranks[0] = epoch # used for correctly printing the epoch nr in the first column in forma_print_timestamps_ranks()
+			fo.forma_print_fence_summary(f'SUMMARY for Window {win_id}', *fs.forma_fence_straggler_summary(ranks, stragglers[2], stragglers[4], stragglers[5]), file=f)
+			for i, j in enumerate([2, 4, 5]):
+				all_stragglers[i].append(stragglers[j])
+
+		fo.forma_print_fence_summary('SUMMARY for all windows', *fs.forma_fence_straggler_summary(ranks, *[np.concatenate(a) for a in all_stragglers]), file=f)
 
-				fo.forma_print_timestamps_ranks(timestamps_ranks)
-				print(f'Arrival order: {arrival_order}\n')
-	sys.stdout = original_stdout # Reset the standard output to its original value
 
 	return True
 
@@ -324,21 +551,20 @@ def per_op_durations_to_file(ranks, total_exec_times_per_rank, per_opcode_op_dur
 	opduration_stats_for_rank = []
 	dt_bounds_stats_for_rank = []
 
-	original_stdout = sys.stdout # Save a reference to the original standard output
-	with open('calls.txt', 'w') as f:
-		sys.stdout = f # Change the standard output to the file we created.
+	with open('calls.txt', 'w', buffering=report_buffer_size) as f:
 		print('------------------------------------------------------------------------------------------\n' + 
 		'------------------------ RMA operation durations per rank  -------------------------------\n' + 
 		'------------------------------------------------------------------------------------------\n' +
-		f'-- Total ranks\t\t:   {ranks}\n')
+		f'-- Total ranks\t\t:   {ranks}\n', file=f)
 
 		for i in range(ranks):
 			per_opcode_op_durations_for_rank = per_opcode_op_durations_per_rank[i]
 			per_opcode_dt_bounds_for_rank = per_opcode_dt_bounds_per_rank[i]
 			opduration_stats_for_rank, dt_bounds_stats_for_rank = fs.forma_calculate_opduration_dtbounds_stats_for_rank(per_opcode_op_durations_for_rank, per_opcode_dt_bounds_for_rank)
-			fo.forma_print_rank_stats(i, total_exec_times_per_rank[i], opduration_stats_for_rank)
-			fo.forma_print_rank_dt_bounds(i, dt_bounds_stats_for_rank)
-	sys.stdout = original_stdout # Reset the standard output to its original value
+			tail_stats_for_rank = fs.forma_calculate_tail_stats_for_rank(per_opcode_op_durations_for_rank, per_opcode_dt_bounds_for_rank)
+			fo.forma_print_rank_stats(i, total_exec_times_per_rank[i], opduration_stats_for_rank, file=f)
+			fo.forma_print_rank_dt_bounds(i, dt_bounds_stats_for_rank, file=f)
+			fo.forma_print_rank_tail_stats(i, tail_stats_for_rank, file=f)
 	return True
 
 
@@ -348,7 +574,7 @@ def main():
 
 	action = 'r'
 	cmdlnaction = False
-	version = 'i' ## can be 'i' for incremental or 'm' for in-mem
+	version = 'm' ## can be 'i' for incremental, 'm' for in-mem or 'o' for out-of-core
 
 	# default log level:
 	level=logging.INFO
@@ -365,22 +591,100 @@ def main():
 
 	## set up how foRMA has to be invoked ...
 	forma_arg_parse = argparse.ArgumentParser(description="foRMA -- a methodology and a tool for profiling MPI RMA operation timing, designed to process traces produced by SST Dumpi.")
-	forma_arg_parse.add_argument("directory", help="Specifies the path to the directory in which the tracefiles to be parsed are located.", type=str)
-	forma_arg_parse.add_argument("timestamp", help="Specifies the timestamp that makes up the filenames of the tracefiles to be parsed.", type=str)
+	forma_arg_parse.add_argument("directory", help="Specifies the path to the directory in which the tracefiles to be parsed are located (left out with --merge).", type=str, nargs='?')
+	forma_arg_parse.add_argument("timestamp", help="Specifies the timestamp that makes up the filenames of the tracefiles to be parsed (left out with --merge).", type=str, nargs='?')
 	forma_arg_parse.add_argument("-d", "--debug", help="Turns on debug messages and is meant to be used for developing the tool and not when using it to profile traces.",
                     action="store_true")
-	forma_arg_parse.add_argument("-s", "--summary", help="When specified, foRMA only produces a summary of statistics and exits without offering the interactive prompt.", action="store_true")
+	forma_arg_parse.add_argument("-s", "--summary", help="When specified, foRMA only produces a summary of statistics, and the output files of -a, -c, -e and -f if given, and exits without offering the interactive prompt.", action="store_true")
+	forma_arg_parse.add_argument("-q", "--quick", help="Only read the footers of the trace files, without parsing them, print the call counts of the summary along with estimates of the memory use and time of parsing, and exit. Takes seconds even on large traces.", action="store_true")
 	forma_arg_parse.add_argument("-a", "--all", help="Produce full analysis broken down per ranks and per windows, output to files epochs.txt, fences.txt, and calls.txt. Equivalent to -c -e -f.", action="store_true")
 	forma_arg_parse.add_argument("-c", "--calls", help="Output time spent in calls (per rank), as well as data transfer bounds, in file calls.txt.", action="store_true")
 	forma_arg_parse.add_argument("-e", "--epochs", help="Produce statistics per epoch (fence-based synchronization), output to file epochs.txt", action="store_true")
 	forma_arg_parse.add_argument("-f", "--fences", help="Produce fence statistics, output to file fences.txt.", action="store_true")
+	forma_version_args = forma_arg_parse.add_mutually_exclusive_group()
+	forma_version_args.add_argument("-i", "--incremental", help="Use the incremental version of foRMA, which calculates statistics while parsing instead of keeping all RMA operation data in memory. Medians and tail latencies are approximated (cf. --quantile-error).", action="store_true")
+	forma_version_args.add_argument("-o", "--out-of-core", help="Use the out-of-core version of foRMA, which keeps RMA operation data in memory-mapped files instead of memory, for traces that do not fit in memory. Medians and tail latencies are approximated in this version (cf. --quantile-error).", action="store_true")
+	forma_arg_parse.add_argument("--ranks", help="Only analyse the given ranks, as a comma-separated list of ranks and ranges of ranks (e.g. 0-15,512). Only the trace files of these ranks are parsed, along with the fences of their target ranks. In the results, selected ranks are numbered from 0.", type=fsel.forma_select_ids)
+	forma_arg_parse.add_argument("--windows", help="Only analyse the given memory windows (ids in order of creation, e.g. 3 or 0,2); ops on other windows are dropped while parsing. In the results, selected windows are numbered from 0.", type=fsel.forma_select_ids)
+	forma_arg_parse.add_argument("--epoch-range", help="Only analyse the given epochs of each window, as FIRST:LAST (LAST not included, e.g. 100:200) or as a single epoch; ops of other epochs are dropped while parsing. In the results, selected epochs are numbered from 0.", type=fsel.forma_select_epoch_range)
+	forma_arg_parse.add_argument("--partial", help="Only aggregate the trace files of the ranks given with --ranks (default: all) into the given file of partial aggregates, to be merged with --merge, and exit. Partial aggregates are the running statistics of the incremental version, which --partial implies.", type=str)
+	forma_arg_parse.add_argument("--merge", help="Analyse an execution out of the given files of partial aggregates (cf. --partial), which have to cover all of its ranks, instead of parsing its trace files. Results are the same as those of the incremental version, which --merge implies.", nargs='+', type=str)
+	forma_arg_parse.add_argument("--quantile-error", help="Rank error, as a fraction of the number of values, of the approximate medians and tail latencies (p90, p99, p99.9) of the incremental and out-of-core versions, which sketch values instead of keeping them. The in-memory version always gives exact values (default: 0.01).", type=float, default=0.01)
+	forma_arg_parse.add_argument("--spill-dir", help="Directory (preferably on a local disk) in which the out-of-core version keeps its memory-mapped files (default: the system's temporary directory). The files are removed when foRMA exits.", type=str)
+	forma_arg_parse.add_argument("--cache-dir", help="Directory in which parsed trace data are cached, so that later analyses of the same trace files do not parse them again (default: .forma-cache inside the trace directory).", type=str)
+	forma_arg_parse.add_argument("--no-cache", help="Neither use nor create a cache of parsed trace data.", action="store_true")
+	forma_arg_parse.add_argument("--reader", help="Trace file reader: native decodes the trace files directly and falls back to pydumpi for traces it does not support, pydumpi always goes through the pydumpi callbacks (default: native).", choices=['native', 'pydumpi'], default='native')
+	forma_arg_parse.add_argument("--no-mem-check", help="Parse the trace files even if the memory use predicted out of their footers exceeds the available memory.", action="store_true")
+	forma_arg_parse.add_argument("--export", help="Also export the parsed RMA operations and the statistics per rank, per window and per epoch as tables, one file per table, in the given columnar format (parquet and arrow require pyarrow). In the incremental version, only fences are exported as operations.", choices=fe.export_formats)
+	forma_arg_parse.add_argument("--export-dir", help="Directory to which tables are exported with --export (default: forma-export).", type=str, default='forma-export')
+	forma_arg_parse.add_argument("--profile", help="Profile foRMA itself: report the wall clock time, CPU time and peak memory use of each phase of the analysis, and the size of its main data structures, when foRMA exits, both on screen and in the given JSON file (default: forma-profile.json).", nargs='?', const='forma-profile.json', type=str)
+	forma_arg_parse.add_argument("--progress", help="Report the progress of parsing the trace files (records processed, records and Bytes per second, estimated time left) on the standard error, every --progress-interval seconds.", action="store_true")
+	forma_arg_parse.add_argument("--progress-json", help="Also write progress reports, as JSON lines, to the given file (- for the standard error).", type=str)
+	forma_arg_parse.add_argument("--progress-interval", help="Seconds between two progress reports (default: 2).", type=float, default=2.0)
+	forma_arg_parse.add_argument("-j", "--jobs", help="Number of worker processes used to parse the trace files of the ranks in parallel (default: 1, i.e. serial parsing; 0 uses all available cores).", type=int, default=1)
 
 
 	## ... and get the required parameters from the command-line arguments
 	args = forma_arg_parse.parse_args()
+	if args.merge is None and args.timestamp is None:
+		forma_arg_parse.error('the following arguments are required: directory, timestamp')
+	if args.merge is not None and args.directory is not None:
+		forma_arg_parse.error('no directory and timestamp are taken with --merge')
 	dirname = args.directory
 	timestamp = args.timestamp
 	cmdlnaction = args.summary
+	if args.debug:
+		level = logging.DEBUG
+	jobs = args.jobs
+	if not 0 < args.quantile_error < 1:
+		print('The quantile error should be in (0, 1).')
+		sys.exit(2)
+	fs.forma_set_quantile_error(args.quantile_error)
+	if jobs < 1:
+		jobs = os.cpu_count()
+	if args.progress_interval <= 0:
+		print('The progress interval should be positive.')
+		sys.exit(2)
+	progress_json = None
+	if args.progress_json == '-':
+		progress_json = sys.stderr
+	elif args.progress_json is not None:
+		try:
+			progress_json = open(args.progress_json, 'w')
+		except OSError as e:
+			print(f'Could not open progress file: {e}')
+			sys.exit(2)
+	if args.export is not None and not fe.forma_export_available(args.export):
+		print(f'Exporting to {args.export} requires pyarrow, which is not installed. Use --export csv or --export npz instead.')
+		sys.exit(2)
+	if args.incremental:
+		version = 'i'
+	elif args.out_of_core:
+		version = 'o'
+	if args.partial is not None or args.merge is not None:
+		if args.out_of_core:
+			print('Partial aggregates are those of the incremental version, and cannot be used with the out-of-core version.')
+			sys.exit(2)
+		if args.partial is not None and args.merge is not None:
+			print('Partial aggregates are either created (--partial) or merged (--merge), not both at once.')
+			sys.exit(2)
+		if args.merge is not None and args.quick:
+			print('There are no trace files to summarize with --merge.')
+			sys.exit(2)
+		version = 'i'
+	selection = fsel.FormaSelection(args.ranks, args.windows, args.epoch_range)
+	if args.partial is not None and selection.filters_ops():
+		print('Partial aggregates are made of whole ranks: only --ranks can be used with --partial.')
+		sys.exit(2)
+	if selection and version == 'i' and args.partial is None:
+		print('Selecting ranks, windows or epochs is not supported by the incremental version.')
+		sys.exit(2)
+	if args.no_cache or args.merge is not None:
+		cache_dir = None
+	elif args.cache_dir is not None:
+		cache_dir = args.cache_dir
+	else:
+		cache_dir = os.path.join(dirname, fc.cache_dirname)
 
 
 	#print('\nfoRMA - RMA timing profiling. Preparing analysis of trace.')
@@ -392,39 +696,157 @@ def main():
 		print('\n\n.: foRMA: RMA Profiling for MPI :.\n\n')
 
 
-	tracefiles = check_filepaths(dirname, timestamp)
+	## the profile is reported when foRMA exits, whichever way that happens
+	profile = None
+	if args.profile is not None:
+		profile = fpr.FormaProfile()
+		atexit.register(report_profile, profile, args.profile)
+
+	tracefiles = []
+	if args.merge is None:
+		with profile_phase(profile, 'file discovery'):
+			tracefiles = check_filepaths(dirname, timestamp)
+
+	if args.quick:
+		with profile_phase(profile, 'footer scan'):
+			quick = quick_summary(tracefiles, version, jobs, args.reader)
+		sys.exit(0 if quick else 1)
+
+	## only the trace files of the selected ranks are parsed (cf. forma_select.py)
+	selected_tracefiles = fsel.forma_select_tracefiles(tracefiles, selection)
+	if selected_tracefiles is None:
+		print(fsel.forma_select_error(selection, len(tracefiles), 0, []))
+		sys.exit(2)
 
 	
 	rma_callcount_per_rank = []
-	#check_mem_capacity(tracefiles, rma_tracked_calls, rma_callcount_per_rank)
-	"""
-	if version=='m':
-		if check_mem_capacity(tracefiles, rma_tracked_calls, rma_callcount_per_rank):
-			print("In-memory version for this trace will exhaust your system's resources. Opt for incremental version instead.")
-			sys.exit(2)
-	"""
 	
 	## adjust log level to command line option
 	#logging.basicConfig(level=logging.INFO)
 	logging.basicConfig(level=level)
 
 
-	ranks, wins, callcount_per_opcode, opdata_per_rank, total_exec_times_per_rank, all_window_sizes_per_rank, all_window_durations_per_rank, epochs_per_window_per_rank = fp.forma_parse_traces(tracefiles)
-	
-	sanity_check = check_consistency(ranks, wins, opdata_per_rank)
-	if sanity_check != 0:
-		print(f'Warning: the present version of foRMA is intended for applications with fence-based synchronization. Detected inconsistency in the provided traces.\nTotal ranks: {ranks}')
-		if sanity_check == 1:
-			print("Inconsistency between provided trace files and number of ranks in application.\n")
-		elif sanity_check == 2:
-			print("Inconsistency in nr of windows per communicator per rank.\n")
-		elif sanity_check == 3:
-			print("Inconsisten nr of epochs per window across ranks.\n")
-		sys.exit(2)
+	## the in-memory version can skip parsing altogether if the traces 
+	## have already been parsed (cf. forma_cache.py)
+	cached_traces = None
+	if version == 'm' and cache_dir is not None:
+		with profile_phase(profile, 'cache load'):
+			cached_traces = fc.forma_load_cache(cache_dir, timestamp, tracefiles)
 
-	#print(f'WINDOW sizes per rank: {all_window_sizes_per_rank}')
+	if cached_traces is not None:
+		print(f'Parsed trace data loaded from cache directory {cache_dir}.\n')
+		ranks, wins, callcount_per_opcode, opdata, total_exec_times_per_rank, all_window_sizes_per_rank, all_window_durations_per_rank, epochs_per_window_per_rank = cached_traces
+		moments_per_rank = []
+	else:
+		## partial aggregates are the running statistics of the incremental 
+		## version of their ranks, i.e. what parsing the trace files gives
+		if args.merge is not None:
+			with profile_phase(profile, 'merge'):
+				try:
+					ranks, wins, callcount_per_opcode, opdata, total_exec_times_per_rank, all_window_sizes_per_rank, all_window_durations_per_rank, epochs_per_window_per_rank, moments_per_rank = fpt.forma_partial_merge(args.merge)
+				except FormaError as e:
+					print(e)
+					sys.exit(2)
+			print(f'Partial aggregates of {ranks} ranks merged from {len(args.merge)} file(s).\n')
+		else:
+			## fail fast, before any parsing, if the traces will not fit in memory
+			mem_exceeded = False
+			if not args.no_mem_check:
+				with profile_phase(profile, 'footer scan'):
+					mem_exceeded = check_mem_capacity(selected_tracefiles, rma_callcount_per_rank, version, jobs, args.reader == 'native')
+			if mem_exceeded:
+				if version == 'm':
+					print("In-memory version for this trace will exhaust your system's resources. Opt for incremental (-i) or out-of-core (-o) version instead.")
+				else:
+					print("Parsing the trace files of this trace will exhaust your system's resources. Try fewer parallel jobs (-j), or opt for incremental version (-i) instead.")
+				print('(Use --no-mem-check to parse the trace files anyway.)')
+				sys.exit(2)
+
+			spill_dir = None
+			if version == 'o':
+				try:
+					spill_dir = tempfile.mkdtemp(prefix='forma-', dir=args.spill_dir)
+				except OSError as e:
+					print(f'Could not create out-of-core directory: {e}')
+					sys.exit(1)
+				atexit.register(shutil.rmtree, spill_dir, True)
+
+			progress = None
+			if args.progress or args.progress_json is not None:
+				progress = fpg.FormaProgress(selected_tracefiles, args.progress_interval, args.progress, progress_json)
+
+			## target rank of the last MPI_Put/MPI_Acc of each epoch of the selected ranks (cf. forma_select_dt_bounds())
+			epoch_last_targets = []
+			try:
+				with profile_phase(profile, 'parse'):
+					ranks, wins, callcount_per_opcode, opdata, total_exec_times_per_rank, all_window_sizes_per_rank, all_window_durations_per_rank, epochs_per_window_per_rank, moments_per_rank = fp.forma_parse_traces(selected_tracefiles, jobs, version == 'i', spill_dir, args.reader == 'native', profile, progress, 
+																															selection if selection else None, epoch_last_targets=epoch_last_targets)
+			except FormaError as e:
+				print(e)
+				sys.exit(2)
+
+		sanity_check = check_consistency(ranks, wins, opdata)
+		if sanity_check != 0:
+			print(f'Warning: the present version of foRMA is intended for applications with fence-based synchronization. Detected inconsistency in the provided traces.\nTotal ranks: {ranks}')
+			print(f'{fp.consistency_errors[sanity_check]}\n')
+			sys.exit(2)
 
-	fp.forma_calculate_dt_bounds(ranks, wins, opdata_per_rank)
+		if args.partial is not None:
+			with profile_phase(profile, 'partial save'):
+				try:
+					fpt.forma_partial_save(args.partial, timestamp, selection.ranks if selection.ranks is not None else list(range(len(tracefiles))), 
+											len(tracefiles), wins, callcount_per_opcode, opdata, total_exec_times_per_rank, all_window_sizes_per_rank, 
+											all_window_durations_per_rank, epochs_per_window_per_rank, moments_per_rank)
+				except FormaError as e:
+					print(e)
+					sys.exit(1)
+			print(f'Partial aggregates of ranks {selection.describe()[0]} can be found in file {args.partial}\n')
+			sys.exit(0)
+
+		#print(f'WINDOW sizes per rank: {all_window_sizes_per_rank}')
+
+		if version != 'i' and not selection:
+			with profile_phase(profile, 'dt bounds'):
+				fp.forma_calculate_dt_bounds(ranks, wins, opdata)
+		if version == 'm' and cache_dir is not None and not selection:
+			with profile_phase(profile, 'cache save'):
+				fc.forma_save_cache(cache_dir, timestamp, tracefiles, wins, callcount_per_opcode, opdata, 
+									total_exec_times_per_rank, all_window_sizes_per_rank, all_window_durations_per_rank, 
+									epochs_per_window_per_rank)
+
+	if selection:
+		selection_error = fsel.forma_select_error(selection, len(tracefiles), wins, epochs_per_window_per_rank[0])
+		if selection_error is not None:
+			print(selection_error)
+			sys.exit(2)
+		if cached_traces is None:
+			try:
+				with profile_phase(profile, 'dt bounds'):
+					fsel.forma_select_dt_bounds(tracefiles, selection, wins, opdata, epoch_last_targets, jobs, args.reader == 'native')
+			except FormaError as e:
+				print(e)
+				sys.exit(2)
+		with profile_phase(profile, 'selection'):
+			ranks, wins, callcount_per_opcode, opdata, total_exec_times_per_rank, all_window_sizes_per_rank, all_window_durations_per_rank, epochs_per_window_per_rank = fsel.forma_select_traces(
+				selection, ranks, wins, callcount_per_opcode, opdata, total_exec_times_per_rank, all_window_sizes_per_rank, 
+				all_window_durations_per_rank, epochs_per_window_per_rank, selection.ranks if cached_traces is None else None)
+
+	with profile_phase(profile, 'breakdown'):
+		per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank, per_window_data_vol, per_epoch_data, per_opcode_summary = fs.forma_break_down(version, ranks, wins, opdata, moments_per_rank)
+
+	if profile is not None:
+		profile.info = {'directory': dirname, 'timestamp': timestamp, 'version': version, 'jobs': jobs, 'reader': args.reader, 
+						'ranks': ranks, 'windows': wins, 'ops': sum(callcount_per_opcode[:4]), 
+						'trace_bytes': sum([os.path.getsize(tf) for tf in tracefiles])}
+		profile.add_size('opdata', opdata)
+		profile.add_size('op duration statistics per rank', per_opcode_op_durations_per_rank)
+		profile.add_size('dt bound statistics per rank', per_opcode_dt_bounds_per_rank)
+		if per_epoch_data is not None:
+			profile.add_size('per epoch statistics', per_epoch_data)
+		if version == 'i':
+			profile.add_size('running statistics per rank', moments_per_rank)
+		if per_opcode_summary is not None:
+			profile.add_size('statistics per opcode', per_opcode_summary)
 
 	"""
 	for i in range(ranks):
@@ -437,16 +859,16 @@ def main():
 	#print(f'Total durations stats: {fs.forma_calculate_stats_manual_x6(ranks, wins, opdata_per_rank, 1)}')
 
 
-	per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank, per_window_data_vol = fs.forma_break_down_per_rank_per_window(ranks, wins, opdata_per_rank)
-
 	
-	opdurations, windata, dtbounds = fs.forma_calc_stats_summary(ranks, wins, total_exec_times_per_rank, 
-																all_window_sizes_per_rank[0], 
-																all_window_durations_per_rank,
-																epochs_per_window_per_rank[0], 
-																per_opcode_op_durations_per_rank, 
-																per_opcode_dt_bounds_per_rank, 
-																per_window_data_vol)
+	with profile_phase(profile, 'summary'):
+		opdurations, windata, dtbounds, tails = fs.forma_calc_stats_summary(ranks, wins, total_exec_times_per_rank, 
+																	all_window_sizes_per_rank[0], 
+																	all_window_durations_per_rank,
+																	epochs_per_window_per_rank[0], 
+																	per_opcode_op_durations_per_rank, 
+																	per_opcode_dt_bounds_per_rank, 
+																	per_window_data_vol, 
+																	per_opcode_summary)
 	
 
 	# opdurations, windata, dtbounds = fs.forma_calc_stats_summary_coarse(ranks, wins, total_exec_times_per_rank, all_window_sizes_per_rank[0], epochs_per_window_per_rank[0], opdata_per_rank)
@@ -455,7 +877,50 @@ def main():
 	print("\n\n\n")
 
 
-	fo.forma_print_stats_summary(ranks, wins, opdurations, windata, dtbounds, callcount_per_opcode)
+	if selection:
+		fo.forma_print_selection(*selection.describe())
+	fo.forma_print_stats_summary(ranks, wins, opdurations, windata, dtbounds, callcount_per_opcode, tails)
+
+	## reports requested on the command line (-a, -c, -e, -f)
+	requested = [f for f, flag in [('epochs.txt', args.epochs), ('fences.txt', args.fences), ('calls.txt', args.calls)] if flag or args.all]
+
+	## per epoch statistics are shared by the epochs report and export, so 
+	## they are calculated only once (the other versions already have them)
+	if per_epoch_data is None and (args.export is not None or not cmdlnaction or 'epochs.txt' in requested):
+		with profile_phase(profile, 'per epoch breakdown'):
+			per_epoch_data = fs.forma_break_down_per_epoch(wins, opdata)
+
+	reports = {'epochs.txt': (per_epoch_stats_to_file, (ranks, wins, per_window_data_vol, opdata, all_window_durations_per_rank, per_epoch_data)), 
+				'fences.txt': (fence_stats_to_file, (ranks, wins, per_window_data_vol, all_window_sizes_per_rank[0], opdata)), 
+				'calls.txt': (per_op_durations_to_file, (ranks, total_exec_times_per_rank, per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank))}
+
+	## in the interactive prompt, all reports start being produced in the 
+	## background right away, and are then handed out on request
+	session = None
+	if not cmdlnaction:
+		session = FormaSession(reports, profile)
+		session.start()
+
+	if args.export is not None:
+		print(f'Exporting tables to directory {args.export_dir}...\t\t', end="")
+		with profile_phase(profile, 'export'):
+			tables = fe.forma_export_tables(ranks, wins, opdata, total_exec_times_per_rank, all_window_sizes_per_rank, 
+											all_window_durations_per_rank, per_opcode_op_durations_per_rank, 
+											per_opcode_dt_bounds_per_rank, per_window_data_vol, per_epoch_data)
+			try:
+				fe.forma_export(args.export, args.export_dir, tables)
+			except OSError as e:
+				print(f'\nCould not export tables: {e}')
+				sys.exit(1)
+		print('Done.\n')
+
+	if requested:
+		print('Preparing results...')
+		if session is not None:
+			session.produce(requested)
+		else:
+			run_reports([reports[f] for f in requested], profile)
+		print(f'Results can be found in file(s) {", ".join(requested)}\n')
 
 	#print(all_window_durations_per_rank)
 	
@@ -477,21 +942,19 @@ def main():
 			sys.exit()
 		elif action == 'e': #
 			print('Preparing results...')
-			per_epoch_stats_to_file(ranks, wins, per_window_data_vol, opdata_per_rank, all_window_durations_per_rank)
+			session.produce(['epochs.txt'])
 			print('Statistics per epoch (fence-based synchronization) can be found in file epochs.txt\n')
 		elif action == 'f':
 			print('Preparing results...')
-			fence_stats_to_file(ranks, wins, per_window_data_vol, all_window_sizes_per_rank[0], opdata_per_rank)
+			session.produce(['fences.txt'])
 			print('Fence statistics can be found in file fences.txt.\n')
 		elif action == 'c':
 			print('Preparing results...')
-			per_op_durations_to_file(ranks, total_exec_times_per_rank, per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank)
+			session.produce(['calls.txt'])
 			print('Time spent in calls (per rank), as well as data transfer bounds, can be found in file calls.txt\n')
 		elif action == 'a':
 			print('Preparing results...')
-			per_epoch_stats_to_file(ranks, wins, per_window_data_vol, opdata_per_rank, all_window_durations_per_rank)
-			fence_stats_to_file(ranks, wins, per_window_data_vol, all_window_sizes_per_rank[0], opdata_per_rank)
-			per_op_durations_to_file(ranks, total_exec_times_per_rank, per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank)
+			session.produce(['epochs.txt', 'fences.txt', 'calls.txt'])
 			print('Full analysis broken down per ranks and per windows can be found in files epochs.txt, fences.txt, and calls.txt\n')
 		elif action == 'r':
 			pass
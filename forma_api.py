@@ -0,0 +1,391 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import argparse
+import contextlib
+import functools
+import shutil
+import tempfile
+import weakref
+import os
+import fnmatch
+
+import numpy as np
+
+from pydumpi import util
+
+import forma_cache as fc
+import forma_parse as fp
+import forma_stats as fs
+import forma_export as fe
+import forma_select as fsel
+import forma_partial as fpt
+
+from forma_parse import FormaError
+
+
+## foRMA library API, for analysing traces from Python instead of the command
+## line (also available as forma.load(), forma.load_partials() and forma.analyze()):
+##
+##   traces = forma.load('traces', '2024.01.31.12.00.00')
+##   results = forma.analyze(traces)
+##   results.summary_row('get')['median']
+##   results.tables['rank_stats']
+##
+## load() parses the trace files of an execution (or loads them from the cache,
+## cf. forma_cache.py) and calculates data transfer bounds, once. The returned
+## FormaTraces can then be analysed any number of times, e.g. for different
+## selections of ranks, windows and epochs (cf. forma_select.py), without
+## parsing the trace files again; each analysis is kept in the FormaTraces, so
+## asking for the same one twice costs nothing. analyze() also takes the trace
+## directory and timestamp, in which case it loads the traces first, and
+## load_partials() merges partial aggregates (cf. forma_partial.py) instead.
+##
+## Results are FormaResults, whose tables are dictionaries of NumPy columns,
+## as exported by --export (cf. forma_export.py). Errors raise FormaError
+## instead of exiting, and nothing is printed unless verbose is set.
+
+## rows of the summary table, in the order of the summary of foRMA
+summary_rows = ['exec_time', 'rma_time', 'get', 'put', 'acc', 'fence',
+				'window_size', 'window_data_volume', 'window_epochs', 'window_lifetime',
+				'get_dtbound', 'put_dtbound', 'acc_dtbound']
+
+## MPI function of each entry of callcount_per_opcode
+callcount_names = ['MPI_Get', 'MPI_Put', 'MPI_Accumulate', 'MPI_Win_fence',
+					'MPI_Win_create', 'MPI_Win_free', 'MPI_Init', 'MPI_Finalize']
+
+
+class FormaTraces:
+
+	""" the parsed trace files of an execution, with data transfer bounds,
+		as returned by forma_load(). Its attributes are the ones returned by
+		forma_parse_traces(), and are not to be modified.
+	"""
+
+	def __init__(self, dirname, timestamp, tracefiles, version, traces, moments_per_rank=None, spill_dir=None):
+
+		self.dirname = dirname
+		self.timestamp = timestamp
+		self.tracefiles = tracefiles
+		self.version = version
+
+		(self.ranks, self.wins, self.callcount_per_opcode, self.opdata, self.total_exec_times_per_rank,
+		self.all_window_sizes_per_rank, self.all_window_durations_per_rank, self.epochs_per_window_per_rank) = traces
+		self.moments_per_rank = moments_per_rank
+
+		## FormaResults of forma_analyze(), indexed by selection (cf. FormaSelection.describe())
+		self.results = dict()
+
+		## the memory-mapped files of the out-of-core version go with the traces
+		if spill_dir is not None:
+			weakref.finalize(self, shutil.rmtree, spill_dir, True)
+
+
+	def traces(self):
+
+		""" returns the traces as forma_parse_traces() does (without moments) """
+
+		return (self.ranks, self.wins, self.callcount_per_opcode, self.opdata, self.total_exec_times_per_rank,
+				self.all_window_sizes_per_rank, self.all_window_durations_per_rank, self.epochs_per_window_per_rank)
+
+
+class FormaResults:
+
+	""" the results of forma_analyze(), as NumPy arrays:
+		summary    : the statistics of the summary of foRMA, a table with one
+		             row per name of summary_rows and the columns of
+		             fe.stats_columns (NaN where not available)
+		tables     : the tables of forma_export_tables(), indexed by name, i.e.
+		             ops, ranks, rank_stats, rank_windows, windows, epochs
+		             (including fence arrivals) and epoch_stats
+		callcounts : the number of calls of each MPI function of callcount_names
+	"""
+
+	def __init__(self, ranks, wins, callcount_per_opcode, summary, tables, selection=None):
+
+		self.ranks = ranks
+		self.wins = wins
+		self.callcounts = {name: count for name, count in zip(callcount_names, callcount_per_opcode)}
+		self.summary = summary
+		self.tables = tables
+		self.selection = selection
+
+
+	def __getitem__(self, name):
+
+		return self.tables[name]
+
+
+	def summary_row(self, name):
+
+		""" returns the row name of the summary (cf. summary_rows), indexed by column """
+
+		if name not in summary_rows:
+			raise KeyError(name)
+		row = summary_rows.index(name)
+
+		return {column: values[row] for column, values in self.summary.items() if column != 'name'}
+
+
+@contextlib.contextmanager
+def forma_api_output(verbose):
+
+	""" silences what foRMA prints, unless verbose is set """
+
+	if verbose:
+		yield
+		return
+
+	with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+		yield
+
+
+def forma_api_tracefiles(dirname, timestamp):
+
+	""" returns the trace files of timestamp in dirname, in rank order, and
+		their total size (KBytes). Raises FormaError if there are none, or if
+		there are not as many as the ranks of the metafile.
+	"""
+
+	try:
+		ordered_files_all = sorted(os.listdir(format(str(dirname))))
+	except OSError as e:
+		raise FormaError(f'Could not read trace directory: {e}')
+
+	ordered_files = []
+	total_file_size = 0
+
+	for filename in ordered_files_all:
+		if fnmatch.fnmatch(filename, 'dumpi-'+format(str(timestamp))+'*.bin'):
+			filepath = format(str(dirname))+'/'+format(str(filename))
+			total_file_size = total_file_size + os.path.getsize(filepath)
+			ordered_files.append(filepath)
+
+	total_file_size = round(total_file_size/1024)
+	if total_file_size == 0:
+		raise FormaError('Trace files seem empty. Make sure that you are using well-formatted SST Dumpi outputs.')
+
+	## the metafile gives the number of ranks of the execution, each of which 
+	## has to have a trace file
+	try:
+		metafile = util.read_meta_file(str(dirname)+'/dumpi-'+format(str(timestamp))+'.meta')
+	except FileNotFoundError:
+		raise FormaError('Trace files not found. Check timestamp formatting.')
+	numprocs = metafile.get('numprocs', '')
+	if numprocs.isdigit() and int(numprocs) != len(ordered_files):
+		raise FormaError(f'The metafile lists {numprocs} ranks, but {len(ordered_files)} trace files were found. Make sure that no trace file is missing.')
+
+	return ordered_files, total_file_size
+
+
+def forma_api_selection(ranks=None, windows=None, epochs=None):
+
+	""" returns the FormaSelection of ranks and windows, given as lists of ids
+		or as text (as --ranks and --windows), and of epochs, given as
+		[ first, last ] (last not included, None for no limit) or as text
+		(as --epoch-range); None selects all
+	"""
+
+	try:
+		if isinstance(ranks, str):
+			ranks = fsel.forma_select_ids(ranks)
+		if isinstance(windows, str):
+			windows = fsel.forma_select_ids(windows)
+		if isinstance(epochs, str):
+			epochs = fsel.forma_select_epoch_range(epochs)
+	except argparse.ArgumentTypeError as e:
+		raise FormaError(str(e))
+
+	ranks = sorted(set(ranks)) if ranks is not None else None
+	windows = sorted(set(windows)) if windows is not None else None
+	for ids in [ranks, windows]:
+		if ids is not None and (len(ids) == 0 or ids[0] < 0):
+			raise FormaError(f'Not a list of ids to select: {ids}')
+	if epochs is not None:
+		epochs = list(epochs)
+		if len(epochs) != 2 or epochs[0] < 0 or (epochs[1] is not None and epochs[1] <= epochs[0]):
+			raise FormaError(f'Not a range of epochs to select: {epochs}')
+
+	return fsel.FormaSelection(ranks, windows, epochs)
+
+
+def forma_api_summary(ranks, total_exec_times_per_rank, all_window_sizes, all_window_durations_per_rank,
+					epochs_per_window, per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank,
+					per_window_data_vol, per_opcode_summary=None):
+
+	""" returns the summary table, out of the same values as forma_calc_stats_summary() """
+
+	if per_opcode_summary is not None:
+		per_opcode_op_durations, per_opcode_dt_bounds, all_op_durations = per_opcode_summary
+	else:
+		per_opcode_op_durations = [fs.forma_concatenate([per_opcode_op_durations_per_rank[j][i] for j in range(ranks)]) for i in range(4)]
+		per_opcode_dt_bounds = [fs.forma_concatenate([per_opcode_dt_bounds_per_rank[j][i] for j in range(ranks)]) for i in range(3)]
+		all_op_durations = fs.forma_concatenate(per_opcode_op_durations)
+
+	all_window_lifetimes = [j[1] for sub in all_window_durations_per_rank for j in sub]
+
+	values = ([total_exec_times_per_rank, all_op_durations] + list(per_opcode_op_durations) +
+			[all_window_sizes, per_window_data_vol, epochs_per_window, all_window_lifetimes] + list(per_opcode_dt_bounds))
+
+	return fe.forma_stats_table([('name', np.array(summary_rows))], [fe.forma_stats_row(v) for v in values], '')
+
+
+def forma_load(dirname, timestamp, version='m', jobs=1, reader='native', cache=True, cache_dir=None,
+				spill_dir=None, quantile_error=None, verbose=False):
+
+	""" parses the trace files of timestamp in dirname and returns them as a
+		FormaTraces, for forma_analyze(). The arguments are those of the
+		command line: version is m (in-memory), i (incremental) or o (out-of-core);
+		the in-memory version uses the cache in cache_dir (default: .forma-cache
+		inside dirname) unless cache is unset. The memory use of parsing is
+		not checked beforehand. Raises FormaError if the trace files cannot
+		be analysed.
+	"""
+
+	if version not in ['m', 'i', 'o']:
+		raise FormaError(f'Unknown version of foRMA: {version} (m, i or o).')
+	if reader not in ['native', 'pydumpi']:
+		raise FormaError(f'Unknown trace file reader: {reader} (native or pydumpi).')
+	if quantile_error is not None:
+		if not 0 < quantile_error < 1:
+			raise FormaError('The quantile error should be in (0, 1).')
+		fs.forma_set_quantile_error(quantile_error)
+	if jobs < 1:
+		jobs = os.cpu_count()
+
+	tracefiles = forma_api_tracefiles(dirname, timestamp)[0]
+	if not cache:
+		cache_dir = None
+	elif cache_dir is None:
+		cache_dir = os.path.join(dirname, fc.cache_dirname)
+
+	with forma_api_output(verbose):
+		if version == 'm' and cache_dir is not None:
+			cached_traces = fc.forma_load_cache(cache_dir, timestamp, tracefiles)
+			if cached_traces is not None:
+				return FormaTraces(dirname, timestamp, tracefiles, version, cached_traces)
+
+		return forma_api_traces(dirname, timestamp, tracefiles, version, 
+								functools.partial(fp.forma_parse_traces, tracefiles, jobs, version == 'i', native=reader == 'native'), 
+								spill_dir, cache_dir)
+
+
+def forma_api_traces(dirname, timestamp, tracefiles, version, parse, spill_dir=None, cache_dir=None):
+
+	""" returns the FormaTraces of tracefiles, as parsed by parse(spill_dir=...) 
+		(cf. forma_parse_traces()), once checked for consistency and with data 
+		transfer bounds, and caches them in cache_dir (in-memory version, if 
+		given). The out-of-core version keeps its memory-mapped files in a new 
+		directory in spill_dir. Raises FormaError if the traces cannot be analysed. 
+	"""
+
+	if version == 'o':
+		try:
+			spill_dir = tempfile.mkdtemp(prefix='forma-', dir=spill_dir)
+		except OSError as e:
+			raise FormaError(f'Could not create out-of-core directory: {e}')
+	else:
+		spill_dir = None
+
+	try:
+		parsed = parse(spill_dir=spill_dir)
+	except FormaError:
+		if spill_dir is not None:
+			shutil.rmtree(spill_dir, True)
+		raise
+	traces = FormaTraces(dirname, timestamp, tracefiles, version, parsed[:8], parsed[8], spill_dir)
+
+	sanity_check = fp.forma_check_consistency(traces.ranks, traces.wins, traces.opdata)
+	if sanity_check != 0:
+		raise FormaError(f'Detected inconsistency in the provided traces: {fp.consistency_errors[sanity_check]}')
+
+	if version != 'i':
+		fp.forma_calculate_dt_bounds(traces.ranks, traces.wins, traces.opdata)
+	if version == 'm' and cache_dir is not None:
+		fc.forma_save_cache(cache_dir, timestamp, tracefiles, *traces.traces()[1:])
+
+	return traces
+
+
+def forma_load_partials(filenames):
+
+	""" merges the partial aggregates stored in filenames (cf. forma_partial.py) 
+		and returns them as a FormaTraces of the incremental version, for 
+		forma_analyze(). Raises FormaError if they cannot be merged. 
+	"""
+
+	merged = fpt.forma_partial_merge(filenames)
+	traces = FormaTraces(None, None, [], 'i', merged[:8], merged[8])
+
+	sanity_check = fp.forma_check_consistency(traces.ranks, traces.wins, traces.opdata)
+	if sanity_check != 0:
+		raise FormaError(f'Detected inconsistency in the provided traces: {fp.consistency_errors[sanity_check]}')
+
+	return traces
+
+
+def forma_analyze(traces, timestamp=None, ranks=None, windows=None, epochs=None, verbose=False, **load_args):
+
+	""" analyses traces, a FormaTraces as returned by forma_load(), or the
+		directory of the trace files of timestamp, which are then loaded with
+		load_args (cf. forma_load()). Only the given ranks, windows and epochs
+		are analysed, if any (cf. forma_api_selection()), numbered from 0 as
+		with --ranks, --windows and --epoch-range. Returns a FormaResults.
+		Raises FormaError if the traces cannot be analysed.
+	"""
+
+	if not isinstance(traces, FormaTraces):
+		if timestamp is None:
+			raise FormaError('The timestamp of the trace files is needed along with their directory.')
+		traces = forma_load(traces, timestamp, verbose=verbose, **load_args)
+
+	selection = forma_api_selection(ranks, windows, epochs)
+	if selection and traces.version == 'i':
+		raise FormaError('Selecting ranks, windows or epochs is not supported by the incremental version.')
+
+	if selection.describe() in traces.results:
+		return traces.results[selection.describe()]
+
+	with forma_api_output(verbose):
+		if selection:
+			selection_error = fsel.forma_select_error(selection, traces.ranks, traces.wins, traces.epochs_per_window_per_rank[0])
+			if selection_error is not None:
+				raise FormaError(selection_error)
+			## the ops of the traces are left as they are, for later analyses
+			selected_traces = fsel.forma_select_traces(selection, *traces.traces(), copy=True)
+			moments_per_rank = None
+		else:
+			selected_traces = traces.traces()
+			moments_per_rank = traces.moments_per_rank
+
+		ranks, wins, callcount_per_opcode, opdata, total_exec_times_per_rank, all_window_sizes_per_rank, all_window_durations_per_rank, epochs_per_window_per_rank = selected_traces
+		per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank, per_window_data_vol, per_epoch_data, per_opcode_summary = fs.forma_break_down(traces.version, ranks, wins, opdata, moments_per_rank)
+
+		summary = forma_api_summary(ranks, total_exec_times_per_rank, all_window_sizes_per_rank[0], all_window_durations_per_rank,
+									epochs_per_window_per_rank[0], per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank,
+									per_window_data_vol, per_opcode_summary)
+		tables = fe.forma_export_tables(ranks, wins, opdata, total_exec_times_per_rank, all_window_sizes_per_rank,
+										all_window_durations_per_rank, per_opcode_op_durations_per_rank,
+										per_opcode_dt_bounds_per_rank, per_window_data_vol, per_epoch_data)
+
+	results = FormaResults(ranks, wins, callcount_per_opcode, summary, tables, selection if selection else None)
+	traces.results[selection.describe()] = results
+
+	return results
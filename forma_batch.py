@@ -0,0 +1,297 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import argparse
+import collections
+import functools
+import time
+import sys
+import os
+
+import multiprocessing as mp
+
+import numpy as np
+
+from tabulate import tabulate
+
+import forma_api as fapi
+import forma_cache as fc
+import forma_export as fe
+import forma_parse as fp
+import forma_prints as fo
+import forma_stats as fs
+
+from forma_parse import FormaError
+
+
+## foRMA batch mode. Analyses a number of executions (runs) in one go, each
+## given by the directory and timestamp of its trace files, either listed
+## (--run, --runs-file) or found as the dumpi-<timestamp>.meta files under a
+## directory tree (--discover). The trace files of all runs are parsed by one
+## pool of worker processes (-j): while the ranks of a run are being merged
+## and analysed, those of the runs after it are already being parsed. Runs
+## are handed to the pool ahead of the one being analysed until at least as
+## many trace files as workers are queued after it, so that the workers are
+## kept busy across runs, however few ranks each run has. Since the parsed
+## ranks of queued runs are held until their run is analysed, at most as
+## many runs as workers are queued. Runs in the trace cache (cf. forma_cache.py)
+## are not parsed at all.
+##
+## The summary of foRMA is printed for each run, followed by a table that
+## compares the runs side by side (execution time, time in RMA, average op
+## durations and data transfer bounds). A run that cannot be analysed is
+## reported in the table, and does not stop the others. As with the library
+## API (cf. forma_api.py), the memory use of parsing is not checked beforehand.
+
+batch_columns = ['run', 'directory', 'timestamp', 'status', 'ranks', 'wins', 'ops',
+				'exec_time_max', 'rma_time_total', 'get_mean', 'put_mean', 'acc_mean', 'fence_mean',
+				'get_dtbound_mean', 'put_dtbound_mean', 'acc_dtbound_mean']
+
+
+def forma_batch_runs_file(filename):
+
+	""" returns the runs listed in filename, one 'directory timestamp' per
+		line (lines starting with # are skipped)
+	"""
+
+	runs = []
+	with open(filename) as f:
+		for line in f:
+			if not line.strip() or line.startswith('#'):
+				continue
+			fields = line.split()
+			if len(fields) != 2:
+				raise ValueError(f'expected a directory and a timestamp, got: {line.strip()}')
+			runs.append(fields)
+
+	return runs
+
+
+def forma_batch_discover(tree):
+
+	""" returns the runs whose dumpi-<timestamp>.meta files are under tree,
+		ordered by directory and timestamp
+	"""
+
+	runs = []
+	for dirpath, dirnames, filenames in os.walk(tree):
+		dirnames[:] = [d for d in dirnames if d != fc.cache_dirname]
+		for filename in filenames:
+			if filename.startswith('dumpi-') and filename.endswith('.meta'):
+				runs.append([dirpath, filename[len('dumpi-'):-len('.meta')]])
+
+	return sorted(runs)
+
+
+def forma_batch_cache_dir(run, cache, cache_dir):
+
+	""" returns the cache directory of run, or None if the cache is not used """
+
+	if not cache:
+		return None
+
+	return cache_dir if cache_dir is not None else os.path.join(run[0], fc.cache_dirname)
+
+
+def forma_batch_submit(run, parse_ranks, version, cache_dir):
+
+	""" finds the trace files of run and, unless its traces are in the cache,
+		hands them to parse_ranks (e.g. the imap of the worker pool), which
+		parses them in the background. Returns [ tracefiles, cached traces,
+		results of forma_parse_rank() ], or the FormaError of the run.
+		cache_dir is the cache directory of run, if any (cf. forma_batch_cache_dir()).
+	"""
+
+	dirname, timestamp = run
+	try:
+		tracefiles = fapi.forma_api_tracefiles(dirname, timestamp)[0]
+	except FormaError as e:
+		return e
+
+	if version == 'm' and cache_dir is not None:
+		with fapi.forma_api_output(False):
+			cached_traces = fc.forma_load_cache(cache_dir, timestamp, tracefiles)
+		if cached_traces is not None:
+			return [tracefiles, cached_traces, None]
+
+	return [tracefiles, None, parse_ranks(tracefiles)]
+
+
+def forma_batch_queued(submitted):
+
+	""" returns the number of trace files of a run (as submitted by forma_batch_submit())
+		that are parsed by the workers, i.e. none if it is in the cache or has failed
+	"""
+
+	if isinstance(submitted, FormaError) or submitted[2] is None:
+		return 0
+
+	return len(submitted[0])
+
+
+def forma_batch_analyze(run, submitted, version, cache_dir, spill_dir):
+
+	""" merges the parsed trace files of run (as submitted by forma_batch_submit())
+		and analyses them. Returns the statistics printed by the summary of
+		foRMA and the summary table of the library API (cf. forma_api_summary()).
+		Traces are cached in cache_dir, if given (in-memory version).
+		Raises FormaError if the run cannot be analysed.
+	"""
+
+	if isinstance(submitted, FormaError):
+		raise submitted
+	dirname, timestamp = run
+	tracefiles, cached_traces, rank_results = submitted
+
+	with fapi.forma_api_output(False):
+		if cached_traces is not None:
+			traces = fapi.FormaTraces(dirname, timestamp, tracefiles, version, cached_traces)
+		else:
+			traces = fapi.forma_api_traces(dirname, timestamp, tracefiles, version,
+											functools.partial(fp.forma_parse_traces, tracefiles, incremental=version == 'i', rank_results=rank_results),
+											spill_dir, cache_dir)
+
+		ranks, wins, callcount_per_opcode, opdata, total_exec_times_per_rank, all_window_sizes_per_rank, all_window_durations_per_rank, epochs_per_window_per_rank = traces.traces()
+		per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank, per_window_data_vol, per_epoch_data, per_opcode_summary = fs.forma_break_down(version, ranks, wins, opdata, traces.moments_per_rank)
+
+		summary_values = [ranks, total_exec_times_per_rank, all_window_sizes_per_rank[0], all_window_durations_per_rank, epochs_per_window_per_rank[0],
+						per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank, per_window_data_vol, per_opcode_summary]
+		stats = fs.forma_calc_stats_summary(ranks, wins, *summary_values[1:])
+		summary = fapi.forma_api_summary(*summary_values)
+
+	return ranks, wins, callcount_per_opcode, stats, summary
+
+
+def forma_batch_row(index, run, results=None):
+
+	""" returns the row of run in the comparison table, out of its results
+		(as returned by forma_batch_analyze()), None if the run failed
+	"""
+
+	if results is None:
+		return [index, run[0], run[1], 'failed'] + [None]*12
+
+	ranks, wins, callcount_per_opcode, stats, summary = results
+
+	def column(row, name):
+		return summary[name][fapi.summary_rows.index(row)]
+
+	return ([index, run[0], run[1], 'ok', ranks, wins, sum(callcount_per_opcode[:4]),
+			column('exec_time', 'max'), column('rma_time', 'total')] +
+			[column(row, 'mean') for row in ['get', 'put', 'acc', 'fence', 'get_dtbound', 'put_dtbound', 'acc_dtbound']])
+
+
+def main():
+
+	forma_batch_arg_parse = argparse.ArgumentParser(description="foRMA batch mode -- analyses the traces of a number of executions with one pool of workers, and compares them.")
+	forma_batch_arg_parse.add_argument("--run", help="Directory and timestamp of the trace files of an execution (can be given more than once).", nargs=2, metavar=('DIRECTORY', 'TIMESTAMP'), action='append', default=[])
+	forma_batch_arg_parse.add_argument("--runs-file", help="File listing executions, one 'directory timestamp' per line (lines starting with # are skipped).", type=str)
+	forma_batch_arg_parse.add_argument("--discover", help="Analyse every execution whose dumpi-<timestamp>.meta file is under this directory tree.", type=str)
+	forma_batch_arg_parse.add_argument("--version", help="Version of foRMA: m for in-memory, i for incremental, o for out-of-core (default: m).", choices=['m', 'i', 'o'], default='m')
+	forma_batch_arg_parse.add_argument("-j", "--jobs", help="Number of worker processes used to parse the trace files of all executions; 0 uses all CPUs (default: 1).", type=int, default=1)
+	forma_batch_arg_parse.add_argument("--reader", help="Trace file reader (default: native).", choices=['native', 'pydumpi'], default='native')
+	forma_batch_arg_parse.add_argument("--quantile-error", help="Rank error of the approximate medians and tail latencies of the incremental and out-of-core versions (default: 0.01).", type=float, default=0.01)
+	forma_batch_arg_parse.add_argument("--cache-dir", help="Directory in which parsed trace data are cached (default: .forma-cache inside each trace directory).", type=str)
+	forma_batch_arg_parse.add_argument("--no-cache", help="Neither use nor create a cache of parsed trace data.", action="store_true")
+	forma_batch_arg_parse.add_argument("--spill-dir", help="Directory in which the out-of-core version keeps its memory-mapped files (default: the system's temporary directory).", type=str)
+	forma_batch_arg_parse.add_argument("--output", help="Also write the comparison table to this file, as comma-separated values.", type=str)
+
+	args = forma_batch_arg_parse.parse_args()
+
+	runs = list(args.run)
+	try:
+		if args.runs_file is not None:
+			runs += forma_batch_runs_file(args.runs_file)
+	except (OSError, ValueError) as e:
+		print(f'Could not read file of runs: {e}')
+		sys.exit(2)
+	if args.discover is not None:
+		runs += forma_batch_discover(args.discover)
+	if not runs:
+		print('No executions to analyse. Give them with --run, --runs-file or --discover.')
+		sys.exit(2)
+
+	if not 0 < args.quantile_error < 1:
+		print('The quantile error should be in (0, 1).')
+		sys.exit(2)
+	fs.forma_set_quantile_error(args.quantile_error)
+	jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+
+	## one pool for the trace files of all runs; imap hands back the results of
+	## a run in rank order, while the trace files of later runs are being parsed
+	parse_rank = functools.partial(fp.forma_parse_rank, incremental=args.version == 'i', native=args.reader == 'native')
+	if jobs > 1:
+		pool = mp.Pool(jobs)
+		parse_ranks = functools.partial(pool.imap, parse_rank)
+	else:
+		pool = None
+		parse_ranks = functools.partial(map, parse_rank)
+
+	start = time.perf_counter()
+	rows = []
+	errors = []
+	## runs handed to the pool and not analysed yet, from the current one on
+	submitted = collections.deque()
+	try:
+		for index, run in enumerate(runs):
+			## later runs are handed to the pool before this one is merged, until 
+			## the trace files queued after it are enough for all workers, so that 
+			## workers do not wait for the analysis of this run
+			while index + len(submitted) < len(runs) and (not submitted or (sum([forma_batch_queued(s) for s in list(submitted)[1:]]) < jobs and len(submitted) <= jobs)):
+				next_run = runs[index + len(submitted)]
+				submitted.append(forma_batch_submit(next_run, parse_ranks, args.version, forma_batch_cache_dir(next_run, not args.no_cache, args.cache_dir)))
+			current = submitted.popleft()
+
+			print(f'\n\n\n[run {index}] directory {run[0]}, timestamp {run[1]}\n')
+			try:
+				results = forma_batch_analyze(run, current, args.version, forma_batch_cache_dir(run, not args.no_cache, args.cache_dir), args.spill_dir)
+			except FormaError as e:
+				print(f'ERROR: {e}')
+				errors.append([index, str(e)])
+				rows.append(forma_batch_row(index, run))
+				continue
+			ranks, wins, callcount_per_opcode, stats, summary = results
+			fo.forma_print_stats_summary(ranks, wins, *stats[:3], callcount_per_opcode, stats[3])
+			rows.append(forma_batch_row(index, run, results))
+	finally:
+		if pool is not None:
+			pool.terminate()
+
+	print('\n\n\n------------------------------------------------------------------------------------------\n' +
+	'---------------------------- Comparison of Runs ------------------------------------------\n')
+	print(tabulate(rows,
+					headers=['run', 'directory', 'timestamp', 'status', 'ranks', 'wins', 'ops', 'max exec. time', 'time in RMA',
+							'MPI_Get', 'MPI_Put', 'MPI_Acc', 'MPI_Win_fence', 'Get DT bound', 'Put DT bound', 'Acc DT bound'], missingval='-'))
+	print('\n(times in nsec; op durations and data transfer bounds are averages)')
+	for index, error in errors:
+		print(f'run {index} failed: {error.splitlines()[0]}')
+	print(f'\n{len(runs)} run(s) analysed in {time.perf_counter() - start:.2f} sec.')
+
+	if args.output is not None:
+		## values of failed runs are left empty
+		columns = {name: np.array([r[i] if r[i] is not None else '' for r in rows]) for i, name in enumerate(batch_columns)}
+		fe.forma_write_csv(args.output, columns)
+		print(f'\nResults can be found in file {args.output}')
+
+	sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,261 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import argparse
+import contextlib
+import itertools
+import shutil
+import tempfile
+import time
+import sys
+import glob, os
+
+import multiprocessing as mp
+from queue import Empty
+
+import numpy as np
+
+from tabulate import tabulate
+
+import forma
+import forma_export as fe
+import forma_parse as fp
+import forma_profile as fpr
+import forma_stats as fs
+import forma_synth as fy
+
+
+## foRMA benchmark suite. Generates synthetic traces (cf. forma_synth.py) for
+## every combination of the given numbers of ranks, windows, epochs per window
+## and ops per epoch, runs the analysis pipeline of foRMA on them, stage by
+## stage, and records the time and the peak memory use (RSS) of each stage:
+##
+##   parse     : forma_parse_traces()
+##   dt_bounds : forma_calculate_dt_bounds() (not in the incremental version)
+##   breakdown : statistics per rank, window and opcode
+##   summary   : forma_calc_stats_summary()
+##   epochs, fences, calls : the reports of -e, -f and -c
+##
+## Each configuration is run in a process of its own, so that the memory use
+## of one does not carry over to the next. The peak RSS of each stage is
+## measured separately where the peak can be reset (Linux), otherwise it is
+## the peak of the process up to the end of the stage. Worker processes of
+## parallel parsing (-j) are not accounted for. Memory per op is the peak RSS
+## above the RSS of the process before parsing, per op.
+
+bench_stages = ['parse', 'dt_bounds', 'breakdown', 'summary', 'epochs', 'fences', 'calls']
+
+bench_columns = ['ranks', 'wins', 'epochs', 'ops_per_epoch', 'ops', 'trace_bytes', 'stage',
+				'seconds', 'ops_per_sec', 'bytes_per_sec', 'peak_rss', 'rss_per_op']
+
+
+def forma_bench_int_list(text):
+
+	""" argparse type of comma-separated lists of non-negative integers """
+
+	try:
+		values = [int(v) for v in text.split(',')]
+	except ValueError:
+		raise argparse.ArgumentTypeError(f'not a comma-separated list of integers: {text}')
+	if any([v < 0 for v in values]):
+		raise argparse.ArgumentTypeError(f'negative value in: {text}')
+
+	return values
+
+
+def forma_bench_pipeline(tracefiles, version, jobs, native, work_dir):
+
+	""" runs the analysis pipeline on tracefiles, and returns the number of
+		ops (fences included), the RSS before the pipeline started and 
+		{ stage: [ seconds, peak RSS ] }
+	"""
+
+	results = dict()
+	state = dict()
+
+	def stage(name, function):
+		fpr.forma_reset_peak_rss()
+		start = time.perf_counter()
+		with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+			function()
+		results[name] = [time.perf_counter() - start, fpr.forma_rss()]
+
+	def parse():
+		spill_dir = tempfile.mkdtemp(prefix='forma-', dir=work_dir) if version == 'o' else None
+		state['traces'] = fp.forma_parse_traces(tracefiles, jobs, version == 'i', spill_dir, native)
+
+	def dt_bounds():
+		ranks, wins, callcount_per_opcode, opdata = state['traces'][:4]
+		fp.forma_calculate_dt_bounds(ranks, wins, opdata)
+
+	def breakdown():
+		ranks, wins, callcount_per_opcode, opdata = state['traces'][:4]
+		state['per_opcode_summary'] = None
+		if version == 'i':
+			data = fs.forma_merge_incremental(ranks, wins, opdata, state['traces'][8])
+		elif version == 'o':
+			data = fs.forma_break_down_out_of_core(ranks, wins, opdata)
+		else:
+			data = list(fs.forma_break_down_per_rank_per_window(ranks, wins, opdata)) + [None]
+			state['per_opcode_summary'] = fs.forma_break_down_per_opcode(opdata)
+		state['per_opcode_op_durations_per_rank'], state['per_opcode_dt_bounds_per_rank'], state['per_window_data_vol'], state['per_epoch_data'] = data
+
+	def summary():
+		ranks, wins, callcount_per_opcode, opdata, total_exec_times_per_rank, all_window_sizes_per_rank, all_window_durations_per_rank, epochs_per_window_per_rank = state['traces'][:8]
+		fs.forma_calc_stats_summary(ranks, wins, total_exec_times_per_rank, all_window_sizes_per_rank[0],
+									all_window_durations_per_rank, epochs_per_window_per_rank[0],
+									state['per_opcode_op_durations_per_rank'], state['per_opcode_dt_bounds_per_rank'],
+									state['per_window_data_vol'], state['per_opcode_summary'])
+
+	def epochs():
+		ranks, wins, callcount_per_opcode, opdata, total_exec_times_per_rank, all_window_sizes_per_rank, all_window_durations_per_rank = state['traces'][:7]
+		forma.per_epoch_stats_to_file(ranks, wins, state['per_window_data_vol'], opdata, all_window_durations_per_rank, state['per_epoch_data'])
+
+	def fences():
+		ranks, wins, callcount_per_opcode, opdata, total_exec_times_per_rank, all_window_sizes_per_rank = state['traces'][:6]
+		forma.fence_stats_to_file(ranks, wins, state['per_window_data_vol'], all_window_sizes_per_rank[0], opdata)
+
+	def calls():
+		ranks, total_exec_times_per_rank = state['traces'][0], state['traces'][4]
+		forma.per_op_durations_to_file(ranks, total_exec_times_per_rank, state['per_opcode_op_durations_per_rank'], state['per_opcode_dt_bounds_per_rank'])
+
+	## reports are written to work_dir
+	os.chdir(work_dir)
+	baseline = fpr.forma_rss('VmRSS')
+
+	stage('parse', parse)
+	if version != 'i':
+		stage('dt_bounds', dt_bounds)
+	for name, function in [('breakdown', breakdown), ('summary', summary), ('epochs', epochs), ('fences', fences), ('calls', calls)]:
+		stage(name, function)
+
+	ops = sum(state['traces'][2][:4])
+
+	return ops, baseline, results
+
+
+def forma_bench_run(tracefiles, version, jobs, native, work_dir, queue=None):
+
+	result = forma_bench_pipeline(tracefiles, version, jobs, native, work_dir)
+	if queue is not None:
+		queue.put(result)
+
+	return result
+
+
+def forma_bench_config(tracefiles, version, jobs, native, work_dir):
+
+	""" runs forma_bench_pipeline() in a process of its own, where fork is available """
+
+	if 'fork' not in mp.get_all_start_methods():
+		cwd = os.getcwd()
+		try:
+			return forma_bench_run(tracefiles, version, jobs, native, work_dir)
+		finally:
+			os.chdir(cwd)
+
+	sys.stdout.flush()
+	ctx = mp.get_context('fork')
+	queue = ctx.Queue()
+	proc = ctx.Process(target=forma_bench_run, args=(tracefiles, version, jobs, native, work_dir, queue))
+	proc.start()
+
+	## wait for the result for as long as the process is alive
+	result = None
+	while result is None and (proc.is_alive() or not queue.empty()):
+		try:
+			result = queue.get(timeout=1)
+		except Empty:
+			pass
+	proc.join()
+	if proc.exitcode != 0 or result is None:
+		print('ERROR: benchmark run failed.')
+		sys.exit(1)
+
+	return result
+
+
+def main():
+
+	forma_bench_arg_parse = argparse.ArgumentParser(description="foRMA benchmark suite -- runs the foRMA analysis on synthetic traces of various sizes and records time and peak memory use per stage.")
+	forma_bench_arg_parse.add_argument("--ranks", help="Comma-separated numbers of ranks (default: 8).", type=forma_bench_int_list, default=[8])
+	forma_bench_arg_parse.add_argument("--wins", help="Comma-separated numbers of memory windows (default: 2).", type=forma_bench_int_list, default=[2])
+	forma_bench_arg_parse.add_argument("--epochs", help="Comma-separated numbers of epochs per window (default: 100).", type=forma_bench_int_list, default=[100])
+	forma_bench_arg_parse.add_argument("--ops", help="Comma-separated numbers of RMA ops per rank per epoch (default: 10,100,1000).", type=forma_bench_int_list, default=[10, 100, 1000])
+	forma_bench_arg_parse.add_argument("--version", help="Version of foRMA to benchmark: m for in-memory, i for incremental, o for out-of-core (default: m).", choices=['m', 'i', 'o'], default='m')
+	forma_bench_arg_parse.add_argument("-j", "--jobs", help="Number of worker processes used to parse the trace files (default: 1).", type=int, default=1)
+	forma_bench_arg_parse.add_argument("--reader", help="Trace file reader (default: native).", choices=['native', 'pydumpi'], default='native')
+	forma_bench_arg_parse.add_argument("--repeat", help="Number of runs per configuration, of which the fastest is kept (default: 1).", type=int, default=1)
+	forma_bench_arg_parse.add_argument("--seed", help="Seed of the synthetic trace generator (default: 0).", type=int, default=0)
+	forma_bench_arg_parse.add_argument("--trace-dir", help="Directory in which the synthetic traces are kept (default: a temporary directory, removed at the end).", type=str)
+	forma_bench_arg_parse.add_argument("--output", help="Also write the results to this file, as comma-separated values.", type=str)
+
+	args = forma_bench_arg_parse.parse_args()
+	if min(args.ranks + args.wins + args.epochs) < 1 or args.repeat < 1:
+		print('There has to be at least one rank, window, epoch and run per configuration.')
+		sys.exit(2)
+	jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+
+	work_dir = tempfile.mkdtemp(prefix='forma-bench-')
+	trace_dir = args.trace_dir if args.trace_dir is not None else os.path.join(work_dir, 'traces')
+
+	rows = []
+	try:
+		for ranks, wins, epochs, ops in itertools.product(args.ranks, args.wins, args.epochs, args.ops):
+			timestamp = f'{ranks}.{wins}.{epochs}.{ops}'
+			config_dir = os.path.join(trace_dir, timestamp)
+			print(f'Generating traces: {ranks} ranks, {wins} windows, {epochs} epochs, {ops} ops per epoch...\t\t', end="", flush=True)
+			trace_bytes = fy.forma_synth_traces(config_dir, timestamp, ranks, wins, epochs, ops, args.seed)
+			tracefiles = sorted(glob.glob(os.path.join(config_dir, f'dumpi-{timestamp}-*.bin')))
+			print('Done.')
+
+			print('Running benchmark...\t\t', end="", flush=True)
+			results = dict()
+			for run in range(args.repeat):
+				total_ops, baseline, run_results = forma_bench_config(tracefiles, args.version, jobs, args.reader == 'native', work_dir)
+				for stage, result in run_results.items():
+					if stage not in results or result[0] < results[stage][0]:
+						results[stage] = result
+			print('Done.\n')
+
+			stages = [s for s in bench_stages if s in results]
+			results['total'] = [sum([results[s][0] for s in stages]), max([results[s][1] for s in stages])]
+			for stage in stages + ['total']:
+				seconds, peak_rss = results[stage]
+				rows.append([ranks, wins, epochs, ops, total_ops, trace_bytes, stage, seconds,
+							total_ops/seconds if seconds > 0 else 0.0, trace_bytes/seconds if seconds > 0 else 0.0,
+							peak_rss, max(peak_rss - baseline, 0)/max(total_ops, 1)])
+
+			if args.trace_dir is None:
+				shutil.rmtree(config_dir, True)
+	finally:
+		shutil.rmtree(work_dir, True)
+
+	print(tabulate([[r[0], r[1], r[2], r[3], r[4], r[6], r[7], r[8], r[9]/2**20, r[10]/2**20, r[11]] for r in rows],
+					headers=['ranks', 'wins', 'epochs', 'ops/epoch', 'ops', 'stage', 'sec', 'ops/sec', 'MiB/sec', 'peak RSS (MiB)', 'RSS/op (B)']))
+
+	if args.output is not None:
+		columns = {name: np.array([r[i] for r in rows]) for i, name in enumerate(bench_columns)}
+		fe.forma_write_csv(args.output, columns)
+		print(f'\nResults can be found in file {args.output}')
+
+
+if __name__ == "__main__":
+	main()
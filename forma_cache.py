@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import glob, os
+import struct
+import hashlib
+import json
+
+import numpy as np
+
+import forma_opdata as fod
+
+
+## foRMA parsed-trace cache. Holds the output of forma_parse_traces() and
+## forma_calculate_dt_bounds() for a set of trace files in a single .npz
+## file, so that a re-analysis of the same traces does not have to parse
+## them again. A cache entry is keyed by the identity of each trace file,
+## i.e. its path, size, modification time and a hash of its footer, so
+## that it is not used any more as soon as any of the trace files changes.
+
+## bump whenever the content of a cache entry changes
+cache_version = 3
+
+cache_dirname = '.forma-cache'
+
+
+def forma_trace_identity(tracefile):
+
+	""" returns [ path, size, mtime (nsec), sha1 of footer ] for tracefile.
+		The footer of a dumpi trace file is located through the index at the
+		end of the file (8 big-endian 64-bit offsets, the 7th of which points
+		to the footer); if it cannot be located, the end of the file is used.
+	"""
+
+	stat = os.stat(tracefile)
+	footer_hash = hashlib.sha1()
+
+	with open(tracefile, 'rb') as f:
+		footer_offset = max(stat.st_size - 4096, 0)
+		if stat.st_size >= 64:
+			f.seek(-64, os.SEEK_END)
+			index = struct.unpack('>8Q', f.read(64))
+			if index[6] < stat.st_size:
+				footer_offset = index[6]
+		f.seek(footer_offset)
+		footer_hash.update(f.read())
+
+	return [os.path.abspath(tracefile), stat.st_size, stat.st_mtime_ns, footer_hash.hexdigest()]
+
+
+def forma_cache_file(cache_dir, timestamp, identities):
+
+	key = hashlib.sha1(json.dumps([cache_version, identities]).encode()).hexdigest()
+
+	return os.path.join(cache_dir, f'forma-{timestamp}-{key[:20]}.npz')
+
+
+def forma_load_cache(cache_dir, timestamp, tracefiles):
+
+	""" returns the output of forma_parse_traces() for tracefiles, with
+		data transfer bounds already calculated, if a valid cache entry
+		exists in cache_dir, or None otherwise
+	"""
+
+	try:
+		identities = [forma_trace_identity(tf) for tf in tracefiles]
+	except OSError:
+		return None
+
+	cache_file = forma_cache_file(cache_dir, timestamp, identities)
+	if not os.path.isfile(cache_file):
+		return None
+
+	try:
+		with np.load(cache_file) as cache:
+			if json.loads(str(cache['identities'])) != identities:
+				return None
+
+			columns = {c[0]: cache['opdata_'+c[0]] for c in fod.FormaOpdata.columns}
+			epochs_per_window_per_rank = cache['epochs_per_window'].tolist()
+			opdata = fod.FormaOpdata(columns, epochs_per_window_per_rank)
+
+			ranks = len(tracefiles)
+			wins = int(cache['wins'])
+			callcount_per_opcode = cache['callcount_per_opcode'].tolist()
+			total_exec_time_per_rank = cache['total_exec_time'].tolist()
+			all_window_sizes_per_rank = cache['window_sizes'].tolist()
+			all_window_durations_per_rank = cache['window_durations'].tolist()
+	except (OSError, KeyError, ValueError):
+		print(f'Ignoring unreadable cache file {cache_file}.')
+		return None
+
+	return ranks, wins, callcount_per_opcode, opdata, total_exec_time_per_rank, all_window_sizes_per_rank, all_window_durations_per_rank, epochs_per_window_per_rank
+
+
+def forma_save_cache(cache_dir, timestamp, tracefiles, wins, callcount_per_opcode, opdata,
+					total_exec_time_per_rank, all_window_sizes_per_rank, all_window_durations_per_rank,
+					epochs_per_window_per_rank):
+
+	""" stores the output of forma_parse_traces() for tracefiles, after
+		data transfer bounds have been calculated, into cache_dir. Since
+		it is only called after the sanity check, all ranks are known to
+		have the same windows and epochs. Earlier cache entries for the
+		same timestamp are removed. Returns the path of the cache file,
+		or None if the cache could not be written.
+	"""
+
+	try:
+		identities = [forma_trace_identity(tf) for tf in tracefiles]
+		os.makedirs(cache_dir, exist_ok=True)
+		cache_file = forma_cache_file(cache_dir, timestamp, identities)
+
+		columns = {'opdata_'+c[0]: getattr(opdata, c[0]) for c in fod.FormaOpdata.columns}
+
+		## write to a temporary file first, so that a cache entry is either complete or missing
+		tmp_file = cache_file[:-len('.npz')]+f'.{os.getpid()}.tmp.npz'
+		np.savez(tmp_file,
+				identities=np.array(json.dumps(identities)),
+				wins=np.array(wins),
+				callcount_per_opcode=np.array(callcount_per_opcode, dtype=np.int64),
+				total_exec_time=np.array(total_exec_time_per_rank, dtype=np.int64),
+				window_sizes=np.array(all_window_sizes_per_rank, dtype=np.int64).reshape(len(tracefiles), wins),
+				window_durations=np.array(all_window_durations_per_rank, dtype=np.int64).reshape(len(tracefiles), wins, 3),
+				epochs_per_window=np.array(epochs_per_window_per_rank, dtype=np.int64).reshape(len(tracefiles), wins),
+				**columns)
+		os.replace(tmp_file, cache_file)
+
+		for old_file in glob.glob(os.path.join(cache_dir, f'forma-{glob.escape(timestamp)}-*.npz')):
+			if old_file != cache_file:
+				os.remove(old_file)
+	except OSError as e:
+		print(f'Could not write parsed trace cache to {cache_dir}: {e}')
+		return None
+
+	return cache_file
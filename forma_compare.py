@@ -0,0 +1,369 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import argparse
+import math
+import time
+import sys
+import os
+
+import numpy as np
+
+from tabulate import tabulate
+
+import forma_api as fapi
+import forma_export as fe
+import forma_select as fsel
+
+from forma_parse import FormaError
+
+
+## foRMA run-to-run comparison. Compares the op durations and data transfer
+## bounds of two executions (runs A and B, e.g. before and after a code change)
+## per opcode, per window and opcode, and per rank and opcode, and flags the
+## differences that are significant. Also available as forma.compare(), on
+## the FormaResults of forma.analyze():
+##
+##   forma_compare.py <trace dir A> <timestamp A> <trace dir B> <timestamp B>
+##
+## Comparisons only use the statistics that the analysis of each run already
+## has (cf. FormaResults), so that comparing takes next to no time once both
+## runs are analysed (with the cache, cf. forma_cache.py, neither is parsed again).
+##
+## A difference of means is significant if Welch's test rejects equal means
+## at level alpha, and if it is at least min_change of the mean of run A, so
+## that tiny but consistent changes of large traces are not flagged. The values
+## of an op are not independent of the epoch they are in (e.g. contention, and
+## the data transfer bounds of an epoch all end at the same fences), so the test
+## is made on the means of the epochs instead of the values themselves: of all
+## windows per opcode and of the window per window (cf. the epoch_stats table),
+## and of the rank per rank (cf. the rank_stats table, as calculated by the
+## breakdown of each version, cf. forma_grouped_epoch_means()). Rows with fewer
+## than 2 epochs on either side cannot be tested, and are not flagged, however
+## large their change. Ranks and windows are compared by id, as many as both
+## runs have.
+
+## defaults of the significance level of the test and of the minimum relative change
+compare_alpha = 0.01
+compare_min_change = 0.05
+
+## statistics of each run in the comparison tables
+compare_stats = ['count', 'mean', 'median', 'p99']
+
+compare_tables = ['opcodes', 'windows', 'ranks']
+
+
+def forma_compare_test(count_a, mean_a, std_a, count_b, mean_b, std_b):
+
+	""" returns the z statistic and the two-sided p-value of Welch's test of
+		equal means, per row, out of the count, mean and (population) standard
+		deviation of the values of A and B. p-values are those of the normal
+		distribution, which Student's t tends to for the sample sizes of traces.
+		Rows with fewer than 2 values on either side get NaN.
+	"""
+
+	count_a, mean_a, std_a, count_b, mean_b, std_b = [np.asarray(v, dtype=np.float64) for v in [count_a, mean_a, std_a, count_b, mean_b, std_b]]
+	valid = (count_a > 1) & (count_b > 1)
+
+	## unbiased variances of the means
+	var_a = np.divide(std_a**2, count_a - 1, out=np.zeros(len(valid)), where=valid)
+	var_b = np.divide(std_b**2, count_b - 1, out=np.zeros(len(valid)), where=valid)
+	se = np.sqrt(var_a + var_b)
+	delta = mean_b - mean_a
+
+	z = np.full(len(valid), np.nan)
+	np.divide(delta, se, out=z, where=valid & (se > 0))
+	## no variance on either side: any difference is significant
+	constant = valid & (se == 0)
+	z[constant] = np.sign(delta[constant])*np.where(delta[constant] != 0, np.inf, 0)
+
+	p_value = np.array([math.erfc(abs(v)/math.sqrt(2)) for v in z.tolist()])
+
+	return z, p_value
+
+
+def forma_compare_table(keys, a, b, alpha, min_change):
+
+	""" returns the comparison table of the same rows (keys) of runs A and B,
+		out of their statistics a and b (columns of compare_stats, as well as
+		epochs, epoch_mean and epoch_std, cf. forma_compare_epoch_means()).
+		The test is made on the means of the epochs of each row.
+	"""
+
+	columns = dict(keys)
+	for name in compare_stats:
+		columns['a_'+name] = np.asarray(a[name])
+		columns['b_'+name] = np.asarray(b[name])
+
+	delta = columns['b_mean'] - columns['a_mean']
+	change = np.where(delta < 0, -np.inf, np.inf)
+	np.divide(delta, columns['a_mean'], out=change, where=columns['a_mean'] != 0)
+	change[delta == 0] = 0.0
+	z, p_value = forma_compare_test(a['epochs'], a['epoch_mean'], a['epoch_std'], b['epochs'], b['epoch_mean'], b['epoch_std'])
+
+	## rows with too few epochs to test (NaN p-value) are never flagged
+	significant = (p_value < alpha) & (np.abs(change) >= min_change)
+	columns['delta'] = delta
+	columns['change'] = change
+	columns['a_epochs'] = np.asarray(a['epochs']).astype(np.int64)
+	columns['b_epochs'] = np.asarray(b['epochs']).astype(np.int64)
+	columns['z'] = z
+	columns['p_value'] = p_value
+	columns['flag'] = np.where(significant, np.where(delta > 0, 'slower', 'faster'), '')
+
+	return columns
+
+
+def forma_compare_epoch_means(group, count, total, groups):
+
+	""" returns the number of samples with values of each of groups, and the
+		mean and standard deviation of their means, out of the group, count
+		and total of the values of each sample (e.g. each epoch of a window)
+	"""
+
+	keep = (group >= 0) & (group < groups) & (count > 0)
+	means = total[keep]/count[keep]
+
+	samples = np.bincount(group[keep], minlength=groups).astype(np.float64)
+	nonempty = samples > 0
+	mean = np.divide(np.bincount(group[keep], weights=means, minlength=groups), samples, out=np.zeros(groups), where=nonempty)
+	var = np.divide(np.bincount(group[keep], weights=means**2, minlength=groups), samples, out=np.zeros(groups), where=nonempty) - mean**2
+
+	return samples, mean, np.sqrt(np.maximum(var, 0))
+
+
+def forma_compare_rows(duration_stats, dtbound_stats, rows, dt_rows):
+
+	""" returns the statistics of the op durations of rows, followed by those
+		of the data transfer bounds of dt_rows, out of the statistics of each
+		kind (dictionaries of columns)
+	"""
+
+	return {name: np.concatenate([np.asarray(duration_stats[name])[rows], np.asarray(dtbound_stats[name])[dt_rows]]) for name in duration_stats}
+
+
+def forma_compare_opcodes(results_a, results_b, alpha, min_change):
+
+	""" compares the summaries of runs A and B, per opcode, testing the means
+		of all epochs of all windows (cf. the epoch_stats table)
+	"""
+
+	rows = ['get', 'put', 'acc', 'fence', 'get_dtbound', 'put_dtbound', 'acc_dtbound']
+	index = [fapi.summary_rows.index(r) for r in rows]
+	keys = [('opcode', np.array([0, 1, 2, 3, 0, 1, 2], dtype=np.int8)), ('kind', np.array(['duration']*4 + ['dtbound']*3))]
+
+	tables = []
+	for results in [results_a, results_b]:
+		epoch_stats = results['epoch_stats']
+		duration_stats, dtbound_stats = [dict(zip(['epochs', 'epoch_mean', 'epoch_std'],
+												forma_compare_epoch_means(epoch_stats['opcode'].astype(np.int64), epoch_stats[prefix+'count'].astype(np.float64),
+																			epoch_stats[prefix+'total'].astype(np.float64), 4)))
+										for prefix in ['duration_', 'dtbound_']]
+		table = forma_compare_rows(duration_stats, dtbound_stats, np.arange(4), np.arange(3))
+		table.update({name: results.summary[name][index] for name in compare_stats})
+		tables.append(table)
+
+	return forma_compare_table(keys, *tables, alpha, min_change)
+
+
+def forma_compare_ranks(results_a, results_b, alpha, min_change):
+
+	""" compares the ranks of runs A and B, per rank and opcode, testing the
+		means of the epochs of each rank (cf. the rank_stats table)
+	"""
+
+	ranks = min(results_a.ranks, results_b.ranks)
+	rows = np.arange(ranks*4)
+	dt_rows = rows[rows % 4 != 3]
+	keys = [('rank', np.concatenate([rows//4, dt_rows//4]).astype(np.int32)),
+			('opcode', np.concatenate([rows % 4, dt_rows % 4]).astype(np.int8)),
+			('kind', np.array(['duration']*len(rows) + ['dtbound']*len(dt_rows)))]
+
+	tables = []
+	for results in [results_a, results_b]:
+		rank_stats = results['rank_stats']
+		duration_stats, dtbound_stats = [{name: rank_stats[prefix+name] for name in compare_stats + fe.epoch_means_columns}
+										for prefix in ['duration_', 'dtbound_']]
+		tables.append(forma_compare_rows(duration_stats, dtbound_stats, rows, dt_rows))
+
+	return forma_compare_table(keys, *tables, alpha, min_change)
+
+
+def forma_compare_window_stats(epoch_stats, wins):
+
+	""" returns the statistics of each window and opcode (row window*4 + opcode)
+		out of the epoch_stats table, for the op durations and the data transfer
+		bounds: count and mean of the values of all of its epochs, and the
+		number of epochs with values, the mean and the standard deviation of
+		their means. Medians and tail latencies are not available per epoch (NaN).
+	"""
+
+	groups = wins*4
+	group = epoch_stats['window'].astype(np.int64)*4 + epoch_stats['opcode']
+
+	stats = []
+	for prefix in ['duration_', 'dtbound_']:
+		count = epoch_stats[prefix+'count'].astype(np.float64)
+		total = epoch_stats[prefix+'total'].astype(np.float64)
+		keep = (group < groups) & (count > 0)
+
+		values = np.bincount(group[keep], weights=count[keep], minlength=groups)
+		mean = np.divide(np.bincount(group[keep], weights=total[keep], minlength=groups), values, out=np.zeros(groups), where=values > 0)
+		epochs, epoch_mean, epoch_std = forma_compare_epoch_means(group, count, total, groups)
+
+		stats.append({'count': values.astype(np.int64), 'mean': mean, 'median': np.full(groups, np.nan), 'p99': np.full(groups, np.nan),
+					'epochs': epochs, 'epoch_mean': epoch_mean, 'epoch_std': epoch_std})
+
+	return stats
+
+
+def forma_compare_windows(results_a, results_b, alpha, min_change):
+
+	""" compares the windows of runs A and B, per window and opcode, testing
+		the means of their epochs (cf. forma_compare_window_stats())
+	"""
+
+	wins = min(results_a.wins, results_b.wins)
+	rows = np.arange(wins*4)
+	dt_rows = rows[rows % 4 != 3]
+	keys = [('window', np.concatenate([rows//4, dt_rows//4]).astype(np.int32)),
+			('opcode', np.concatenate([rows % 4, dt_rows % 4]).astype(np.int8)),
+			('kind', np.array(['duration']*len(rows) + ['dtbound']*len(dt_rows)))]
+
+	a, b = [forma_compare_rows(*forma_compare_window_stats(results['epoch_stats'], wins), rows, dt_rows) for results in [results_a, results_b]]
+
+	return forma_compare_table(keys, a, b, alpha, min_change)
+
+
+def forma_compare(results_a, results_b, alpha=compare_alpha, min_change=compare_min_change):
+
+	""" compares the op durations and data transfer bounds of run B with those
+		of run A, both FormaResults (cf. forma_analyze()). Returns the tables
+		opcodes, windows and ranks, as dictionaries of NumPy columns: the keys
+		of each row (opcode, window, rank, and kind, i.e. duration or dtbound),
+		count, mean, median and p99 of each run (a_, b_), delta (B - A) and
+		change (relative to A) of the mean, a_epochs and b_epochs, the number
+		of epoch means tested, z and p_value of Welch's test (NaN if it cannot
+		be made), and flag, slower or faster if the difference is significant
+		at alpha and at least min_change (never flagged if it cannot be tested).
+	"""
+
+	if not 0 < alpha < 1:
+		raise FormaError('The significance level should be in (0, 1).')
+	if min_change < 0:
+		raise FormaError('The minimum change should not be negative.')
+
+	return {'opcodes': forma_compare_opcodes(results_a, results_b, alpha, min_change),
+			'windows': forma_compare_windows(results_a, results_b, alpha, min_change),
+			'ranks': forma_compare_ranks(results_a, results_b, alpha, min_change)}
+
+
+def forma_print_compare_table(title, key, table, show_all):
+
+	""" prints the rows of a comparison table (only the flagged ones, unless show_all is set) """
+
+	flagged = table['flag'] != ''
+	rows = np.arange(len(flagged)) if show_all else np.nonzero(flagged)[0]
+	opcode_names = fapi.callcount_names[:4]
+
+	print('------------------------------------------------------------------------------------------\n' +
+	f'{(" " + title + " ").center(90, "-")}\n')
+	if len(rows) > 0:
+		print(tabulate([([table[key][r]] if key is not None else []) +
+						[opcode_names[table['opcode'][r]], table['kind'][r], table['a_mean'][r], table['b_mean'][r],
+						table['delta'][r], 100*table['change'][r], table['p_value'][r] if not np.isnan(table['p_value'][r]) else None, table['flag'][r]] for r in rows.tolist()],
+						headers=([key] if key is not None else []) + ['opcode', 'kind', 'mean A', 'mean B', 'delta', 'change (%)', 'p-value', 'flag'],
+						floatfmt='.4g', missingval='-'))
+	print(f'\n{int(np.sum(flagged))} of {len(flagged)} row(s) significantly different.\n')
+
+
+def main():
+
+	forma_compare_arg_parse = argparse.ArgumentParser(description="foRMA run-to-run comparison -- compares op durations and data transfer bounds of two executions per opcode, window and rank, and flags significant differences.")
+	forma_compare_arg_parse.add_argument("directory_a", help="Path to the directory of the trace files of run A (e.g. before a change).", type=str)
+	forma_compare_arg_parse.add_argument("timestamp_a", help="Timestamp of the trace files of run A.", type=str)
+	forma_compare_arg_parse.add_argument("directory_b", help="Path to the directory of the trace files of run B (e.g. after a change).", type=str)
+	forma_compare_arg_parse.add_argument("timestamp_b", help="Timestamp of the trace files of run B.", type=str)
+	forma_compare_arg_parse.add_argument("--version", help="Version of foRMA: m for in-memory, i for incremental, o for out-of-core (default: m).", choices=['m', 'i', 'o'], default='m')
+	forma_compare_arg_parse.add_argument("-j", "--jobs", help="Number of worker processes used to parse the trace files; 0 uses all CPUs (default: 1).", type=int, default=1)
+	forma_compare_arg_parse.add_argument("--reader", help="Trace file reader (default: native).", choices=['native', 'pydumpi'], default='native')
+	forma_compare_arg_parse.add_argument("--quantile-error", help="Rank error of the approximate medians and tail latencies of the incremental and out-of-core versions (default: 0.01).", type=float, default=0.01)
+	forma_compare_arg_parse.add_argument("--cache-dir", help="Directory in which parsed trace data are cached (default: .forma-cache inside each trace directory).", type=str)
+	forma_compare_arg_parse.add_argument("--no-cache", help="Neither use nor create a cache of parsed trace data.", action="store_true")
+	forma_compare_arg_parse.add_argument("--spill-dir", help="Directory in which the out-of-core version keeps its memory-mapped files (default: the system's temporary directory).", type=str)
+	forma_compare_arg_parse.add_argument("--ranks", help="Compare only these ranks of both runs, e.g. 0-15,512.", type=fsel.forma_select_ids)
+	forma_compare_arg_parse.add_argument("--windows", help="Compare only these memory windows of both runs, e.g. 0,2.", type=fsel.forma_select_ids)
+	forma_compare_arg_parse.add_argument("--epoch-range", help="Compare only this range of epochs of each window, as FIRST:LAST (LAST not included).", type=fsel.forma_select_epoch_range)
+	forma_compare_arg_parse.add_argument("--alpha", help=f"Significance level of the test of equal means (default: {compare_alpha}).", type=float, default=compare_alpha)
+	forma_compare_arg_parse.add_argument("--min-change", help=f"Minimum change of the mean, relative to run A, that is flagged (default: {compare_min_change}).", type=float, default=compare_min_change)
+	forma_compare_arg_parse.add_argument("--all", help="Print all rows per window and per rank, not only the flagged ones.", action="store_true")
+	forma_compare_arg_parse.add_argument("--output", help="Also write the comparison tables to this directory, as comma-separated values (compare_<table>.csv).", type=str)
+
+	args = forma_compare_arg_parse.parse_args()
+
+	load_args = {'version': args.version, 'jobs': args.jobs, 'reader': args.reader, 'cache': not args.no_cache,
+				'cache_dir': args.cache_dir, 'spill_dir': args.spill_dir, 'quantile_error': args.quantile_error}
+	runs = [['A', args.directory_a, args.timestamp_a], ['B', args.directory_b, args.timestamp_b]]
+
+	results = []
+	for name, dirname, timestamp in runs:
+		print(f'Analysing run {name}: directory {dirname}, timestamp {timestamp}...\t\t', end="", flush=True)
+		try:
+			traces = fapi.forma_load(dirname, timestamp, **load_args)
+			results.append(fapi.forma_analyze(traces, ranks=args.ranks, windows=args.windows, epochs=args.epoch_range))
+		except FormaError as e:
+			print(f'\n{e}')
+			sys.exit(2)
+		print('Done.')
+
+	start = time.perf_counter()
+	try:
+		tables = forma_compare(*results, args.alpha, args.min_change)
+	except FormaError as e:
+		print(e)
+		sys.exit(2)
+	elapsed = time.perf_counter() - start
+
+	print('\n')
+	for (name, dirname, timestamp), run_results in zip(runs, results):
+		print(f'-- run {name}: {run_results.ranks} ranks, {run_results.wins} windows, {sum([run_results.callcounts[n] for n in fapi.callcount_names[:4]])} RMA ops ({dirname}, {timestamp})')
+	if results[0].ranks != results[1].ranks or results[0].wins != results[1].wins:
+		print('-- ranks and windows are compared by id, up to the ones of the smaller run')
+	print(f'-- significant: p-value (of the means of epochs) below {args.alpha} and change of at least {100*args.min_change:g}%; times in nsec\n')
+
+	forma_print_compare_table('Per Opcode', None, tables['opcodes'], True)
+	forma_print_compare_table('Per Window', 'window', tables['windows'], args.all)
+	forma_print_compare_table('Per Rank', 'rank', tables['ranks'], args.all)
+
+	print(f'Runs compared in {elapsed:.3f} sec.')
+
+	if args.output is not None:
+		try:
+			os.makedirs(args.output, exist_ok=True)
+			for name in compare_tables:
+				fe.forma_write_csv(os.path.join(args.output, f'compare_{name}.csv'), tables[name])
+		except OSError as e:
+			print(f'Could not write comparison tables: {e}')
+			sys.exit(2)
+		print(f'\nComparison tables can be found in directory {args.output}')
+
+
+if __name__ == "__main__":
+	main()
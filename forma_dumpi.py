@@ -0,0 +1,520 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import itertools
+import os
+import struct
+
+import numpy as np
+
+
+## foRMA native reader of SST Dumpi trace files. Instead of having libundumpi 
+## call back into Python (through ctypes) for every record of the trace, the 
+## whole trace file is read at once, the boundaries of its records are found 
+## by a single pass over the stream, and the fields of the records that foRMA 
+## tracks are then decoded in bulk into NumPy arrays. What the callbacks of 
+## FormaIMTrace do with these records is done by read_native() of the trace 
+## classes (cf. forma_trace.py).
+##
+## A trace file (all integers big-endian) ends with an index of 8 64-bit 
+## words: [ magic, datatype sizes, ?, ?, header, body, footer, ? ] offsets. 
+## The stream of records starts 8 Bytes after the body offset and each record 
+## is laid out as follows:
+##
+##     u16 function id | u8 config mask | [u16 thread]      (if mask & 0x40)
+##     [cpu time]  (if mask & 0x04) | [wall time]  (if mask & 0x08) | payload
+##
+## where a time is (u16 sec, u32 nsec) for start and then for stop, and the 
+## payload holds the arguments of the MPI call. The stream ends with the 
+## id DUMPI_END_OF_STREAM. Function ids follow the order of the callbacks 
+## of libundumpi (cf. pydumpi.callbacks), skipping id 128.
+##
+## Traces that use parts of the format that the native reader does not know 
+## about (status output, performance counters, calls with array arguments 
+## other than the ones below, no wall clock times) raise FormaDumpiUnsupported, 
+## in which case the trace is to be parsed through pydumpi instead.
+
+dumpi_magic = 0xffaadd44554d5049
+dumpi_footer_magic = 0xf007fee7
+dumpi_end_of_stream = 0x125
+
+## number of call counters in the footer, indexed by function id
+dumpi_all_functions = 291
+
+dumpi_waitall = 18
+dumpi_init = 124
+dumpi_finalize = 125
+dumpi_accumulate = 141
+dumpi_get = 142
+dumpi_put = 143
+dumpi_win_create = 145
+dumpi_win_fence = 146
+dumpi_win_free = 147
+
+## config mask bits
+dumpi_thread_bit = 0x40
+dumpi_cpu_time_bit = 0x04
+dumpi_wall_time_bit = 0x08
+
+
+class FormaDumpiUnsupported(Exception):
+	pass
+
+
+## payload layout of calls with scalar arguments only, as struct format 
+## characters ('i' int, 'H' MPI handle/16-bit id, 'B' 8-bit id, 'Q' 64-bit 
+## offset), in the order of the fields of the corresponding pydumpi.dtypes 
+## structure. Status arguments are not part of the payload, as long as 
+## status output is turned off in the config mask.
+dumpi_payload_formats = {
+	0: 'iHiiH',	## MPI_Send
+	3: 'iHiiH',	## MPI_Bsend
+	4: 'iHiiH',	## MPI_Ssend
+	5: 'iHiiH',	## MPI_Rsend
+	6: 'i',	## MPI_Buffer_attach
+	7: 'i',	## MPI_Buffer_detach
+	8: 'iHiiHi',	## MPI_Isend
+	9: 'iHiiHi',	## MPI_Ibsend
+	10: 'iHiiHi',	## MPI_Issend
+	11: 'iHiiHi',	## MPI_Irsend
+	12: 'iHiiHi',	## MPI_Irecv
+	15: 'i',	## MPI_Request_free
+	24: 'i',	## MPI_Cancel
+	26: 'iHiiHi',	## MPI_Send_init
+	27: 'iHiiHi',	## MPI_Bsend_init
+	28: 'iHiiHi',	## MPI_Ssend_init
+	29: 'iHiiHi',	## MPI_Rsend_init
+	30: 'iHiiHi',	## MPI_Recv_init
+	31: 'i',	## MPI_Start
+	35: 'iHH',	## MPI_Type_contiguous
+	36: 'iiiHH',	## MPI_Type_vector
+	37: 'iiiHH',	## MPI_Type_hvector
+	41: 'i',	## MPI_Address
+	42: 'Hi',	## MPI_Type_extent
+	43: 'Hi',	## MPI_Type_size
+	44: 'Hi',	## MPI_Type_lb
+	45: 'Hi',	## MPI_Type_ub
+	46: 'H',	## MPI_Type_commit
+	47: 'H',	## MPI_Type_free
+	49: 'iHiiiH',	## MPI_Pack
+	50: 'iiiiHH',	## MPI_Unpack
+	51: 'iHHi',	## MPI_Pack_size
+	52: 'H',	## MPI_Barrier
+	53: 'iHiH',	## MPI_Bcast
+	58: 'iHiHH',	## MPI_Allgather
+	60: 'iHiHH',	## MPI_Alltoall
+	62: 'iHBiH',	## MPI_Reduce
+	63: 'iB',	## MPI_Op_create
+	64: 'B',	## MPI_Op_free
+	65: 'iHBH',	## MPI_Allreduce
+	67: 'iHBH',	## MPI_Scan
+	68: 'Hi',	## MPI_Group_size
+	69: 'Hi',	## MPI_Group_rank
+	71: 'HHB',	## MPI_Group_compare
+	72: 'HH',	## MPI_Comm_group
+	73: 'HHH',	## MPI_Group_union
+	74: 'HHH',	## MPI_Group_intersection
+	75: 'HHH',	## MPI_Group_difference
+	80: 'H',	## MPI_Group_free
+	81: 'Hi',	## MPI_Comm_size
+	82: 'Hi',	## MPI_Comm_rank
+	83: 'HHB',	## MPI_Comm_compare
+	84: 'HH',	## MPI_Comm_dup
+	85: 'HHH',	## MPI_Comm_create
+	86: 'HiiH',	## MPI_Comm_split
+	87: 'H',	## MPI_Comm_free
+	88: 'Hi',	## MPI_Comm_test_inter
+	89: 'Hi',	## MPI_Comm_remote_size
+	90: 'HH',	## MPI_Comm_remote_group
+	91: 'HiHiiH',	## MPI_Intercomm_create
+	92: 'HiH',	## MPI_Intercomm_merge
+	93: 'H',	## MPI_Keyval_create
+	94: 'H',	## MPI_Keyval_free
+	95: 'Hi',	## MPI_Attr_put
+	96: 'Hii',	## MPI_Attr_get
+	97: 'Hi',	## MPI_Attr_delete
+	98: 'HB',	## MPI_Topo_test
+	102: 'Hii',	## MPI_Graphdims_get
+	104: 'Hi',	## MPI_Cartdim_get
+	108: 'Hii',	## MPI_Graph_neighbors_count
+	110: 'Hiiii',	## MPI_Cart_shift
+	115: 'ii',	## MPI_Get_version
+	116: 'H',	## MPI_Errhandler_create
+	117: 'HH',	## MPI_Errhandler_set
+	118: 'HH',	## MPI_Errhandler_get
+	119: 'H',	## MPI_Errhandler_free
+	121: 'ii',	## MPI_Error_class
+	122: '',	## MPI_Wtime
+	123: '',	## MPI_Wtick
+	125: '',	## MPI_Finalize
+	126: 'i',	## MPI_Initialized
+	127: 'Hi',	## MPI_Abort
+	132: 'H',	## MPI_Comm_disconnect
+	133: 'H',	## MPI_Comm_get_parent
+	134: 'iH',	## MPI_Comm_join
+	141: 'iHiiiHBH',	## MPI_Accumulate
+	142: 'iHiiiHH',	## MPI_Get
+	143: 'iHiiiHH',	## MPI_Put
+	144: 'H',	## MPI_Win_complete
+	145: 'iiHHH',	## MPI_Win_create
+	146: 'BH',	## MPI_Win_fence
+	147: 'H',	## MPI_Win_free
+	148: 'HH',	## MPI_Win_get_group
+	149: 'BiBH',	## MPI_Win_lock
+	150: 'HBH',	## MPI_Win_post
+	151: 'HBH',	## MPI_Win_start
+	152: 'Hi',	## MPI_Win_test
+	153: 'iH',	## MPI_Win_unlock
+	154: 'H',	## MPI_Win_wait
+	156: 'iHBH',	## MPI_Exscan
+	157: 'i',	## MPI_Add_error_class
+	158: 'ii',	## MPI_Add_error_code
+	160: 'Hi',	## MPI_Comm_call_errhandler
+	161: 'H',	## MPI_Comm_create_keyval
+	162: 'HH',	## MPI_Comm_delete_attr
+	163: 'H',	## MPI_Comm_free_keyval
+	164: 'HHi',	## MPI_Comm_get_attr
+	166: 'HH',	## MPI_Comm_set_attr
+	168: 'Hi',	## MPI_File_call_errhandler
+	169: 'i',	## MPI_Grequest_complete
+	170: 'i',	## MPI_Grequest_start
+	172: 'i',	## MPI_Is_thread_main
+	173: 'B',	## MPI_Query_thread
+	176: 'H',	## MPI_Type_create_keyval
+	177: 'HH',	## MPI_Type_delete_attr
+	178: 'HH',	## MPI_Type_dup
+	179: 'H',	## MPI_Type_free_keyval
+	180: 'HHi',	## MPI_Type_get_attr
+	182: 'HiiiB',	## MPI_Type_get_envelope
+	184: 'HH',	## MPI_Type_set_attr
+	186: 'BiH',	## MPI_Type_match_size
+	187: 'Hi',	## MPI_Win_call_errhandler
+	188: 'H',	## MPI_Win_create_keyval
+	189: 'HH',	## MPI_Win_delete_attr
+	190: 'H',	## MPI_Win_free_keyval
+	191: 'HHi',	## MPI_Win_get_attr
+	193: 'HH',	## MPI_Win_set_attr
+	195: 'iH',	## MPI_Alloc_mem
+	196: 'H',	## MPI_Comm_create_errhandler
+	197: 'HH',	## MPI_Comm_get_errhandler
+	198: 'HH',	## MPI_Comm_set_errhandler
+	199: 'H',	## MPI_File_create_errhandler
+	200: 'HH',	## MPI_File_get_errhandler
+	201: 'HH',	## MPI_File_set_errhandler
+	202: 'i',	## MPI_Finalized
+	204: 'i',	## MPI_Get_address
+	205: 'H',	## MPI_Info_create
+	207: 'HH',	## MPI_Info_dup
+	208: 'H',	## MPI_Info_free
+	210: 'Hi',	## MPI_Info_get_nkeys
+	219: 'iiiHH',	## MPI_Type_create_hvector
+	221: 'HiiH',	## MPI_Type_create_resized
+	224: 'Hii',	## MPI_Type_get_extent
+	225: 'Hii',	## MPI_Type_get_true_extent
+	227: 'H',	## MPI_Win_create_errhandler
+	228: 'HH',	## MPI_Win_get_errhandler
+	229: 'HH',	## MPI_Win_set_errhandler
+	231: 'H',	## MPI_File_close
+	233: 'Hq',	## MPI_File_set_size
+	234: 'Hq',	## MPI_File_preallocate
+	235: 'Hq',	## MPI_File_get_size
+	236: 'HH',	## MPI_File_get_group
+	237: 'HB',	## MPI_File_get_amode
+	238: 'HH',	## MPI_File_set_info
+	239: 'HH',	## MPI_File_get_info
+	246: 'HqiHi',	## MPI_File_iread_at
+	247: 'HqiHi',	## MPI_File_iwrite_at
+	252: 'HiHi',	## MPI_File_iread
+	253: 'HiHi',	## MPI_File_iwrite
+	254: 'HqB',	## MPI_File_seek
+	255: 'Hq',	## MPI_File_get_position
+	256: 'Hqq',	## MPI_File_get_byte_offset
+	259: 'HiHi',	## MPI_File_iread_shared
+	260: 'HiHi',	## MPI_File_iwrite_shared
+	263: 'HqB',	## MPI_File_seek_shared
+	264: 'Hq',	## MPI_File_get_position_shared
+	265: 'HqiH',	## MPI_File_read_at_all_begin
+	267: 'HqiH',	## MPI_File_write_at_all_begin
+	269: 'HiH',	## MPI_File_read_all_begin
+	271: 'HiH',	## MPI_File_write_all_begin
+	273: 'HiH',	## MPI_File_read_ordered_begin
+	275: 'HiH',	## MPI_File_write_ordered_begin
+	277: 'HHi',	## MPI_File_get_type_extent
+	279: 'Hi',	## MPI_File_set_atomicity
+	280: 'Hi',	## MPI_File_get_atomicity
+	281: 'H',	## MPI_File_sync
+}
+
+## fields of the tracked calls, as (name, format) pairs in payload order
+dumpi_tracked_fields = {
+	dumpi_accumulate: [('origincount', 'i'), ('origintype', 'H'), ('targetrank', 'i'), ('targetdisp', 'i'), 
+						('targetcount', 'i'), ('targettype', 'H'), ('op', 'B'), ('win', 'H')],
+	dumpi_get: [('origincount', 'i'), ('origintype', 'H'), ('targetrank', 'i'), ('targetdisp', 'i'), 
+				('targetcount', 'i'), ('targettype', 'H'), ('win', 'H')],
+	dumpi_put: [('origincount', 'i'), ('origintype', 'H'), ('targetrank', 'i'), ('targetdisp', 'i'), 
+				('targetcount', 'i'), ('targettype', 'H'), ('win', 'H')],
+	dumpi_win_create: [('size', 'i'), ('dispunit', 'i'), ('info', 'H'), ('comm', 'H'), ('win', 'H')],
+	dumpi_win_fence: [('assertion', 'B'), ('win', 'H')],
+	dumpi_win_free: [('win', 'H')] }
+
+
+def forma_dumpi_header_size(mask):
+
+	""" returns the size of the record header for config mask, or None if 
+		records with this mask are not supported
+	"""
+
+	if mask & ~(dumpi_thread_bit | dumpi_cpu_time_bit | dumpi_wall_time_bit):
+		return None
+	if not mask & dumpi_wall_time_bit:
+		return None
+
+	return 3 + (2 if mask & dumpi_thread_bit else 0) + (12 if mask & dumpi_cpu_time_bit else 0) + 12
+
+
+## size of the record header and offset of the wall clock times in it, per config mask
+dumpi_header_sizes = np.array([forma_dumpi_header_size(m) or 0 for m in range(256)], dtype=np.int64)
+dumpi_wall_time_offsets = dumpi_header_sizes - 12
+
+## whole record size, indexed by (function id << 8) | config mask, 
+## or 0 for records that are not of fixed size
+dumpi_record_sizes = [0]*((dumpi_end_of_stream+1) << 8)
+for fid, fmt in dumpi_payload_formats.items():
+	for mask in range(256):
+		if dumpi_header_sizes[mask] > 0:
+			dumpi_record_sizes[(fid << 8) | mask] = int(dumpi_header_sizes[mask]) + struct.calcsize('>'+fmt)
+
+
+def forma_dumpi_variable_record_size(buf, pos):
+
+	""" returns the size of the record at pos, for the supported calls 
+		whose payload is not of fixed size
+	"""
+
+	fid = (buf[pos] << 8) | buf[pos+1]
+	header = forma_dumpi_header_size(buf[pos+2])
+	if header is None:
+		raise FormaDumpiUnsupported(f'config mask {buf[pos+2]:#x} of function {fid}')
+
+	p = pos + header
+	if fid == dumpi_init:
+		## int argc, followed by argc strings (int length, characters)
+		argc = struct.unpack_from('>i', buf, p)[0]
+		p += 4
+		for a in range(argc):
+			p += 4 + struct.unpack_from('>i', buf, p)[0]
+	elif fid == dumpi_waitall:
+		## int count, followed by the array of requests (int length, ints)
+		p += 4
+		p += 4 + 4*struct.unpack_from('>i', buf, p)[0]
+	else:
+		raise FormaDumpiUnsupported(f'function {fid}')
+
+	return p - pos
+
+
+## NumPy dtypes of the (big-endian) values read from the trace
+dumpi_value_dtypes = {'H': '>u2', 'I': '>u4', 'i': '>i4'}
+
+
+## number of records scanned between two progress reports
+dumpi_progress_records = 1 << 16
+
+
+## memory needed per record while a trace file is read (offset of the 
+## record in a Python list during the scan, then the per-record arrays)
+dumpi_bytes_per_record = 64
+
+
+def forma_dumpi_call_counts(tracefile):
+
+	""" returns the number of calls per function id, as found in the footer 
+		of tracefile, or None if the footer cannot be read. Unlike the footer 
+		of pydumpi (DumpiTrace.read_footer()), which names the counters after 
+		the callbacks and is thus off by one from function id 128 onwards 
+		(there is no function with id 128), counters are indexed by function id. 
+	"""
+
+	try:
+		with open(tracefile, 'rb') as f:
+			f.seek(-64, os.SEEK_END)
+			index = struct.unpack('>8Q', f.read(64))
+			if index[0] != dumpi_magic:
+				return None
+			f.seek(index[6])
+			footer = f.read(8 + 4*dumpi_all_functions)
+	except (OSError, struct.error):
+		return None
+
+	if len(footer) < 8 + 4*dumpi_all_functions or struct.unpack_from('>Q', footer)[0] != dumpi_footer_magic:
+		return None
+
+	return list(struct.unpack_from(f'>{dumpi_all_functions}i', footer, 8))
+
+
+class FormaDumpiFile:
+
+	""" a trace file, read and split into records. Fields of the records 
+		are decoded on demand and in bulk, for arrays of record indices. 
+	"""
+
+	def __init__(self, tracefile, progress=None):
+
+		## called with the number of records scanned so far, cf. forma_progress.py
+		self.progress = progress
+
+		with open(tracefile, 'rb') as f:
+			self.buf = f.read()
+		self.u8 = np.frombuffer(self.buf, dtype=np.uint8)
+
+		if len(self.buf) < 64:
+			raise FormaDumpiUnsupported('truncated trace file')
+		index = struct.unpack_from('>8Q', self.buf, len(self.buf)-64)
+		if index[0] != dumpi_magic or index[5] >= len(self.buf) or index[1] >= len(self.buf):
+			raise FormaDumpiUnsupported('no trace index')
+
+		self.type_sizes = self.read_type_sizes(index[1])
+		self.starts = self.scan(index[5]+8, index[6])
+
+		self.fids = (self.u8[self.starts].astype(np.int64) << 8) | self.u8[self.starts+1]
+		self.masks = self.u8[self.starts+2]
+		self.payloads = self.starts + dumpi_header_sizes[self.masks]
+
+
+	def read_type_sizes(self, offset):
+
+		""" returns the sizes of the MPI datatypes, as stored in the trace """
+
+		count = struct.unpack_from('>i', self.buf, offset)[0]
+		if count < 0 or offset+4+4*count > len(self.buf):
+			raise FormaDumpiUnsupported('datatype sizes')
+
+		return np.frombuffer(self.buf, dtype='>i4', count=count, offset=offset+4).astype(np.int64)
+
+
+	def scan(self, first, last):
+
+		""" returns the offsets of all records of the stream, which starts 
+			at first and has to end before last
+		"""
+
+		buf = self.buf
+		record_sizes = dumpi_record_sizes
+		from_bytes = int.from_bytes
+		starts = []
+		append = starts.append
+		pos = first
+
+		try:
+			## records are scanned in blocks, so that progress is reported 
+			## without any extra work per record
+			while True:
+				for _ in itertools.repeat(None, dumpi_progress_records):
+					## the function id and config mask of the record at once
+					size = record_sizes[from_bytes(buf[pos:pos+3], 'big')]
+					if size == 0:
+						if (buf[pos] << 8) | buf[pos+1] == dumpi_end_of_stream:
+							break
+						size = forma_dumpi_variable_record_size(buf, pos)
+					append(pos)
+					pos += size
+				else:
+					if self.progress is not None:
+						self.progress(len(starts))
+					continue
+				break
+		except (IndexError, struct.error):
+			raise FormaDumpiUnsupported(f'record at offset {pos}')
+
+		if pos >= last:
+			raise FormaDumpiUnsupported('stream overruns footer')
+
+		return np.array(starts, dtype=np.int64)
+
+
+	def records(self, fids):
+
+		""" returns the indices, in trace order, of the records of the given function ids """
+
+		return np.nonzero(np.isin(self.fids, fids))[0]
+
+
+	def read(self, offsets, fmt):
+
+		""" reads one big-endian value of format fmt at each of offsets """
+
+		if fmt == 'B':
+			return self.u8[offsets].astype(np.int64)
+
+		## gather the bytes of each value into a row, and view the rows as values
+		width = 2 if fmt == 'H' else 4
+		values = self.u8[np.asarray(offsets)[:, None] + np.arange(width)]
+
+		return values.view(dumpi_value_dtypes[fmt]).ravel().astype(np.int64)
+
+
+	def field(self, rows, name):
+
+		""" returns field name of records rows, which are all tracked calls having such a field """
+
+		offsets = np.full(dumpi_end_of_stream+1, -1, dtype=np.int64)
+		formats = set()
+		for fid, fields in dumpi_tracked_fields.items():
+			fmts = [f[1] for f in fields]
+			names = [f[0] for f in fields]
+			if name in names:
+				k = names.index(name)
+				offsets[fid] = struct.calcsize('>'+''.join(fmts[:k]))
+				formats.add(fmts[k])
+
+		field_offsets = offsets[self.fids[rows]]
+		if len(formats) != 1 or (field_offsets < 0).any():
+			raise ValueError(f'field {name} of records')
+
+		return self.read(self.payloads[rows] + field_offsets, formats.pop())
+
+
+	def wall_time(self, rows):
+
+		""" returns the wall clock start and stop times (nsec) of records rows """
+
+		offsets = self.starts[rows] + dumpi_wall_time_offsets[self.masks[rows]]
+		start = self.read(offsets, 'H')*1000000000 + self.read(offsets+2, 'I')
+		stop = self.read(offsets+6, 'H')*1000000000 + self.read(offsets+8, 'I')
+
+		return start, stop
+
+
+def forma_dumpi_duration(start, stop):
+
+	""" returns stop - start, as given by (stop - start).to_ns() on the 
+		pydumpi clocks, i.e. including its handling of negative differences
+	"""
+
+	duration = stop - start
+	negative = duration < 0
+	if negative.any():
+		d = duration[negative]
+		sec = np.trunc(d / 1e9).astype(np.int64)
+		nsec = d % 1000000000
+		nsec = np.where(sec != 0, nsec, -nsec)
+		duration[negative] = nsec + sec*1000000000
+
+	return duration
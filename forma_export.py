@@ -0,0 +1,266 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import os
+
+import numpy as np
+
+## pyarrow is only needed for the parquet and arrow formats
+try:
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+except ImportError:
+	pa = None
+
+import forma_opdata as fod
+import forma_stats as fs
+
+
+## foRMA columnar export. Writes the parsed ops (i.e. the columns of the
+## FormaOpdata store) and the statistics that the txt reports are made of
+## as tables, one file per table, so that they can be loaded by other
+## tools without parsing the traces again. A table is a dictionary of
+## equally long NumPy columns, indexed by column name. The tables are:
+##
+##   ops          : one row per op, cf. FormaOpdata (fences only, in the
+##                  incremental version)
+##   ranks        : rank, exec_time
+##   rank_stats   : statistics of op durations and data transfer bounds
+##                  per rank and opcode (as in calls.txt), and the number,
+##                  mean and standard deviation of the means of their epochs
+##   rank_windows : size and durations of each window on each rank
+##   windows      : size, epochs and data volume per window
+##   epochs       : data volume and fence arrivals per epoch (as in fences.txt)
+##   epoch_stats  : statistics of op durations and data transfer bounds
+##                  per epoch and opcode (as in epochs.txt)
+##
+## Statistics that are not available (e.g. data transfer bounds of fences,
+## or medians per epoch in the incremental version) are exported as NaN.
+
+export_formats = ['parquet', 'arrow', 'csv', 'npz']
+
+export_extensions = {'parquet': '.parquet', 'arrow': '.arrow', 'csv': '.csv', 'npz': '.npz'}
+
+## names of the statistics of a group of values, cf. FormaStats
+stats_columns = ['count', 'total', 'min', 'max', 'mean', 'median', 'std', 'p90', 'p99', 'p999']
+
+epoch_stats_columns = ['count', 'total', 'min', 'max']
+
+## names of the statistics of the means of the epochs of a group of values, cf. forma_epoch_means_row()
+epoch_means_columns = ['epochs', 'epoch_mean', 'epoch_std']
+
+
+def forma_export_available(export_format):
+
+	""" returns True if the libraries needed for export_format are installed """
+
+	return export_format in ['csv', 'npz'] or pa is not None
+
+
+def forma_stats_row(values):
+
+	""" returns the values of stats_columns for values, which may be a FormaStats,
+		a FormaMoments or a vector of values, or None if there are no such values
+	"""
+
+	if values is None or len(values) == 0:
+		return [0, 0, 0, 0] + [np.nan]*6
+
+	x6 = fs.forma_calculate_stats_x6(values)
+	tail = fs.forma_calculate_stats_tail(values)
+
+	return [len(values)] + x6[:3] + [np.nan if v is None else v for v in x6[3:] + list(tail)]
+
+
+def forma_epoch_means_row(values):
+
+	""" returns the values of epoch_means_columns for values, a FormaStats or a 
+		FormaMoments, i.e. the number of epochs with values, and the mean and 
+		standard deviation of their means, or None if these are not known 
+	"""
+
+	epoch_means = getattr(values, 'epoch_means', None)
+	if epoch_means is None or epoch_means.count == 0:
+		return [0, np.nan, np.nan]
+
+	return [epoch_means.count, epoch_means.mean, np.sqrt(epoch_means.m2/epoch_means.count)]
+
+
+def forma_stats_table(keys, rows, prefix):
+
+	columns = dict(keys)
+	rows = np.array(rows, dtype=np.float64).reshape(-1, len(stats_columns))
+	for i, name in enumerate(stats_columns):
+		columns[prefix+name] = rows[:, i].astype(np.int64) if i < 4 else rows[:, i]
+
+	return columns
+
+
+def forma_export_tables(ranks, wins, opdata, total_exec_times_per_rank, all_window_sizes_per_rank,
+						all_window_durations_per_rank, per_opcode_op_durations_per_rank,
+						per_opcode_dt_bounds_per_rank, per_window_data_vol, per_epoch_data=None):
+
+	""" returns the tables to be exported, as a dictionary indexed by table name """
+
+	tables = dict()
+
+	tables['ops'] = {c[0]: getattr(opdata, c[0]) for c in fod.FormaOpdata.columns}
+
+	tables['ranks'] = {'rank': np.arange(ranks, dtype=np.int32),
+					'exec_time': np.array(total_exec_times_per_rank, dtype=np.int64).reshape(ranks)}
+
+	keys = [('rank', np.repeat(np.arange(ranks, dtype=np.int32), 4)), ('opcode', np.tile(np.arange(4, dtype=np.int8), ranks))]
+	durations = [forma_stats_row(per_opcode_op_durations_per_rank[j][i]) for j in range(ranks) for i in range(4)]
+	dt_bounds = [forma_stats_row(per_opcode_dt_bounds_per_rank[j][i] if i != 3 else None) for j in range(ranks) for i in range(4)]
+	tables['rank_stats'] = forma_stats_table(keys, durations, 'duration_')
+	tables['rank_stats'].update(forma_stats_table([], dt_bounds, 'dtbound_'))
+	for prefix, stats in [('duration_', per_opcode_op_durations_per_rank), ('dtbound_', per_opcode_dt_bounds_per_rank)]:
+		epoch_means = np.array([forma_epoch_means_row(stats[j][i] if i < len(stats[j]) else None) for j in range(ranks) for i in range(4)], dtype=np.float64).reshape(-1, 3)
+		for i, name in enumerate(epoch_means_columns):
+			tables['rank_stats'][prefix+name] = epoch_means[:, i].astype(np.int64) if i == 0 else epoch_means[:, i]
+
+	window_durations = np.array(all_window_durations_per_rank, dtype=np.int64).reshape(ranks*wins, 3)
+	tables['rank_windows'] = {'rank': np.repeat(np.arange(ranks, dtype=np.int32), wins),
+							'window': np.tile(np.arange(wins, dtype=np.int32), ranks),
+							'size': np.array(all_window_sizes_per_rank, dtype=np.int64).reshape(ranks*wins),
+							'create_duration': window_durations[:, 0],
+							'lifetime': window_durations[:, 1],
+							'free_duration': window_durations[:, 2]}
+
+	epochs_per_window = np.array(opdata.epochs_per_window[0] if ranks > 0 else [], dtype=np.int32).reshape(wins)
+	tables['windows'] = {'window': np.arange(wins, dtype=np.int32),
+						'size': tables['rank_windows']['size'][:wins],
+						'epochs': epochs_per_window,
+						'data_volume': np.array(per_window_data_vol, dtype=np.int64).reshape(wins)}
+
+	## per epoch data, cf. fs.forma_per_epoch_data() and fs.forma_fence_stragglers()
+	if per_epoch_data is None:
+		per_epoch_data = fs.forma_break_down_per_epoch(wins, opdata)
+	fence_rows = opdata.fence_rows(ranks, wins)
+	fence_starts = opdata.start[fence_rows]
+
+	epochs = {name: [] for name in ['window', 'epoch', 'data_volume', 'fence_first', 'fence_first_rank', 'fence_last', 'fence_last_rank', 'fence_skew']}
+	epoch_stats = {name: [] for name in ['window', 'epoch', 'opcode'] + ['duration_'+s for s in epoch_stats_columns] + ['dtbound_'+s for s in epoch_stats_columns]}
+
+	for win_id in range(wins):
+		win_total_epochs = int(epochs_per_window[win_id])
+		dt_bounds, durations, data_vol = per_epoch_data[win_id]
+		first, first_rank, last, last_rank, skew = fs.forma_fence_stragglers(fence_starts[:, win_id, :win_total_epochs])[1:]
+
+		epochs['window'].append(np.full(win_total_epochs, win_id, dtype=np.int32))
+		epochs['epoch'].append(np.arange(win_total_epochs, dtype=np.int32))
+		epochs['data_volume'].append(np.asarray(data_vol, dtype=np.int64))
+		for name, values in zip(['fence_first', 'fence_first_rank', 'fence_last', 'fence_last_rank', 'fence_skew'], [first, first_rank, last, last_rank, skew]):
+			epochs[name].append(np.asarray(values, dtype=np.int32 if name.endswith('rank') else np.int64))
+
+		epoch_stats['window'].append(np.full(win_total_epochs*4, win_id, dtype=np.int32))
+		epoch_stats['epoch'].append(np.repeat(np.arange(win_total_epochs, dtype=np.int32), 4))
+		epoch_stats['opcode'].append(np.tile(np.arange(4, dtype=np.int8), win_total_epochs))
+		for i, name in enumerate(epoch_stats_columns):
+			epoch_stats['duration_'+name].append(np.asarray(durations[i], dtype=np.int64).reshape(-1))
+			## no data transfer bounds for fences
+			dt_bound = np.zeros((win_total_epochs, 4), dtype=np.int64)
+			dt_bound[:, :3] = dt_bounds[i]
+			epoch_stats['dtbound_'+name].append(dt_bound.reshape(-1))
+
+	tables['epochs'] = {name: np.concatenate(c) if c else np.zeros(0, dtype=np.int64) for name, c in epochs.items()}
+	tables['epoch_stats'] = {name: np.concatenate(c) if c else np.zeros(0, dtype=np.int64) for name, c in epoch_stats.items()}
+
+	return tables
+
+
+def forma_table_chunks(columns):
+
+	""" yields consecutive slices of (at most) FormaOpdata.chunk_rows rows of the
+		table columns, so that tables backed by memory maps (out-of-core version)
+		are not read at once
+	"""
+
+	rows = len(next(iter(columns.values()))) if columns else 0
+
+	for first in range(0, max(rows, 1), fod.FormaOpdata.chunk_rows):
+		yield {name: c[first:first+fod.FormaOpdata.chunk_rows] for name, c in columns.items()}
+
+
+def forma_write_parquet(filename, columns):
+
+	writer = None
+	for chunk in forma_table_chunks(columns):
+		table = pa.table({name: pa.array(np.asarray(c)) for name, c in chunk.items()})
+		if writer is None:
+			writer = pq.ParquetWriter(filename, table.schema)
+		writer.write_table(table)
+	writer.close()
+
+
+def forma_write_arrow(filename, columns):
+
+	""" writes columns as an Arrow IPC file, which can be memory-mapped and
+		read without copying (e.g. with pyarrow.ipc.open_file(pyarrow.memory_map(filename)))
+	"""
+
+	with pa.OSFile(filename, 'wb') as sink:
+		writer = None
+		for chunk in forma_table_chunks(columns):
+			batch = pa.record_batch([pa.array(np.asarray(c)) for c in chunk.values()], names=list(chunk.keys()))
+			if writer is None:
+				writer = pa.ipc.new_file(sink, batch.schema)
+			writer.write_batch(batch)
+		writer.close()
+
+
+def forma_write_csv(filename, columns):
+
+	""" writes columns as comma-separated values, with a header line. Values 
+		are converted to text column by column (floats in their shortest 
+		round-trip representation), which is much faster than row by row. 
+	"""
+
+	with open(filename, 'w') as f:
+		f.write(','.join(columns.keys()) + '\n')
+		for chunk in forma_table_chunks(columns):
+			text = [np.asarray(c).astype(str).tolist() for c in chunk.values()]
+			if text and len(text[0]) > 0:
+				f.write('\n'.join([','.join(row) for row in zip(*text)]) + '\n')
+
+
+def forma_write_npz(filename, columns):
+
+	np.savez(filename, **columns)
+
+
+def forma_export(export_format, export_dir, tables):
+
+	""" writes each of tables to export_dir, in file <table name>.<export_format>.
+		Returns the list of files written.
+	"""
+
+	writers = {'parquet': forma_write_parquet, 'arrow': forma_write_arrow,
+				'csv': forma_write_csv, 'npz': forma_write_npz}
+
+	os.makedirs(export_dir, exist_ok=True)
+
+	filenames = []
+	for name, columns in tables.items():
+		filename = os.path.join(export_dir, name + export_extensions[export_format])
+		writers[export_format](filename, columns)
+		filenames.append(filename)
+
+	return filenames
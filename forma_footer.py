@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import argparse
+import sys
+import glob, os
+
+from multiprocessing.pool import ThreadPool
+
+from pydumpi.callbacks import DumpiCallbacks
+
+import forma_dumpi as fdr
+
+
+## foRMA footer scanner. Reads the call counts of the footers of the trace
+## files of an execution (cf. forma_dumpi_call_counts()), without decoding
+## their records, and sums them up per MPI function. Footers are small, so
+## they are read by a pool of threads, each trace file once, whichever the
+## number of functions asked for.
+##
+## Also usable from the command line, as a replacement of footer_reader.sh:
+##
+##   forma_footer.py <calls file> <trace dir> <timestamp> <results file>
+##
+## reads the names of the MPI functions to count from <calls file> (one per
+## line, lines starting with # are skipped) and appends a line
+## "footer_reader: <name> : <total>" per function to <results file>.
+
+## number of trace file footers read at the same time
+footer_scan_threads = 16
+
+## name of the MPI function of each function id, after the callbacks of
+## libundumpi (e.g. on_win_fence -> MPI_Win_fence), which skip id 128
+footer_function_names = ['MPI_' + name[len('on_'):].capitalize() for name, _ in DumpiCallbacks._fields_]
+footer_function_names = footer_function_names[:128] + [None] + footer_function_names[128:]
+
+
+def forma_footer_fid(name):
+
+	""" returns the function id of the MPI function name (e.g. MPI_Win_fence,
+		case insensitive), or None if there is no such function
+	"""
+
+	names = [n.lower() if n is not None else None for n in footer_function_names]
+	if name.lower() not in names:
+		return None
+
+	return names.index(name.lower())
+
+
+def forma_footer_scan(tracefiles, threads=footer_scan_threads):
+
+	""" returns the call counts found in the footer of each of tracefiles,
+		indexed by function id (None where the footer cannot be read)
+	"""
+
+	if len(tracefiles) < 2 or threads < 2:
+		return [fdr.forma_dumpi_call_counts(tf) for tf in tracefiles]
+
+	with ThreadPool(min(len(tracefiles), threads)) as pool:
+		return pool.map(fdr.forma_dumpi_call_counts, tracefiles)
+
+
+def forma_footer_totals(call_counts_per_rank, fids):
+
+	""" returns the total number of calls of each of function ids fids, over
+		call_counts_per_rank (as returned by forma_footer_scan()), skipping
+		footers that could not be read
+	"""
+
+	return [sum([call_counts[fid] for call_counts in call_counts_per_rank if call_counts is not None and fid < len(call_counts)]) for fid in fids]
+
+
+def main():
+
+	forma_footer_arg_parse = argparse.ArgumentParser(description="foRMA footer scanner -- sums up the call counts of the given MPI functions over the footers of the trace files of an execution.")
+	forma_footer_arg_parse.add_argument("calls", help="File with the names of the MPI functions to count, one per line (lines starting with # are skipped).", type=str)
+	forma_footer_arg_parse.add_argument("directory", help="Specifies the path to the directory in which the tracefiles are located.", type=str)
+	forma_footer_arg_parse.add_argument("timestamp", help="Specifies the timestamp that makes up the filenames of the tracefiles.", type=str)
+	forma_footer_arg_parse.add_argument("results", help="File to which the totals are appended.", type=str)
+	forma_footer_arg_parse.add_argument("--threads", help=f"Number of footers read at the same time (default: {footer_scan_threads}).", type=int, default=footer_scan_threads)
+
+	args = forma_footer_arg_parse.parse_args()
+
+	try:
+		with open(args.calls) as f:
+			names = [line.split()[0] for line in f if line.strip() and not line.startswith('#')]
+	except OSError as e:
+		print(f'Could not read file of calls: {e}')
+		sys.exit(2)
+
+	fids = [forma_footer_fid(name) for name in names]
+	for name, fid in zip(names, fids):
+		if fid is None:
+			print(f'Unknown MPI function: {name}')
+			sys.exit(2)
+
+	tracefiles = sorted(glob.glob(os.path.join(args.directory, f'dumpi-{args.timestamp}-*.bin')))
+	if not tracefiles:
+		print(f'No trace files with timestamp {args.timestamp} found in directory {args.directory}.')
+		sys.exit(2)
+
+	call_counts_per_rank = forma_footer_scan(tracefiles, args.threads)
+	for tf, call_counts in zip(tracefiles, call_counts_per_rank):
+		if call_counts is None:
+			print(f'Could not read the footer of trace file {tf}, skipping it.', file=sys.stderr)
+
+	with open(args.results, 'a') as f:
+		for name, total in zip(names, forma_footer_totals(call_counts_per_rank, fids)):
+			f.write(f'footer_reader: {name} : {total}\n')
+
+
+if __name__ == "__main__":
+	main()
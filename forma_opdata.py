@@ -0,0 +1,324 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import os
+import array
+
+import numpy as np
+
+
+## foRMA columnar opdata store. Instead of keeping every RMA op as a
+## 5-element list nested in opdata_per_rank[rank][win][epoch][op], all
+## ops of the execution are kept in one typed column per field
+## (struct-of-arrays). Row i of the store corresponds to the old
+##
+##     [ opcode[i], start[i], duration[i], bytes[i], targetrank[i] ]
+##
+## with rank[i], window[i] and epoch[i] giving its position in the old
+## nested lists. The opcode convention is the usual one:
+## 0 - MPI_Get, 1 - MPI_Put, 2 - MPI_Acc, 3 - MPI_Win_fence
+## and, as before, for MPI_Win_fence the bytes column holds the wall clock
+## time at which the fence was exited. dtbound is filled in by
+## forma_calculate_dt_bounds().
+##
+## Rows are kept sorted by (rank, window, epoch) and, within an epoch, in
+## trace order, so that the closing fence is the last row of every epoch.
+## Only ops of closed epochs are kept, i.e. the ops that follow the last
+## fence on a window (the trailing empty epoch of the nested lists) are
+## dropped, since they are never taken into account by the analysis.
+
+class FormaOpdata:
+
+	## column name, numpy dtype and array.array typecode of the per-rank
+	## buffers that FormaIMTrace fills while parsing
+	columns = [ ('opcode', np.int8, 'b'),
+				('start', np.int64, 'q'),
+				('duration', np.int64, 'q'),
+				('bytes', np.int64, 'q'),
+				('targetrank', np.int32, 'i'),
+				('dtbound', np.int64, 'q'),
+				('rank', np.int32, 'i'),
+				('window', np.int32, 'i'),
+				('epoch', np.int32, 'i') ]
+
+	## in-memory cost of a single op across all columns
+	bytes_per_op = sum([np.dtype(c[1]).itemsize for c in columns])
+
+	## columns filled by the trace callbacks; dtbound and rank are only
+	## set once the rank's buffers are turned into a store
+	buffer_columns = ['opcode', 'start', 'duration', 'bytes', 'targetrank', 'window', 'epoch']
+
+	## number of rows processed at a time by passes over the whole store,
+	## so that out-of-core (memory-mapped) columns are never read at once
+	chunk_rows = 1 << 22
+
+
+	def __init__(self, columns=None, epochs_per_window=None):
+
+		for name, dtype, typecode in FormaOpdata.columns:
+			if columns is not None and name in columns:
+				setattr(self, name, np.ascontiguousarray(columns[name], dtype=dtype))
+			else:
+				setattr(self, name, np.zeros(0, dtype=dtype))
+
+		## one list per rank, holding the number of (closed) epochs per window
+		if epochs_per_window is None:
+			epochs_per_window = []
+		self.epochs_per_window = epochs_per_window
+
+		## orders that sort columns, indexed by column name (cf. value_order())
+		self.value_orders = dict()
+
+
+	def __len__(self):
+		return len(self.opcode)
+
+
+	@property
+	def nbytes(self):
+		return sum([getattr(self, c[0]).nbytes for c in FormaOpdata.columns])
+
+
+	@staticmethod
+	def new_buffers(rows=0):
+
+		""" returns the typed buffers that the trace callbacks fill in, as 
+			a dictionary indexed by column name. The buffers are preallocated 
+			for rows ops (e.g. as counted in the footer of the trace), so that 
+			they are filled in by index instead of growing op by op. 
+		"""
+
+		return {c[0]: array.array(c[2], bytes(rows*np.dtype(c[1]).itemsize)) 
+				for c in FormaOpdata.columns if c[0] in FormaOpdata.buffer_columns}
+
+
+	@staticmethod
+	def grow_buffers(buffers, rows):
+
+		""" makes room for (at least) rows ops in buffers, doubling their size, 
+			in case the ops of a trace are more than the ones preallocated
+		"""
+
+		for name, dtype, typecode in FormaOpdata.columns:
+			if name in buffers:
+				buf = buffers[name]
+				buf.frombytes(bytes(max(rows-len(buf), len(buf), 1024)*buf.itemsize))
+
+
+	@staticmethod
+	def parse_bytes(rows):
+
+		""" returns an estimate of the peak memory needed while the ops of 
+			a rank are parsed (buffers, then the store of the rank)
+		"""
+
+		buffer_bytes = sum([np.dtype(c[1]).itemsize for c in FormaOpdata.columns if c[0] in FormaOpdata.buffer_columns])
+
+		return rows * (2*buffer_bytes + FormaOpdata.bytes_per_op)
+
+
+	@classmethod
+	def from_buffers(cls, buffers, epochcount_per_window, rows=None):
+
+		""" creates the store for a single rank out of the buffers filled
+			by the callbacks of FormaIMTrace, of which only the first rows 
+			are in use (all of them if rows is None). epochcount_per_window 
+			holds the number of closed epochs per window of the rank. The rank
+			column is set when the stores of all ranks are concatenated.
+		"""
+
+		columns = {}
+		for name, dtype, typecode in cls.columns:
+			if name in buffers:
+				columns[name] = np.frombuffer(buffers[name], dtype=dtype)[:rows]
+
+		## drop ops that do not belong to a closed epoch (cf. comment on top)
+		epochs = np.array(list(epochcount_per_window)+[0], dtype=np.int32)
+		window = columns['window']
+		epoch = columns['epoch']
+		if len(window) > 0:
+			keep = (epoch >= 0) & (epoch < epochs[window])
+		else:
+			keep = np.zeros(0, dtype=bool)
+
+		## stable sort, so that ops of the same epoch stay in trace order
+		order = np.lexsort((epoch[keep], window[keep]))
+		for name in columns:
+			columns[name] = columns[name][keep][order]
+
+		columns['rank'] = np.zeros(len(order), dtype=np.int32)
+		columns['dtbound'] = np.zeros(len(order), dtype=np.int64)
+
+		return cls(columns, [list(epochcount_per_window)])
+
+
+	@classmethod
+	def concatenate(cls, stores):
+
+		""" merges the stores of individual ranks, given in rank order,
+			into the store of the whole execution
+		"""
+
+		epochs_per_window = []
+		for rank, s in enumerate(stores):
+			s.rank[:] = rank
+			epochs_per_window += s.epochs_per_window
+
+		columns = {}
+		if stores:
+			for name, dtype, typecode in cls.columns:
+				columns[name] = np.concatenate([getattr(s, name) for s in stores])
+
+		return cls(columns, epochs_per_window)
+
+
+	def chunks(self):
+
+		""" yields consecutive slices of (at most) chunk_rows rows, which
+			cover the whole store
+		"""
+
+		for first in range(0, len(self), FormaOpdata.chunk_rows):
+			yield slice(first, min(first+FormaOpdata.chunk_rows, len(self)))
+
+
+	def epoch_chunks(self):
+
+		""" yields consecutive slices of about chunk_rows rows, which cover the 
+			whole store, as chunks() does, except that the ops of an epoch of 
+			a rank are never split across slices 
+		"""
+
+		first = 0
+		for chunk in self.chunks():
+			last = chunk.stop
+			if last < len(self):
+				## rows are sorted by (rank, window, epoch): the slice ends where 
+				## the last epoch that starts in it does, up to the next row
+				rows = slice(first, last+1)
+				rank, window, epoch = self.rank[rows], self.window[rows], self.epoch[rows]
+				starts = np.nonzero((rank[1:] != rank[:-1]) | (window[1:] != window[:-1]) | (epoch[1:] != epoch[:-1]))[0]
+				if len(starts) == 0:
+					continue
+				last = first + int(starts[-1]) + 1
+			yield slice(first, last)
+			first = last
+
+
+	def rank_rows(self, rank):
+
+		""" returns the (contiguous) slice of rows that belong to rank """
+
+		first, last = np.searchsorted(self.rank, [rank, rank+1])
+		return slice(first, last)
+
+
+	def rows_per_epoch(self, win_id, epochs):
+
+		""" returns one array of row indices per epoch of window win_id,
+			holding the ops of all ranks for that epoch, in rank order
+		"""
+
+		win_rows = np.nonzero(self.window == win_id)[0]
+		win_rows = win_rows[np.argsort(self.epoch[win_rows], kind='stable')]
+		bounds = np.searchsorted(self.epoch[win_rows], np.arange(max(epochs, 0)+1))
+
+		return [win_rows[bounds[k]:bounds[k+1]] for k in range(max(epochs, 0))]
+
+
+	def value_order(self, name):
+
+		""" returns the order that sorts column name, which is calculated 
+			once and then shared by all statistics on that column. For dtbound, 
+			which is not used for fences, it is the order of dtbound[opcode != 3]. 
+			Has to be invalidated (removed from value_orders) whenever the 
+			column changes. 
+		"""
+
+		if name not in self.value_orders:
+			values = getattr(self, name)
+			if name == 'dtbound':
+				values = values[self.opcode != 3]
+			self.value_orders[name] = np.argsort(values)
+
+		return self.value_orders[name]
+
+
+	def fence_rows(self, ranks, wins):
+
+		""" returns a ranks x wins x epochs matrix with the row index of the
+			fence that closes each epoch of each window on each rank,
+			or -1 where no such epoch exists
+		"""
+
+		max_epochs = max([max(e, default=0) for e in self.epochs_per_window], default=0)
+		fences = np.full((ranks, wins, max(max_epochs, 0)), -1, dtype=np.int64)
+
+		for chunk in self.chunks():
+			rows = np.nonzero(self.opcode[chunk] == 3)[0] + chunk.start
+			fences[self.rank[rows], self.window[rows], self.epoch[rows]] = rows
+
+		return fences
+
+
+
+## Out-of-core version of the store. The columns of each rank are spilled 
+## to one file per column in spill_dir as soon as the rank is parsed, and 
+## the store of the whole execution is then made up of read/write memory 
+## maps of these files, so that it does not have to fit in memory. 
+
+class FormaOpdataSpill:
+
+	def __init__(self, spill_dir):
+
+		self.spill_dir = spill_dir
+		self.rows = 0
+		self.epochs_per_window = []
+		self.files = {c[0]: open(os.path.join(spill_dir, c[0]+'.bin'), 'wb') for c in FormaOpdata.columns}
+
+
+	def append(self, rank, opdata):
+
+		""" writes the store of rank (ranks are appended in rank order) """
+
+		opdata.rank[:] = rank
+		for name, dtype, typecode in FormaOpdata.columns:
+			getattr(opdata, name).tofile(self.files[name])
+		self.rows += len(opdata)
+		self.epochs_per_window += opdata.epochs_per_window
+
+
+	def close(self):
+
+		""" returns the store of the whole execution, backed by the spill files """
+
+		for f in self.files.values():
+			f.close()
+
+		columns = {}
+		if self.rows > 0:
+			for name, dtype, typecode in FormaOpdata.columns:
+				columns[name] = np.memmap(os.path.join(self.spill_dir, name+'.bin'), dtype=dtype, mode='r+', shape=(self.rows,))
+
+		opdata = FormaOpdata(None, self.epochs_per_window)
+		for name in columns:
+			setattr(opdata, name, columns[name])
+
+		return opdata
@@ -27,100 +27,300 @@ import fnmatch
 
 import ctypes
 
+import multiprocessing as mp
+import functools
 
 import logging
+import time
 
 from pydumpi import DumpiTrace
 
 import numpy as np
 
-from pympler import asizeof
-
 
 import forma_trace as ft
-
-
-def forma_parse_traces(tracefiles):
+import forma_opdata as fod
+import forma_dumpi as fdr
+import forma_profile as fpr
+import forma_progress as fpg
+
+
+class FormaError(Exception):
+
+	""" raised on trace files that cannot be analysed (cf. forma_api.py); 
+		the command line prints its message and exits instead 
+	"""
+
+
+## messages of the codes of forma_check_consistency()
+consistency_errors = {1: 'Inconsistency between provided trace files and number of ranks in application.', 
+					2: 'Inconsistency in nr of windows per communicator per rank.', 
+					3: 'Inconsisten nr of epochs per window across ranks.'}
+
+
+def forma_parse_rank(tracefile, incremental=False, native=True, profile=False, selection=None, fences_only=False):
+
+	""" parses the trace file of a single rank and returns the per-rank 
+		data extracted by the callbacks of FormaIMTrace, namely: 
+		[ opdata (FormaOpdata store of the rank), total_exec_time, all_window_sizes, 
+		  all_window_durations, epochcount_per_window, 
+		  callcount_per_opcode, win_count, moments, rank_profile, epoch_last_target ]
+		Raises FormaError if the trace file could not be parsed. If incremental is set, 
+		FormaINCTrace is used instead, in which case opdata only holds the 
+		fences of the rank and moments holds the running statistics of the 
+		rest of the ops (otherwise, moments is None). If native is set, the 
+		trace file is read by the native reader (cf. forma_dumpi.py) and only 
+		falls back to pydumpi if the native reader does not support it. 
+		If profile is set, rank_profile holds the wall clock time, CPU time 
+		and peak RSS of parsing the rank (cf. FormaProfile), otherwise it is None. 
+		Ops outside selection, or other than fences if fences_only is set, 
+		are dropped (cf. forma_select.py), in which case epoch_last_target 
+		holds the target rank of the last MPI_Put/MPI_Acc of each (window, epoch) 
+		of the rank, dropped or not (cf. FormaIMTrace.track_target()), 
+		otherwise epoch_last_target is None. 
+	"""
+
+	if profile:
+		fpr.forma_reset_peak_rss()
+		wall = time.perf_counter()
+		cpu = fpr.forma_cpu_time()
+
+	trace_class = ft.FormaINCTrace if incremental else ft.FormaIMTrace
+
+	## reports the records processed so far, if progress is being reported (cf. forma_progress.py)
+	progress = fpg.forma_progress_callback(tracefile)
+
+	## the call counts of the footer give the exact number of ops of the 
+	## rank, for which the buffers of the trace are preallocated
+	call_counts = fdr.forma_dumpi_call_counts(tracefile)
+
+	try:
+		trace = None
+		if native:
+			try:
+				trace = trace_class(tracefile, call_counts, progress, selection, fences_only)
+				trace.read_native()
+			except fdr.FormaDumpiUnsupported:
+				trace = None
+		if trace is None:
+			with trace_class(tracefile, call_counts, progress, selection, fences_only) as trace:
+				## keeping next line in order to remember where to find sizes in -- check pydumpi/undumpi.py
+				trace.read_stream()
+	except Exception as e:
+		raise FormaError(f'{tracefile}: {str(e) or type(e).__name__}')
+
+	## the callbacks of pydumpi cannot raise, cf. FormaIMTrace.fail()
+	if trace.error is not None:
+		raise FormaError(f'{tracefile}: {trace.error}')
+
+	rank_data = [trace.get_opdata(), trace.total_exec_time, trace.all_window_sizes, 
+				trace.all_window_durations, trace.epochcount_per_window, 
+				trace.callcount_per_opcode, trace.win_count, 
+				trace.get_moments() if incremental else None, None, 
+				trace.epoch_last_target if trace.filtered else None]
+
+	if profile:
+		rank_data[8] = [time.perf_counter() - wall, fpr.forma_cpu_time() - cpu, fpr.forma_rss()]
+
+	return rank_data
+
+
+def forma_parse_traces(tracefiles, jobs=1, incremental=False, spill_dir=None, native=True, profile=None, progress=None, selection=None, fences_only=False, rank_results=None, epoch_last_targets=None):
+
+	""" parses the trace files of all ranks. If spill_dir is given, the opdata 
+		of each rank are spilled to files in spill_dir right after the rank is 
+		parsed and the returned opdata store is memory-mapped on these files 
+		(out-of-core version, cf. FormaOpdataSpill). If native is not set, 
+		trace files are always parsed through pydumpi (cf. forma_parse_rank()). 
+		If a FormaProfile is given, the parsing of each rank is added to it 
+		as a phase of its own. If a FormaProgress is given, progress is 
+		reported while parsing (cf. forma_progress.py). selection and fences_only 
+		are passed on to forma_parse_rank(). If rank_results is given, it is an 
+		iterator over the results of forma_parse_rank() for tracefiles, e.g. 
+		submitted to a worker pool shared with other executions (cf. 
+		forma_batch.py), and tracefiles are not parsed here. If epoch_last_targets 
+		is given, the epoch_last_target of each rank (cf. forma_parse_rank()) is 
+		appended to it. Raises FormaError if a trace file could not be parsed. 
+	"""
 
 	rank = 0
-	opdata_per_rank = []
+	win_count = 0
+	opdata_per_rank = []	## per-rank FormaOpdata stores, concatenated after parsing
 	total_exec_time_per_rank = []
 	all_window_sizes_per_rank = []
 	all_window_durations_per_rank = []
 	epochs_per_window_per_rank = []
+	moments_per_rank = []
 	callcount_per_opcode = [0, 0, 0, 0, 0, 0, 0, 0]
 
+	if spill_dir is not None:
+		opdata_spill = fod.FormaOpdataSpill(spill_dir)
+
+	parse_rank = functools.partial(forma_parse_rank, incremental=incremental, native=native, profile=profile is not None, 
+									selection=selection, fences_only=fences_only)
+
+	if progress is not None:
+		progress.start()
+
+	if rank_results is not None:
+		pool = None
+	elif jobs > 1 and len(tracefiles) > 1:
+		## each rank is parsed by a worker process; imap hands the 
+		## results back in the order of tracefiles, i.e. in rank order. 
+		## Workers update the progress counters of the main process
+		if progress is not None:
+			pool = mp.Pool(min(jobs, len(tracefiles)), fpg.forma_progress_init, (progress.counts, tracefiles))
+		else:
+			pool = mp.Pool(min(jobs, len(tracefiles)))
+		rank_results = pool.imap(parse_rank, tracefiles)
+	else:
+		pool = None
+		rank_results = map(parse_rank, tracefiles)
 
 	try: 
 		for tracefile in tracefiles:
-			with ft.FormaIMTrace(tracefile) as trace:
-				## keeping next line in order to remember where to find sizes in -- check pydumpi/undumpi.py
-
-				print(f'now reading {tracefile}...\t\t', end="")
-				trace.read_stream()
-				#print(f'Fence count for rank {rank} is: {trace.fence_count}')
-				print('Done.\n')
+			print(f'now reading {tracefile}...\t\t', end="")
+			rank_data = next(rank_results)
+			#print(f'Fence count for rank {rank} is: {trace.fence_count}')
+			print('Done.\n')
+			if spill_dir is not None:
+				opdata_spill.append(rank, rank_data[0])
+			else:
+				opdata_per_rank.append(rank_data[0])
 			rank += 1
-			opdata_per_rank.append(trace.opdata_per_window)
-			total_exec_time_per_rank.append(trace.total_exec_time)
-			all_window_sizes_per_rank.append(trace.all_window_sizes)
-			all_window_durations_per_rank.append(trace.all_window_durations)
-			epochs_per_window_per_rank.append(trace.epochcount_per_window)
+			total_exec_time_per_rank.append(rank_data[1])
+			all_window_sizes_per_rank.append(rank_data[2])
+			all_window_durations_per_rank.append(rank_data[3])
+			epochs_per_window_per_rank.append(rank_data[4])
+
+			callcount_per_opcode = [sum(i) for i in zip(callcount_per_opcode, rank_data[5])]
+			win_count = rank_data[6]
+			moments_per_rank.append(rank_data[7])
+			if epoch_last_targets is not None:
+				epoch_last_targets.append(rank_data[9])
+			if profile is not None:
+				profile.add_phase(f'parse rank {rank-1}', *rank_data[8])
+			if progress is not None:
+				progress.rank_done(rank-1)
 
-			
+			#print(f'current trace produced by a run of source code : {(c_char * trace.source_file).from_address(0)}')
+	except Exception as e:
+		raise FormaError(f'Trace file error: make sure the trace files you are using are in SST Dumpi format and well-formatted.\n({e})')
+	finally:
+		if pool is not None:
+			pool.terminate()
+		if progress is not None:
+			progress.stop()
 
-			callcount_per_opcode = [sum(i) for i in zip(callcount_per_opcode, trace.callcount_per_opcode)]
+	if spill_dir is not None:
+		opdata = opdata_spill.close()
+	else:
+		opdata = fod.FormaOpdata.concatenate(opdata_per_rank)
 
-			#print(f'current trace produced by a run of source code : {(c_char * trace.source_file).from_address(0)}')
+	return rank, win_count, callcount_per_opcode, opdata, total_exec_time_per_rank, all_window_sizes_per_rank, all_window_durations_per_rank, epochs_per_window_per_rank, moments_per_rank
 
-			#print("{0}".format(trace.source_file.argv[0]), end="\n")
 
-			#sourcefile = trace.source_file
-			#print(f'current trace produced by a run of source code : {sourcefile}')
-	except:
-		print('Trace file error: make sure the trace files you are using are in SST Dumpi format and well-formatted.')
-		sys.exit(2)
 
-	return rank, trace.win_count, callcount_per_opcode, opdata_per_rank, total_exec_time_per_rank, all_window_sizes_per_rank, all_window_durations_per_rank, epochs_per_window_per_rank
+def forma_check_consistency(ranks, wins, opdata):
 
+	""" returns 0 if every rank has the same windows, with the same number of 
+		epochs each, otherwise the code of the inconsistency (cf. consistency_errors) 
+	"""
 
+	epochs_per_window_per_rank = opdata.epochs_per_window
 
-def forma_calculate_dt_bounds_estimate(ranks, wins, opdata_per_rank):
+	if len(epochs_per_window_per_rank) != ranks:
+		return 1
+	else:
+		for i in range(ranks):
+			if len(epochs_per_window_per_rank[i]) != wins:
+				return 2
+		for j in range(wins):
+			epoch_cnt = epochs_per_window_per_rank[0][j]
+			for i in range(ranks):
+				if epochs_per_window_per_rank[i][j] != epoch_cnt:
+					return 3
+
+	return 0
+
+
+
+def forma_calculate_dt_bounds_estimate(ranks, wins, opdata):
 
 	print('Calculating data transfer bounds in execution...\t\t', end="")
 
-	#print(opdata_per_rank)
-
-	for i in range(ranks): # rank
-		#print(f'rank {i} out of {ranks}')
-		for j in range(wins): # window
-			#print(f'\twindow {j} out of {wins}')
-			for k in range(len(opdata_per_rank[i][j])-1): # epoch
-				#print(f'\t\tepoch {k} out of {len(opdata_per_rank[i][j])-1}')
-				for l in range(len(opdata_per_rank[i][j][k])-1): # operation, except fence
-					opdata_per_rank[i][j][k][l][4] = opdata_per_rank[i][j][k][-1][3] - opdata_per_rank[i][j][k][l][1]
-					#print(f'\t\t\toperation {l} out of {len(opdata_per_rank[i][j][k])}')
+	## exit time of the fence that closes the epoch of each op on its own rank
+	fence_rows = opdata.fence_rows(ranks, wins)
+	fence_end = opdata.bytes[fence_rows[opdata.rank, opdata.window, opdata.epoch]]
+
+	ops = (opdata.opcode != 3) # operation, except fence
+	opdata.dtbound[ops] = fence_end[ops] - opdata.start[ops]
+	opdata.value_orders.pop('dtbound', None)
+
 	print('Done.\n')
 	return True
 
 
 
-def forma_calculate_dt_bounds(ranks, wins, opdata_per_rank):
+def forma_calculate_dt_bounds(ranks, wins, opdata, fences=None, epoch_targets=None):
+
+	""" calculates the data transfer bound of each op of opdata, out of the 
+		fences of its target rank, which are taken from the store fences if 
+		given (e.g. the fences of ranks that are not in opdata, cf. forma_select.py), 
+		from opdata otherwise. If epoch_targets is given, indexed by [rank, window, 
+		epoch] of opdata, it holds the target rank that MPI_Get inherit at the 
+		start of each epoch, i.e. from ops that are not in opdata (cf. 
+		forma_select_dt_bounds()). Target ranks of opdata are left as parsed. 
+	"""
+
+	if fences is None:
+		fences = opdata
 
 	print('Calculating data transfer bounds in execution...\t\t', end="")
 
 	targetrank = 0
-
-	for i in range(ranks): # rank
-		#print(f'rank {i} out of {ranks}')
-		for j in range(wins): # window
-			#print(f'\twindow {j} out of {wins}')
-			for k in range(len(opdata_per_rank[i][j])-1): # epoch
-				#print(f'\t\tepoch {k} out of {len(opdata_per_rank[i][j])-1}')
-				for l in range(len(opdata_per_rank[i][j][k])-1): # operation, except fence
-					if opdata_per_rank[i][j][k][l][0] != 0:
-						targetrank = opdata_per_rank[i][j][k][l][4]
-					opdata_per_rank[i][j][k][l][4] = opdata_per_rank[targetrank][j][k][-1][3] - opdata_per_rank[i][j][k][l][1]
-					#print(f'\t\t\toperation {l} out of {len(opdata_per_rank[i][j][k])}')
+	epoch_key = -1
+
+	## fence_end[rank, win, epoch] is the exit time of the fence that 
+	## closes epoch of window win on rank (-1 where there is no such epoch)
+	fence_rows = fences.fence_rows(ranks, wins)
+	fence_end = np.where(fence_rows > -1, fences.bytes[np.maximum(fence_rows, 0)], -1)
+
+	## rows are sorted by (rank, window, epoch) and each epoch is in trace 
+	## order, i.e. in the order of looping over rank, window, epoch and 
+	## operation. This matters for MPI_Get, that takes the target rank of 
+	## the previous MPI_Put/MPI_Acc in that order (or 0 if there is none), 
+	## so target ranks are forward-filled from these ops, carrying the 
+	## last one over from chunk to chunk. With epoch_targets, the fill 
+	## restarts at each epoch, from the target rank it inherits
+	for chunk in opdata.chunks():
+		opcodes = opdata.opcode[chunk]
+		ops = (opcodes != 3) # operation, except fence
+		setters = np.nonzero(ops & (opcodes != 0))[0]
+
+		last_setter = np.full(len(opcodes), -1, dtype=np.int64)
+		last_setter[setters] = setters
+		np.maximum.accumulate(last_setter, out=last_setter)
+
+		targetranks = opdata.targetrank[chunk][np.maximum(last_setter, 0)].astype(np.int64)
+		if epoch_targets is None:
+			targetranks[last_setter < 0] = targetrank
+			if len(setters) > 0:
+				targetrank = int(opdata.targetrank[chunk][setters[-1]])
+		else:
+			## the epoch of the last row of the previous chunk carries on with its target rank
+			keys = (opdata.rank[chunk].astype(np.int64)*epoch_targets.shape[1] + opdata.window[chunk])*epoch_targets.shape[2] + opdata.epoch[chunk]
+			inherited = epoch_targets.reshape(-1)[keys]
+			if len(keys) > 0 and keys[0] == epoch_key:
+				inherited[keys == epoch_key] = targetrank
+			targetranks = np.where(last_setter >= np.searchsorted(keys, keys), targetranks, inherited)
+			if len(keys) > 0:
+				epoch_key, targetrank = int(keys[-1]), int(targetranks[-1])
+
+		dtbounds = np.zeros(len(opcodes), dtype=np.int64)
+		dtbounds[ops] = fence_end[targetranks[ops], opdata.window[chunk][ops], opdata.epoch[chunk][ops]] - opdata.start[chunk][ops]
+
+		opdata.dtbound[chunk] = dtbounds
+	opdata.value_orders.pop('dtbound', None)
 	print('Done.\n')
-	return True
\ No newline at end of file
+	return True
@@ -0,0 +1,268 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import zipfile
+import os
+
+import numpy as np
+
+import forma_opdata as fod
+import forma_stats as fs
+import forma_select as fsel
+
+from forma_parse import FormaError
+
+
+## foRMA partial aggregates (--partial, --merge), for analysing the ranks of an
+## execution on different nodes, e.g. with a job array, and merging the results.
+## A partial aggregate is what the incremental version keeps of the trace files
+## of a subset of the ranks (cf. FormaINCTrace): per rank, the moments of op
+## durations per window, epoch and opcode, the moments of op start times per
+## window, epoch, opcode and target rank (with their sketches), the data volume
+## per epoch, the sketches of op durations per opcode, and the fences of the rank, whose exit
+## times give the data transfer bounds. Partial aggregates hold no data transfer
+## bounds, since these depend on the fences of target ranks that may be in other
+## partial aggregates. They are calculated once all partial aggregates are
+## merged (cf. forma_merge_incremental()), so that the results are the same as
+## those of the incremental version on all trace files at once.
+##
+## Partial aggregates are stored in a compressed .npz file, with the dictionaries
+## of FormaINCTrace flattened into columns, one row per entry: the (original) rank,
+## the fields of the key, and the fields of the FormaMoments (or the value).
+
+## bump whenever the content of partial aggregates changes
+partial_version = 2
+
+## fields of FormaMoments that are stored
+moments_fields = ['count', 'total', 'min', 'max', 'mean', 'm2']
+
+
+def forma_partial_columns(prefix, key_names, entries_per_rank, fields=None):
+
+	""" flattens entries_per_rank, a dictionary per rank indexed by tuples of
+		key_names, into columns prefix+name, where the values are FormaMoments
+		(of which fields are stored) or, if fields is None, integers (stored as
+		column prefix+'value')
+	"""
+
+	names = ['rank'] + key_names + (fields if fields is not None else ['value'])
+	rows = []
+	for rank, entries in enumerate(entries_per_rank):
+		for key, value in entries.items():
+			values = [getattr(value, f) for f in fields] if fields is not None else [value]
+			rows.append([rank] + list(key) + values)
+
+	return {prefix+name: np.array([row[i] for row in rows], dtype=np.float64 if name in ['mean', 'm2'] else np.int64)
+			for i, name in enumerate(names)}
+
+
+def forma_partial_entries(partial, prefix, key_names, ranks, fields=None):
+
+	""" returns the dictionaries per rank flattened by forma_partial_columns() """
+
+	entries_per_rank = [dict() for rank in range(ranks)]
+	columns = [partial[prefix+name].tolist() for name in ['rank'] + key_names + (fields if fields is not None else ['value'])]
+	keys = len(key_names)
+
+	for row in zip(*columns):
+		if fields is None:
+			value = row[keys+1]
+		else:
+			value = fs.FormaMoments()
+			for field, v in zip(fields, row[keys+1:]):
+				setattr(value, field, v)
+		entries_per_rank[row[0]][tuple(row[1:keys+1])] = value
+
+	return entries_per_rank
+
+
+def forma_partial_sketch_columns(prefix, sketches):
+
+	""" flattens the FormaQuantiles sketches into columns prefix+name, one 
+		group of values per sketch; values of the update() buffer are stored 
+		as level -1
+	"""
+
+	fields = {'k': [], 'count': [], 'compactions': [], 'levels': []}
+	values = []
+	groups = []
+	levels = []
+
+	for group, sketch in enumerate(sketches):
+		for field in ['k', 'count', 'compactions']:
+			fields[field].append(getattr(sketch, field))
+		fields['levels'].append(len(sketch.levels))
+		for h, level in enumerate([np.array(sketch.buffer, dtype=np.int64)] + sketch.levels):
+			values.append(level)
+			groups.append(np.full(len(level), group, dtype=np.int64))
+			levels.append(np.full(len(level), h-1, dtype=np.int64))
+
+	columns = {prefix+field: np.array(v, dtype=np.int64) for field, v in fields.items()}
+	for name, v in [('values', values), ('group', groups), ('level', levels)]:
+		columns[prefix+name] = np.concatenate(v) if v else np.zeros(0, dtype=np.int64)
+
+	return columns
+
+
+def forma_partial_sketches(partial, prefix):
+
+	""" returns the FormaQuantiles sketches flattened by forma_partial_sketch_columns() """
+
+	## one slot per level of each group, after a slot for the buffer
+	sketches = len(partial[prefix+'k'])
+	slots = int(partial[prefix+'levels'].max(initial=0)) + 1
+	keys = partial[prefix+'group']*slots + partial[prefix+'level'] + 1
+	order = np.argsort(keys, kind='stable')
+	values = partial[prefix+'values'][order]
+	bounds = np.searchsorted(keys[order], np.arange(sketches*slots + 1)).tolist()
+
+	k, count, compactions, levels = [partial[prefix+field].tolist() for field in ['k', 'count', 'compactions', 'levels']]
+	result = []
+	for group in range(sketches):
+		sketch = fs.FormaQuantiles(k[group])
+		sketch.count = count[group]
+		sketch.compactions = compactions[group]
+		first = group*slots
+		sketch.buffer = values[bounds[first]:bounds[first+1]].tolist()
+		sketch.levels = [values[bounds[first+h+1]:bounds[first+h+2]] for h in range(levels[group])]
+		result.append(sketch)
+
+	return result
+
+
+def forma_partial_save(filename, timestamp, rank_ids, total_ranks, wins, callcount_per_opcode, opdata,
+						total_exec_time_per_rank, all_window_sizes_per_rank, all_window_durations_per_rank,
+						epochs_per_window_per_rank, moments_per_rank):
+
+	""" stores the output of forma_parse_traces() for the trace files of the
+		ranks rank_ids (incremental version), out of total_ranks ranks, as
+		partial aggregates in filename. Raises FormaError if the file cannot
+		be written.
+	"""
+
+	ranks = len(rank_ids)
+	rank_ids = np.array(rank_ids, dtype=np.int64)
+
+	columns = {'fences_'+c[0]: np.asarray(getattr(opdata, c[0])) for c in fod.FormaOpdata.columns}
+	columns['fences_rank'] = rank_ids[columns['fences_rank']].astype(np.int32)
+
+	duration_moments, start_moments, epoch_last_target, epoch_data_vol, duration_sketches = [list(m) for m in zip(*moments_per_rank)]
+	columns.update(forma_partial_columns('duration_', ['window', 'epoch', 'opcode'], duration_moments, moments_fields))
+	columns.update(forma_partial_columns('start_', ['window', 'epoch', 'opcode', 'target'], start_moments, moments_fields))
+	columns.update(forma_partial_columns('last_target_', ['window', 'epoch'], epoch_last_target))
+	columns.update(forma_partial_columns('data_vol_', ['window', 'epoch'], epoch_data_vol))
+	columns.update(forma_partial_sketch_columns('start_sketch_', [m.sketch for entries in start_moments for m in entries.values()]))
+	columns.update(forma_partial_sketch_columns('sketch_', [s for sketches in duration_sketches for s in sketches]))
+
+	try:
+		## write to a temporary file first, so that partial aggregates are either complete or missing
+		tmp_file = f'{filename}.{os.getpid()}.tmp'
+		with open(tmp_file, 'wb') as f:
+			np.savez_compressed(f,
+								partial_version=np.array(partial_version),
+								timestamp=np.array(str(timestamp)),
+								ranks=np.array(total_ranks),
+								rank_ids=rank_ids,
+								wins=np.array(wins),
+								callcount_per_opcode=np.array(callcount_per_opcode, dtype=np.int64),
+								total_exec_time=np.array(total_exec_time_per_rank, dtype=np.int64).reshape(ranks),
+								window_sizes=np.array(all_window_sizes_per_rank, dtype=np.int64).reshape(ranks, wins),
+								window_durations=np.array(all_window_durations_per_rank, dtype=np.int64).reshape(ranks, wins, 3),
+								epochs_per_window=np.array(epochs_per_window_per_rank, dtype=np.int64).reshape(ranks, wins),
+								**columns)
+		os.replace(tmp_file, filename)
+	except OSError as e:
+		raise FormaError(f'Could not write partial aggregates to {filename}: {e}')
+
+	return filename
+
+
+def forma_partial_load(filename):
+
+	""" returns the partial aggregates stored in filename, as a dictionary
+		of arrays. Raises FormaError if they cannot be read.
+	"""
+
+	try:
+		with np.load(filename) as partial:
+			if int(partial['partial_version']) != partial_version:
+				raise FormaError(f'Partial aggregates {filename} are of another version of foRMA.')
+			return {name: partial[name] for name in partial.files}
+	except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+		raise FormaError(f'Could not read partial aggregates {filename}: {e}')
+
+
+def forma_partial_merge(filenames):
+
+	""" returns the output of forma_parse_traces() (incremental version) for
+		the execution whose ranks are covered by the partial aggregates stored
+		in filenames, each rank in exactly one of them. Raises FormaError if
+		the partial aggregates cannot be merged.
+	"""
+
+	partials = [forma_partial_load(f) for f in filenames]
+
+	first = partials[0]
+	for filename, partial in zip(filenames, partials):
+		if any([str(partial[name]) != str(first[name]) for name in ['timestamp', 'ranks', 'wins']]):
+			raise FormaError(f'Partial aggregates {filename} are not of the same execution as {filenames[0]} (timestamp, ranks or windows differ).')
+	ranks = int(first['ranks'])
+	wins = int(first['wins'])
+
+	## partial aggregates and position in them of each rank
+	positions = dict()
+	for i, partial in enumerate(partials):
+		for j, rank in enumerate(partial['rank_ids'].tolist()):
+			if rank in positions:
+				raise FormaError(f'Rank {rank} is in more than one of the partial aggregates.')
+			positions[rank] = (i, j)
+	missing = [rank for rank in range(ranks) if rank not in positions]
+	if missing:
+		raise FormaError(f'Ranks {fsel.FormaSelection(missing).describe()[0]} are missing from the partial aggregates.')
+	order = [positions[rank] for rank in range(ranks)]
+
+	moments_per_partial = []
+	for partial in partials:
+		partial_ranks = len(partial['rank_ids'])
+		## sketches of start times are in the order of the entries of start moments
+		start_moments = forma_partial_entries(partial, 'start_', ['window', 'epoch', 'opcode', 'target'], partial_ranks, moments_fields)
+		for moments, sketch in zip([m for entries in start_moments for m in entries.values()], forma_partial_sketches(partial, 'start_sketch_')):
+			moments.sketch = sketch
+		duration_sketches = forma_partial_sketches(partial, 'sketch_')
+		moments_per_partial.append(list(zip(forma_partial_entries(partial, 'duration_', ['window', 'epoch', 'opcode'], partial_ranks, moments_fields),
+											start_moments,
+											forma_partial_entries(partial, 'last_target_', ['window', 'epoch'], partial_ranks),
+											forma_partial_entries(partial, 'data_vol_', ['window', 'epoch'], partial_ranks),
+											[duration_sketches[rank*4:rank*4+4] for rank in range(partial_ranks)])))
+	moments_per_rank = [list(moments_per_partial[i][j]) for i, j in order]
+
+	callcount_per_opcode = np.sum([partial['callcount_per_opcode'] for partial in partials], axis=0).tolist()
+	total_exec_time_per_rank = [int(partials[i]['total_exec_time'][j]) for i, j in order]
+	all_window_sizes_per_rank = [partials[i]['window_sizes'][j].tolist() for i, j in order]
+	all_window_durations_per_rank = [partials[i]['window_durations'][j].tolist() for i, j in order]
+	epochs_per_window_per_rank = [partials[i]['epochs_per_window'][j].tolist() for i, j in order]
+
+	## fences of all ranks, in rank order
+	columns = {c[0]: np.concatenate([partial['fences_'+c[0]] for partial in partials]).astype(c[1]) for c in fod.FormaOpdata.columns}
+	rows = np.argsort(columns['rank'], kind='stable')
+	opdata = fod.FormaOpdata({name: column[rows] for name, column in columns.items()}, epochs_per_window_per_rank)
+
+	return (ranks, wins, callcount_per_opcode, opdata, total_exec_time_per_rank, all_window_sizes_per_rank,
+			all_window_durations_per_rank, epochs_per_window_per_rank, moments_per_rank)
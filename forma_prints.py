@@ -31,12 +31,115 @@ import numpy as np
 from pydumpi import DumpiTrace
 
 import forma_trace as ft
+import forma_stats as fs
 
 from tabulate import tabulate
 
 
 
-def forma_print_stats_x6(row_labels, row_data):
+def forma_tabulate_cell_type(values):
+
+	""" type of a column of numbers as deduced by tabulate: float if any value is 
+		a float, int if all of them are ints, None if all of them are missing. 
+		Returns False for anything else. 
+	"""
+
+	cell_type = None
+	for v in values:
+		if v is None:
+			continue
+		if type(v) is int or isinstance(v, np.signedinteger):
+			cell_type = cell_type or int
+		elif isinstance(v, (float, np.floating)):
+			cell_type = float
+		else:
+			return False
+
+	return cell_type
+
+
+def forma_tabulate_afterpoint(string):
+
+	""" number of characters after the decimal point (or exponent) of a 
+		formatted number, -1 if there is none (cf. tabulate._afterpoint())
+	"""
+
+	if string.lstrip('-').isdigit():
+		return -1
+	pos = string.rfind('.')
+	if pos < 0:
+		pos = string.lower().rfind('e')
+	if pos < 0:
+		return -1
+
+	return len(string) - pos - 1
+
+
+def forma_tabulate(rows, headers):
+
+	""" same as tabulate(rows, headers=headers), for tables of rows made up of 
+		numbers (or None), optionally preceded by a label, such as the statistics 
+		tables of foRMA. Since these are printed for every rank, epoch or fence, 
+		cells are formatted directly, instead of going through the type deduction 
+		of tabulate for every value. Any other table is passed to tabulate. 
+	"""
+
+	columns = list(zip(*rows))
+	labelled = bool(rows) and len(rows[0]) == len(headers)+1
+	labels = columns[0] if labelled else []
+	if (not rows or not headers or any(len(r) != len(headers)+labelled for r in rows) or 
+		any((not isinstance(l, str)) or l == '' or l != l.strip() or (not l.isascii()) or (not l.isprintable()) 
+			or l in ('True', 'False') or forma_tabulate_isnumber(l) for l in labels)):
+		return tabulate(rows, headers=headers)
+
+	cell_types = [forma_tabulate_cell_type(c) for c in columns[labelled:]]
+	if False in cell_types:
+		return tabulate(rows, headers=headers)
+
+	header_cells = []
+	cells = []
+	widths = []
+	if labelled:
+		widths.append(max([len(l) for l in labels] + [2]))
+		header_cells.append(' '*widths[0])
+		cells.append([l.ljust(widths[0]) for l in labels])
+
+	for header, column, cell_type in zip(headers, columns[labelled:], cell_types):
+		if cell_type is None:
+			width = len(header)+2
+			header_cells.append(header.ljust(width))
+			cells.append([' '*width]*len(column))
+			widths.append(width)
+			continue
+		if cell_type is int:
+			strings = ['' if v is None else format(v, '') for v in column]
+		else:
+			strings = ['' if v is None else format(float(v), 'g') for v in column]
+		## decimal alignment, cf. tabulate
+		decimals = [forma_tabulate_afterpoint(v) for v in strings]
+		maxdecimals = max(decimals)
+		strings = [v + (maxdecimals - d)*' ' for v, d in zip(strings, decimals)]
+		width = max([len(v) for v in strings] + [len(header)+2])
+		header_cells.append(header.rjust(width))
+		cells.append([v.rjust(width) for v in strings])
+		widths.append(width)
+
+	lines = ['  '.join(header_cells).rstrip(), '  '.join(['-'*w for w in widths])]
+	lines += ['  '.join(row).rstrip() for row in zip(*cells)]
+
+	return '\n'.join(lines)
+
+
+def forma_tabulate_isnumber(string):
+
+	try:
+		float(string)
+		return True
+	except ValueError:
+		return False
+
+
+def forma_print_stats_x6(row_labels, row_data, file=None):
 
 	## sanity check: are the row data of length==6?
 #	if len(row_data) != 6 or len(row_labels) != 6:
@@ -48,12 +151,12 @@ def forma_print_stats_x6(row_labels, row_data):
 		print('ERROR: forma_print_stats_x6: check row_labels and row_data types')
 		sys.exit(2)
 
-	print(f'{tabulate(rows, headers=["aggregate", "min", "max", "avg", "mean", "std dev"])}\n')
+	print(f'{forma_tabulate(rows, ["aggregate", "min", "max", "avg", "mean", "std dev"])}\n', file=file)
 	
 	return True
 	
 
-def forma_print_stats_x4(row_labels, row_data):
+def forma_print_stats_x4(row_labels, row_data, file=None):
 
 	try:
 		rows = [[row_labels[i]]+row_data[i] for i in range(len(row_labels))]
@@ -61,54 +164,107 @@ def forma_print_stats_x4(row_labels, row_data):
 		print('ERROR: forma_print_stats_x6: check row_labels and row_data types')
 		sys.exit(2)
 
-	print(f'{tabulate(rows, headers=["aggregate", "min", "max", "avg"])}\n')
+	print(f'{forma_tabulate(rows, ["aggregate", "min", "max", "avg"])}\n', file=file)
 
 	return True
 
 
-def forma_print_timestamps_ranks(row_data):
+def forma_print_stats_tail(row_labels, row_data, file=None):
+
+	try:
+		rows = [[row_labels[i]]+row_data[i] for i in range(len(row_labels))]
+	except TypeError:
+		print('ERROR: forma_print_stats_tail: check row_labels and row_data types')
+		sys.exit(2)
+
+	print(f'{forma_tabulate(rows, ["p90", "p99", "p99.9"])}\n', file=file)
+
+	return True
+
+
+def forma_print_timestamps_ranks(row_data, file=None):
+
+	print(f'{forma_tabulate([row_data], ["Epoch", "Earliest ts", "(rank)", "Latest ts", "(rank)", "Range"])}\n', file=file)
+
+	return True
+
+
+def forma_print_fence_summary(title, first_counts, last_counts, skew_stats, file=None):
+
+	print('------------------------------------------------------------------------------------------\n' + 
+		f'{title}:\n\n' + 
+		'-- Fence arrival skew (nsec) --', file=file)
+	forma_print_stats_x6(["Skew"], [fs.forma_calculate_stats_x6(skew_stats)], file=file)
+	forma_print_stats_tail(["Skew"], [fs.forma_calculate_stats_tail(skew_stats)], file=file)
 
-	print(f'{tabulate([row_data], headers=["Epoch", "Earliest ts", "(rank)", "Latest ts", "(rank)", "Range"])}\n')
+	print('-- Fence arrivals per rank --', file=file)
+	print(f'{forma_tabulate([[i, first_counts[i], last_counts[i]] for i in range(len(first_counts))], ["Rank", "Earliest arrivals", "Latest arrivals (straggler)"])}\n', file=file)
+	print('------------------------------------------------------------------------------------------\n', file=file)
 
 	return True
 
 
-def forma_print_rank_stats(rank_id, total_exec_time, opduration_stats_for_rank):
+def forma_print_rank_stats(rank_id, total_exec_time, opduration_stats_for_rank, file=None):
 
 	rma = sum(opduration_stats_for_rank[i][0] for i in range(4))
 
 	print('\n------------------------------------------------------------------------------------------\n' + 
 		f'RANK ID: {rank_id} \n\n' +
 		f'-- Total exec. time\t:   {total_exec_time}\n' +
-		f'-- Total time in RMA\t:   {rma}\n')
+		f'-- Total time in RMA\t:   {rma}\n', file=file)
 
 	print('Op durations (nsec) \n' +
-		  '-------------------')
+		  '-------------------', file=file)
 
 	#print(f'RANK {rank_id} Operation Durations\nTotal exec. time: {total_exec_time}\nTotal time in RMA: {rma}')
 	#print(f'{tabulate([["MPI_Get"]+([0]*6), ["MPI_Put"]+([0]*6), ["MPI_Accumulate"]+([0]*6), ["MPI_Win_fence"]+([0]*6)], headers=["aggregate", "min", "max", "avg", "mean", "std dev"])}\n')
-	forma_print_stats_x6(["MPI_Get", "MPI_Put", "MPI_Accumulate", "MPI_Win_fence"], opduration_stats_for_rank)
+	forma_print_stats_x6(["MPI_Get", "MPI_Put", "MPI_Accumulate", "MPI_Win_fence"], opduration_stats_for_rank, file=file)
 	
 	return True
 
-def forma_print_rank_dt_bounds(rank_id, dt_bounds_stats_for_rank):
+def forma_print_rank_dt_bounds(rank_id, dt_bounds_stats_for_rank, file=None):
 
 	print('Data transfer bounds (nsec) \n' +
-		  '---------------------------')
-	forma_print_stats_x6(["MPI_Get", "MPI_Put", "MPI_Accumulate"], dt_bounds_stats_for_rank)
+		  '---------------------------', file=file)
+	forma_print_stats_x6(["MPI_Get", "MPI_Put", "MPI_Accumulate"], dt_bounds_stats_for_rank, file=file)
 	
 	return True
 
 
-def forma_print_window_info(win_info):
+def forma_print_rank_tail_stats(rank_id, tail_stats_for_rank, file=None):
 
-	print(f'{tabulate([win_info], headers=["Size (B)", "# of epochs", "Total Bytes transferred"])}\n')
+	print('Tail latencies (nsec) \n' +
+		  '---------------------', file=file)
+	forma_print_stats_tail(["MPI_Get", "MPI_Put", "MPI_Accumulate", "MPI_Win_fence", 
+							"MPI_Get DT bound", "MPI_Put DT bound", "MPI_Accumulate DT bound"], tail_stats_for_rank, file=file)
 
 	return True
 
 
-def forma_print_stats_summary(ranks, wins, opduration_stats, windata_stats, dtbound_stats, callcount_per_opcode):
+def forma_print_window_info(win_info, file=None):
 
+	print(f'{tabulate([win_info], headers=["Size (B)", "# of epochs", "Total Bytes transferred"])}\n', file=file)
+
+	return True
+
+
+def forma_print_selection(ranks, wins, epochs):
+
+	print('------------------------------------------------------------------------------------------\n' + 
+		'----------------------------------- SELECTION --------------------------------------------\n' + 
+		'------------------------------------------------------------------------------------------\n' +
+		'\n' +
+		f'-- Ranks\t\t\t:   {ranks}\n' +
+		f'-- Memory windows\t\t:   {wins}\n' +
+		f'-- Epochs per window\t\t:   {epochs}\n' +
+		'\n' +
+		'Results are restricted to the above, with selected ranks, windows and epochs numbered from 0.\n' +
+		'\n')
+
+	return True
+
+
+def forma_print_callcounts(ranks, wins, callcount_per_opcode):
 
 	print('------------------------------------------------------------------------------------------\n' + 
 		'----------------------------- EXECUTION SUMMARY ------------------------------------------\n' + 
@@ -122,6 +278,13 @@ def forma_print_stats_summary(ranks, wins, opduration_stats, windata_stats, dtbo
 		f'-- # of MPI_Win_fence calls\t:   {callcount_per_opcode[3]}\n' +
 		'\n')
 
+	return True
+
+
+def forma_print_stats_summary(ranks, wins, opduration_stats, windata_stats, dtbound_stats, callcount_per_opcode, tail_stats=None):
+
+
+	forma_print_callcounts(ranks, wins, callcount_per_opcode)
 
 	print('------------------------------------------------------------------------------------------\n' +
 	'------------------------ [Operation] Durations (nsec) ------------------------------------\n')
@@ -134,21 +297,27 @@ def forma_print_stats_summary(ranks, wins, opduration_stats, windata_stats, dtbo
 	print('------------------------------------------------------------------------------------------\n' +
 	'-------------------------- Data Transfer Bounds ------------------------------------------\n')
 	forma_print_stats_x4(["MPI_Get", "MPI_Put", "MPI_Accumulate"], dtbound_stats)
+
+	if tail_stats is not None:
+		print('------------------------------------------------------------------------------------------\n' +
+		'-------------------------- Tail Latencies (nsec) -----------------------------------------\n')
+		forma_print_stats_tail(["MPI_Get", "MPI_Put", "MPI_Accumulate", "MPI_Win_fence", 
+								"MPI_Get DT bound", "MPI_Put DT bound", "MPI_Accumulate DT bound"], tail_stats)
 	
 	return True
 
 
 
-def forma_print_dtbounds_stats_for_epoch(dtbound_stats_for_epoch):
+def forma_print_dtbounds_stats_for_epoch(dtbound_stats_for_epoch, file=None):
 
-	forma_print_stats_x4(["MPI_Get", "MPI_Put", "MPI_Accumulate"], dtbound_stats_for_epoch)
+	forma_print_stats_x4(["MPI_Get", "MPI_Put", "MPI_Accumulate"], dtbound_stats_for_epoch, file=file)
 	
 	return True
 
 
-def forma_print_opduration_stats_for_epoch(opduration_stats_for_epoch):
+def forma_print_opduration_stats_for_epoch(opduration_stats_for_epoch, file=None):
 
-	forma_print_stats_x4(["MPI_Get", "MPI_Put", "MPI_Accumulate", "MPI_Win_fence"], opduration_stats_for_epoch)
+	forma_print_stats_x4(["MPI_Get", "MPI_Put", "MPI_Accumulate", "MPI_Win_fence"], opduration_stats_for_epoch, file=file)
 	
 	return True
 
@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import contextlib
+import json
+import time
+import sys
+import os
+
+import numpy as np
+
+from pympler import asizeof
+
+from tabulate import tabulate
+
+import forma_opdata as fod
+
+
+## foRMA self-profiling (--profile). Records the wall clock time, CPU time
+## and peak RSS of each phase of an analysis, as well as the in-memory size
+## of its main data structures, and reports them both as tables and as a
+## JSON file, so that they can be compared across versions of foRMA and
+## sizes of traces.
+##
+## CPU time includes the CPU time of child processes that have finished
+## by the end of a phase (e.g. parallel parsing or concurrent reports).
+## Peak RSS is the peak of the process during the phase, where the peak
+## can be reset (Linux), otherwise the peak of the process so far; child
+## processes measure and report their own (cf. forma_parse_rank()).
+
+## bump whenever the layout of the JSON file changes
+profile_version = 1
+
+
+def forma_reset_peak_rss():
+
+	""" resets the peak RSS of the process (VmHWM), returns False if not supported """
+
+	try:
+		with open('/proc/self/clear_refs', 'w') as f:
+			f.write('5')
+	except OSError:
+		return False
+
+	return True
+
+
+def forma_rss(field='VmHWM'):
+
+	""" returns the peak (VmHWM) or current (VmRSS) RSS of the process in Bytes """
+
+	try:
+		with open('/proc/self/status') as f:
+			for line in f:
+				if line.startswith(field+':'):
+					return int(line.split()[1])*1024
+	except OSError:
+		pass
+
+	import resource
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+	## kB on Linux, Bytes on macOS
+	return peak if sys.platform == 'darwin' else peak*1024
+
+
+def forma_cpu_time():
+
+	""" returns the CPU time (user and system) of the process and its finished children """
+
+	t = os.times()
+
+	return time.process_time() + t.children_user + t.children_system
+
+
+def forma_sizeof(obj):
+
+	""" returns the in-memory size of obj in Bytes, i.e. the size of the
+		columns of a FormaOpdata store (which may be memory-mapped), or the
+		deep size of any other object, arrays included
+	"""
+
+	if isinstance(obj, fod.FormaOpdata):
+		return obj.nbytes
+	if isinstance(obj, np.ndarray):
+		return obj.nbytes
+
+	return asizeof.asizeof(obj)
+
+
+class FormaProfile:
+
+	def __init__(self):
+
+		## [ name, wall (sec), cpu (sec), peak RSS (Bytes) ] per phase, in order
+		self.phases = []
+		## [ name, size (Bytes) ] per data structure
+		self.sizes = []
+		## description of the analysed trace, e.g. ranks, windows, ops
+		self.info = dict()
+
+
+	@contextlib.contextmanager
+	def phase(self, name):
+
+		""" context manager that records the phase name of the code it wraps """
+
+		forma_reset_peak_rss()
+		wall = time.perf_counter()
+		cpu = forma_cpu_time()
+		try:
+			yield
+		finally:
+			self.add_phase(name, time.perf_counter() - wall, forma_cpu_time() - cpu, forma_rss())
+
+
+	def add_phase(self, name, wall, cpu, peak_rss):
+
+		self.phases.append([name, wall, cpu, peak_rss])
+
+
+	def add_size(self, name, obj):
+
+		self.sizes.append([name, forma_sizeof(obj)])
+
+
+	def print(self, file=None):
+
+		print('\n------------------------------------------------------------------------------------------\n' +
+		'------------------------------------ PROFILE ---------------------------------------------\n' +
+		'------------------------------------------------------------------------------------------\n', file=file)
+		print(tabulate([[p[0], p[1], p[2], p[3]/2**20] for p in self.phases],
+						headers=['phase', 'wall (sec)', 'cpu (sec)', 'peak RSS (MiB)']) + '\n', file=file)
+		if self.sizes:
+			print(tabulate([[s[0], s[1]/2**20] for s in self.sizes], headers=['data structure', 'size (MiB)']) + '\n', file=file)
+
+
+	def save(self, filename):
+
+		""" writes the profile to filename, as JSON """
+
+		profile = {'version': profile_version,
+					'argv': sys.argv,
+					'info': self.info,
+					'phases': [{'phase': p[0], 'wall': p[1], 'cpu': p[2], 'peak_rss': p[3]} for p in self.phases],
+					'sizes': [{'structure': s[0], 'bytes': s[1]} for s in self.sizes]}
+
+		with open(filename, 'w') as f:
+			json.dump(profile, f, indent=1)
@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import json
+import threading
+import time
+import sys
+import os
+
+import multiprocessing as mp
+
+import forma_dumpi as fdr
+
+
+## foRMA parse progress (--progress, --progress-json). The number of records
+## of each trace file is known in advance from the call counts of its footer
+## (cf. forma_dumpi_call_counts()). While a trace file is parsed, the number
+## of its records processed so far is stored in a slot of a shared array of
+## counters, one per rank, which is also visible to parse workers (-j). The
+## native reader updates it once per block of records it scans, the pydumpi
+## callbacks once every so many fences, so that updates cost next to nothing.
+## A thread of the main process reads the counters at a fixed interval, and
+## reports records processed, records/s, Bytes/s and the estimated time left,
+## on screen and/or as JSON lines.
+
+## counters of records processed per rank, and rank of each trace file, as
+## set up by forma_progress_init() (in the main process and in parse workers)
+progress_counts = None
+progress_ranks = dict()
+
+
+def forma_progress_init(counts, tracefiles):
+
+	""" sets up the counters of the process, also used as the initializer of parse workers """
+
+	global progress_counts, progress_ranks
+
+	progress_counts = counts
+	progress_ranks = {tf: rank for rank, tf in enumerate(tracefiles)}
+
+
+def forma_progress_callback(tracefile):
+
+	""" returns the function that stores the number of records of tracefile
+		processed so far, or None if progress is not being reported
+	"""
+
+	if progress_counts is None or tracefile not in progress_ranks:
+		return None
+
+	rank = progress_ranks[tracefile]
+
+	def update(records):
+		progress_counts[rank] = records
+
+	return update
+
+
+class FormaProgress:
+
+	def __init__(self, tracefiles, interval=2.0, show=True, json_file=None):
+
+		self.tracefiles = tracefiles
+		self.interval = interval
+		self.show = show
+		self.json_file = json_file
+
+		## records and Bytes per trace file, out of the footer (0 where it cannot be read)
+		self.records = []
+		for tf in tracefiles:
+			call_counts = fdr.forma_dumpi_call_counts(tf)
+			self.records.append(sum(call_counts) if call_counts is not None else 0)
+		self.bytes = [os.path.getsize(tf) for tf in tracefiles]
+		self.total_records = sum(self.records)
+		self.total_bytes = sum(self.bytes)
+
+		self.counts = mp.RawArray('q', len(tracefiles))
+		self.stopped = threading.Event()
+		self.thread = None
+		self.start_time = None
+
+
+	def start(self):
+
+		forma_progress_init(self.counts, self.tracefiles)
+		self.start_time = time.perf_counter()
+		self.thread = threading.Thread(target=self.run, daemon=True)
+		self.thread.start()
+
+
+	def run(self):
+
+		while not self.stopped.wait(self.interval):
+			self.report()
+
+
+	def rank_done(self, rank):
+
+		""" marks the trace file of rank as parsed """
+
+		self.counts[rank] = self.records[rank]
+
+
+	def stop(self):
+
+		""" stops reporting, after a last report """
+
+		self.stopped.set()
+		if self.thread is not None:
+			self.thread.join()
+			self.report(final=True)
+		forma_progress_init(None, [])
+
+
+	def report(self, final=False):
+
+		elapsed = time.perf_counter() - self.start_time
+		counts = self.counts[:]
+
+		## records may be slightly over the footer count while a rank is parsed
+		## through pydumpi (cf. FormaIMTrace.report_progress())
+		done = [min(c, r) for c, r in zip(counts, self.records)]
+		records = sum(done)
+		ranks_done = sum([1 for c, r in zip(counts, self.records) if c >= r])
+		bytes_done = sum([b*d/r if r > 0 else 0 for b, d, r in zip(self.bytes, done, self.records)])
+
+		records_per_sec = records/elapsed if elapsed > 0 else 0.0
+		bytes_per_sec = bytes_done/elapsed if elapsed > 0 else 0.0
+		eta = (self.total_records - records)/records_per_sec if records_per_sec > 0 else None
+
+		if self.show:
+			fraction = records/self.total_records if self.total_records > 0 else 0.0
+			eta_text = 'unknown' if eta is None else time.strftime('%H:%M:%S', time.gmtime(eta))
+			print(f'[progress] {100*fraction:5.1f}% | {records}/{self.total_records} records | ' +
+				f'{records_per_sec:.0f} records/s | {bytes_per_sec/2**20:.1f} MiB/s | ' +
+				f'ETA {eta_text} | ranks done {ranks_done}/{len(self.tracefiles)}', file=sys.stderr, flush=True)
+
+		if self.json_file is not None:
+			self.json_file.write(json.dumps({'time': time.time(), 'elapsed': elapsed, 'final': final,
+											'records': records, 'total_records': self.total_records,
+											'bytes': int(bytes_done), 'total_bytes': self.total_bytes,
+											'records_per_sec': records_per_sec, 'bytes_per_sec': bytes_per_sec,
+											'eta': eta, 'ranks_done': ranks_done, 'ranks': len(self.tracefiles),
+											'records_per_rank': done}) + '\n')
+			self.json_file.flush()
@@ -0,0 +1,378 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import argparse
+
+import numpy as np
+
+import forma_opdata as fod
+import forma_parse as fp
+
+
+## foRMA subset selection (--ranks, --windows, --epoch-range). Only the trace
+## files of the selected ranks are parsed, and the callbacks of FormaIMTrace
+## (as well as the native reader) drop the ops of windows and epochs that are
+## not selected (cf. FormaIMTrace.selected()) instead of logging them.
+##
+## Data transfer bounds of the selected ops need the exit times of the fences
+## of their target ranks, which may not be selected. These are taken from a
+## second, fence-only pass over the trace files of only those target ranks
+## (cf. forma_select_dt_bounds()). As in a full analysis, an MPI_Get takes the
+## target rank of the last MPI_Put/MPI_Acc before it (cf. forma_calculate_dt_bounds()),
+## among all ops, selected or not. Since whole epochs are selected, only the
+## target rank inherited at the start of each selected epoch is needed, which
+## is found out of the last MPI_Put/MPI_Acc of each epoch, tracked while parsing
+## before ops are dropped (cf. FormaIMTrace.track_target()), and, for an MPI_Get
+## before any MPI_Put/MPI_Acc of its rank, out of the last target rank of the
+## ranks before. Target ranks of the ops themselves are kept as parsed.
+##
+## Once data transfer bounds are known, the selected ranks, windows and epochs
+## are numbered from 0, in the order of their original ids, so that the rest
+## of the analysis runs on the subset as if it were a whole execution (cf.
+## forma_select_traces()). Call counts of the summary are then those of the
+## selected ops.
+
+
+def forma_select_ids(text):
+
+	""" argparse type of comma-separated lists of ids and ranges of ids,
+		e.g. 0-15,512; returns the sorted list of distinct ids
+	"""
+
+	ids = set()
+	try:
+		for part in text.split(','):
+			first, sep, last = part.partition('-')
+			if sep:
+				if int(first) > int(last):
+					raise ValueError(part)
+				ids.update(range(int(first), int(last)+1))
+			else:
+				ids.add(int(first))
+	except ValueError:
+		raise argparse.ArgumentTypeError(f'not a comma-separated list of ids or ranges of ids: {text}')
+	if min(ids) < 0:
+		raise argparse.ArgumentTypeError(f'negative id in: {text}')
+
+	return sorted(ids)
+
+
+def forma_select_epoch_range(text):
+
+	""" argparse type of ranges of epochs, given as FIRST:LAST (LAST not
+		included, either may be left out) or as a single epoch; returns
+		[ first, last ], last being None for all epochs from first onwards
+	"""
+
+	try:
+		if ':' in text:
+			first, last = text.split(':')
+			first = int(first) if first else 0
+			last = int(last) if last else None
+		else:
+			first = int(text)
+			last = first+1
+	except ValueError:
+		raise argparse.ArgumentTypeError(f'not a range of epochs (FIRST:LAST): {text}')
+	if first < 0 or (last is not None and last <= first):
+		raise argparse.ArgumentTypeError(f'empty range of epochs: {text}')
+
+	return [first, last]
+
+
+class FormaSelection:
+
+	def __init__(self, ranks=None, windows=None, epochs=None):
+
+		## sorted lists of the selected rank and window ids, and [ first, last ]
+		## epoch (last not included, None for no limit); None selects all
+		self.ranks = ranks
+		self.windows = windows
+		self.epochs = epochs
+
+		self.window_set = set(windows) if windows is not None else None
+		self.first_epoch = epochs[0] if epochs is not None else 0
+		self.last_epoch = epochs[1] if epochs is not None and epochs[1] is not None else np.iinfo(np.int32).max
+
+
+	def __bool__(self):
+
+		return self.ranks is not None or self.windows is not None or self.epochs is not None
+
+
+	def filters_ops(self):
+
+		""" returns True if ops are dropped while parsing, i.e. if windows or epochs are selected """
+
+		return self.windows is not None or self.epochs is not None
+
+
+	def keeps(self, win_id, epoch):
+
+		""" returns True if the ops of epoch of window win_id are selected """
+
+		return (self.window_set is None or win_id in self.window_set) and self.first_epoch <= epoch < self.last_epoch
+
+
+	def keeps_rows(self, win_ids, epochs):
+
+		""" vectorized keeps(), for arrays of window ids and epochs """
+
+		keep = (epochs >= self.first_epoch) & (epochs < self.last_epoch)
+		if self.windows is not None:
+			keep &= np.isin(win_ids, self.windows)
+
+		return keep
+
+
+	def epoch_count(self, epochs):
+
+		""" returns how many of epochs (the epochs of a window) are selected """
+
+		return max(min(epochs, self.last_epoch) - self.first_epoch, 0)
+
+
+	def selects_epochs(self, epochs_per_window):
+
+		""" returns True if any epoch is selected, given the epochs of each window """
+
+		return any([self.epoch_count(e) > 0 for w, e in enumerate(epochs_per_window) if self.window_set is None or w in self.window_set])
+
+
+	def describe(self):
+
+		""" returns the selected ranks, windows and epochs, as text """
+
+		def ids(selected):
+			if selected is None:
+				return 'all'
+			ranges = []
+			for i in selected:
+				if ranges and ranges[-1][1] == i-1:
+					ranges[-1][1] = i
+				else:
+					ranges.append([i, i])
+			return ','.join([f'{r[0]}' if r[0] == r[1] else f'{r[0]}-{r[1]}' for r in ranges])
+
+		if self.epochs is None:
+			epochs = 'all'
+		else:
+			epochs = f'{self.epochs[0]}:{self.epochs[1] if self.epochs[1] is not None else ""}'
+
+		return ids(self.ranks), ids(self.windows), epochs
+
+
+def forma_select_tracefiles(tracefiles, selection):
+
+	""" returns the trace files of the selected ranks, or None if a selected
+		rank has no trace file
+	"""
+
+	if selection.ranks is None:
+		return tracefiles
+	if selection.ranks[-1] >= len(tracefiles):
+		return None
+
+	return [tracefiles[r] for r in selection.ranks]
+
+
+def forma_select_error(selection, ranks, wins, epochs_per_window):
+
+	""" returns why selection cannot be analysed, on an execution of ranks 
+		ranks and wins windows with epochs_per_window, or None if it can 
+	"""
+
+	if selection.ranks is not None and selection.ranks[-1] >= ranks:
+		return f'There are only {ranks} trace files, i.e. ranks 0-{ranks-1}, to select from.'
+	if selection.windows is not None and selection.windows[-1] >= wins:
+		return f'There are only {wins} memory windows, i.e. windows 0-{wins-1}, to select from.'
+	if not selection.selects_epochs(epochs_per_window):
+		return 'There are no epochs to analyse in the selected memory windows.'
+
+	return None
+
+
+
+def forma_select_epoch_targets(epoch_last_target, wins, epochs):
+
+	""" returns the target rank that each epoch of a rank inherits from the ops 
+		of the rank before it (cf. forma_calculate_dt_bounds()), as an array 
+		indexed by [window, epoch] (-1 where there is no MPI_Put/MPI_Acc before), 
+		and the target rank of the last MPI_Put/MPI_Acc of the rank (-1 if there 
+		is none), out of the epoch_last_target of the rank (cf. forma_parse_rank()) 
+	"""
+
+	last = np.full(wins*epochs, -1, dtype=np.int64)
+	for (win_id, epoch), targetrank in epoch_last_target.items():
+		if 0 <= win_id < wins and 0 <= epoch < epochs:
+			last[win_id*epochs + epoch] = targetrank
+
+	last_setter = np.where(last > -1, np.arange(len(last)), -1)
+	np.maximum.accumulate(last_setter, out=last_setter)
+	inherited = np.full(len(last), -1, dtype=np.int64)
+	inherited[1:] = np.where(last_setter[:-1] > -1, last[np.maximum(last_setter[:-1], 0)], -1)
+
+	return inherited.reshape(wins, epochs), int(last[last_setter[-1]]) if len(last) > 0 and last_setter[-1] > -1 else -1
+
+
+def forma_select_dt_bounds(tracefiles, selection, wins, opdata, epoch_last_targets, jobs=1, native=True):
+
+	""" calculates the data transfer bounds of the ops of the selected ranks
+		in opdata (with ranks numbered from 0, cf. forma_parse_traces()), out
+		of the fences of their target ranks. epoch_last_targets holds the 
+		epoch_last_target of each selected rank (cf. forma_parse_rank()), out 
+		of which the target rank that MPI_Get inherit at the start of each 
+		epoch is found. The trace files of target ranks that are not selected, 
+		or of the ranks before that an MPI_Get inherits from, are parsed for 
+		their fences only. 
+	"""
+
+	rank_ids = np.array(selection.ranks if selection.ranks is not None else range(len(tracefiles)), dtype=np.int64)
+	epochs = max([max(e, default=0) for e in opdata.epochs_per_window], default=0)
+
+	## fences of the selected ranks, by original rank id
+	fence_rows = np.nonzero(opdata.opcode[:] == 3)[0]
+	stores = [fod.FormaOpdata({c[0]: getattr(opdata, c[0])[fence_rows] for c in fod.FormaOpdata.columns})]
+	stores[0].rank[:] = rank_ids[stores[0].rank]
+
+	## epoch_targets[rank, win, epoch] is the target rank inherited at the start of 
+	## epoch of window win on rank, and last_target that of the last MPI_Put/MPI_Acc 
+	## of each rank read so far, by original rank id
+	epoch_targets = np.full((len(rank_ids), wins, epochs), -1, dtype=np.int64)
+	last_target = dict()
+	for pos, r in enumerate(rank_ids.tolist()):
+		epoch_targets[pos], last_target[r] = forma_select_epoch_targets(epoch_last_targets[pos], wins, epochs)
+
+	def parse_fences(ranks):
+		print(f'Reading fences of {len(ranks)} rank(s) outside the selection.\n')
+		rank_epoch_last_targets = []
+		fences = fp.forma_parse_traces([tracefiles[r] for r in ranks], jobs, native=native, selection=selection, fences_only=True, epoch_last_targets=rank_epoch_last_targets)[3]
+		fences.rank[:] = np.array(ranks, dtype=np.int64)[fences.rank]
+		stores.append(fences)
+		for r, epoch_last_target in zip(ranks, rank_epoch_last_targets):
+			last_target[r] = forma_select_epoch_targets(epoch_last_target, wins, epochs)[1]
+
+	## MPI_Get before any MPI_Put/MPI_Acc of their epoch inherit the target rank 
+	## of their epoch, and, if there is no MPI_Put/MPI_Acc before on their rank 
+	## either, that of the last MPI_Put/MPI_Acc of the ranks before (0 if there is 
+	## none), whose fences are read, and last target rank found, if they are not selected
+	opcodes = opdata.opcode[:]
+	keys = (opdata.rank[:].astype(np.int64)*wins + opdata.window[:])*epochs + opdata.epoch[:]
+	setters = (opcodes != 3) & (opcodes != 0)
+	last_setter = np.where(setters, np.arange(len(opcodes)), -1)
+	np.maximum.accumulate(last_setter, out=last_setter)
+	inherits = (opcodes == 0) & (last_setter < np.searchsorted(keys, keys))
+	unresolved = inherits & (epoch_targets.reshape(-1)[keys] < 0)
+	unresolved_ranks = np.unique(opdata.rank[unresolved]).tolist()
+
+	def rank_before(rank):
+		## nearest rank before rank with an MPI_Put/MPI_Acc, or not read yet (-1 if none)
+		rank -= 1
+		while rank >= 0 and last_target.get(rank, 0) < 0:
+			rank -= 1
+		return rank
+
+	while True:
+		missing = sorted({rank_before(int(rank_ids[pos])) for pos in unresolved_ranks} - set(last_target.keys()) - {-1})
+		if not missing:
+			break
+		parse_fences(missing)
+
+	for pos in unresolved_ranks:
+		before = rank_before(int(rank_ids[pos]))
+		epoch_targets[pos][epoch_targets[pos] < 0] = last_target[before] if before >= 0 else 0
+
+	## target ranks of the selected ops that are neither selected nor read yet
+	targets = set(np.unique(opdata.targetrank[np.nonzero(setters)[0]]).tolist())
+	targets.update(np.unique(epoch_targets.reshape(-1)[keys[inherits]]).tolist())
+	other_ranks = sorted([r for r in targets if 0 <= r < len(tracefiles) and r not in last_target])
+	if other_ranks:
+		parse_fences(other_ranks)
+
+	fences = fod.FormaOpdata({c[0]: np.concatenate([getattr(s, c[0]) for s in stores]) for c in fod.FormaOpdata.columns},
+							opdata.epochs_per_window)
+
+	return fp.forma_calculate_dt_bounds(len(tracefiles), wins, opdata, fences, epoch_targets)
+
+
+def forma_select_traces(selection, ranks, wins, callcount_per_opcode, opdata, total_exec_time_per_rank,
+						all_window_sizes_per_rank, all_window_durations_per_rank, epochs_per_window_per_rank, rank_ids=None, copy=False):
+
+	""" restricts the parsed traces (as returned by forma_parse_traces(), with
+		data transfer bounds) to the selection, and numbers the selected ranks,
+		windows and epochs from 0. If rank_ids is given, ranks of opdata are
+		numbered after it (e.g. only the selected ranks have been parsed),
+		otherwise ranks of opdata are the original ones. Ops of the selection
+		are renumbered in place if they are all there is in opdata (unless copy
+		is set), otherwise they are copied to a new store. Returns the selected traces, as
+		forma_parse_traces() does (without moments).
+	"""
+
+	ranks_parsed = rank_ids is not None
+	if rank_ids is None:
+		rank_ids = list(range(ranks))
+	rank_ids = np.array(rank_ids, dtype=np.int64)
+	windows = selection.windows if selection.windows is not None else list(range(wins))
+
+	## position of each selected rank, and of each selected window (-1 if not selected)
+	rank_pos = np.full(max(ranks, 1), -1, dtype=np.int64)
+	for pos, r in enumerate(rank_ids.tolist()):
+		if selection.ranks is None or r in selection.ranks:
+			rank_pos[pos] = pos
+	selected_pos = np.nonzero(rank_pos > -1)[0]
+	rank_pos[selected_pos] = np.arange(len(selected_pos))
+	win_pos = np.full(max(wins, 1), -1, dtype=np.int64)
+	win_pos[windows] = np.arange(len(windows))
+
+	keep = [np.nonzero((rank_pos[opdata.rank[chunk]] > -1) & selection.keeps_rows(opdata.window[chunk], opdata.epoch[chunk]))[0] + chunk.start
+			for chunk in opdata.chunks()]
+	kept = sum([len(k) for k in keep])
+
+	if kept < len(opdata) or copy:
+		opdata = fod.FormaOpdata({c[0]: getattr(opdata, c[0])[np.concatenate(keep)] for c in fod.FormaOpdata.columns},
+								opdata.epochs_per_window)
+
+	for chunk in opdata.chunks():
+		opdata.rank[chunk] = rank_pos[opdata.rank[chunk]]
+		opdata.window[chunk] = win_pos[opdata.window[chunk]]
+		opdata.epoch[chunk] -= selection.first_epoch
+	opdata.value_orders = dict()
+
+	def select(per_rank):
+		return [[per_rank[pos][w] for w in windows] for pos in selected_pos.tolist()]
+
+	epochs_per_window_per_rank = [[selection.epoch_count(e) for e in epochs] for epochs in select(epochs_per_window_per_rank)]
+	opdata.epochs_per_window = epochs_per_window_per_rank
+
+	## call counts of the selected ops, unless they are the ones counted while 
+	## parsing (only the selected ranks have been parsed, with all of their ops)
+	if selection.filters_ops() or not ranks_parsed:
+		callcount_per_opcode = list(callcount_per_opcode)
+		callcount_per_opcode[:4] = [0, 0, 0, 0]
+		for chunk in opdata.chunks():
+			counts = np.bincount(opdata.opcode[chunk], minlength=4)
+			callcount_per_opcode[:4] = [c+int(n) for c, n in zip(callcount_per_opcode[:4], counts)]
+		## fences that open the first epoch of a window are not kept in opdata
+		if selection.epochs is None:
+			callcount_per_opcode[3] += sum([len([e for e in epochs if e > 0]) for epochs in epochs_per_window_per_rank])
+
+	return (len(selected_pos), len(windows), callcount_per_opcode, opdata,
+			[total_exec_time_per_rank[pos] for pos in selected_pos.tolist()],
+			select(all_window_sizes_per_rank), select(all_window_durations_per_rank), epochs_per_window_per_rank)
@@ -31,6 +31,520 @@ from pydumpi import DumpiTrace
 import forma_trace as ft
 
 
+## running statistics for the incremental (INC) version of foRMA, where 
+## values are not kept in memory, but only used to update the moments of 
+## the group they belong to (cf. FormaINCTrace in forma_trace.py)
+
+class FormaMoments:
+
+	""" count, aggregate, min, max, mean and sum of squared deviations 
+		(Welford) of a stream of values. Moments of disjoint streams 
+		can be merged, so that per-epoch moments give per-rank or 
+		per-window moments without going back to the values. 
+	"""
+
+	__slots__ = ('count', 'total', 'min', 'max', 'mean', 'm2', 'sketch', 'epoch_means')
+
+	def __init__(self):
+		self.count = 0
+		self.total = 0
+		self.min = 0
+		self.max = 0
+		self.mean = 0.0
+		self.m2 = 0.0
+		## FormaQuantiles of the values, if they are sketched (None otherwise)
+		self.sketch = None
+		## FormaMoments of the means of the values of each epoch, if they 
+		## are known (None otherwise), cf. forma_grouped_epoch_means()
+		self.epoch_means = None
+
+
+	def __len__(self):
+		return self.count
+
+
+	def update(self, value):
+
+		self.count += 1
+		self.total += value
+		if self.count == 1:
+			self.min = value
+			self.max = value
+		elif value < self.min:
+			self.min = value
+		elif value > self.max:
+			self.max = value
+
+		delta = value - self.mean
+		self.mean += delta / self.count
+		self.m2 += delta * (value - self.mean)
+
+		return self
+
+
+	def merge(self, other):
+
+		## parallel variant of Welford's algorithm (Chan et al.)
+		if other.count == 0:
+			return self
+		if self.count == 0:
+			self.min = other.min
+			self.max = other.max
+		else:
+			self.min = min(self.min, other.min)
+			self.max = max(self.max, other.max)
+
+		count = self.count + other.count
+		delta = other.mean - self.mean
+		self.mean += delta * other.count / count
+		self.m2 += other.m2 + delta * delta * self.count * other.count / count
+		self.count = count
+		self.total += other.total
+
+		if other.sketch is not None:
+			if self.sketch is None:
+				self.sketch = FormaQuantiles(other.sketch.k)
+			self.sketch.merge(other.sketch)
+
+		if other.epoch_means is not None:
+			if self.epoch_means is None:
+				self.epoch_means = FormaMoments()
+			self.epoch_means.merge(other.epoch_means)
+
+		return self
+
+
+	def subtracted_from(self, offset):
+
+		""" returns the moments of (offset - value) for all values of this 
+			stream, e.g. the moments of the data transfer bounds of a set 
+			of ops, given the moments of their start times and the exit 
+			time of the fence that closes their epoch on the target rank
+		"""
+
+		moments = FormaMoments()
+		moments.count = self.count
+		moments.total = self.count * offset - self.total
+		moments.min = offset - self.max
+		moments.max = offset - self.min
+		moments.mean = offset - self.mean
+		moments.m2 = self.m2
+
+		return moments
+
+
+	def stats_x4(self):
+		return [self.total, self.min, self.max, self.total/self.count]
+
+
+	def stats_x6(self):
+		## the median cannot be calculated incrementally, only approximated 
+		## if the values are sketched
+		median = None
+		if self.sketch is not None:
+			median = self.sketch.quantile(0.5)
+		return self.stats_x4() + [median, np.sqrt(self.m2/self.count)]
+
+
+	def stats_tail(self):
+		if self.sketch is None:
+			return [None]*len(tail_quantiles)
+		return [self.sketch.quantile(q) for q in tail_quantiles]
+
+
+
+## quantiles that are reported as tail latencies, besides the median
+tail_quantiles = [0.9, 0.99, 0.999]
+
+
+class FormaQuantiles:
+
+	""" mergeable quantile sketch (KLL) of a stream of values, which gives 
+		approximate medians and tail latencies in bounded memory. Values are 
+		kept in a stack of levels, where each value of level h stands for 2^h 
+		values of the stream. Whenever a level exceeds its capacity, it is 
+		sorted and every other value is promoted to the next level, so that 
+		the sketch holds O(k) values, however long the stream. The rank error 
+		of quantiles is in the order of 1/k of the count (cf. forma_set_quantile_error()), 
+		while quantiles are exact as long as no level has been compacted. 
+	"""
+
+	## accuracy parameter of new sketches
+	default_k = 200
+
+	## levels are replaced rather than modified, so that new sketches can 
+	## share their empty level 0, e.g. the many small sketches of FormaINCTrace
+	empty_level = np.zeros(0, dtype=np.int64)
+
+	__slots__ = ('k', 'count', 'levels', 'buffer', 'compactions')
+
+	def __init__(self, k=None):
+		self.k = FormaQuantiles.default_k if k is None else k
+		self.count = 0
+		self.levels = [FormaQuantiles.empty_level]
+		## values of update() are appended to level 0 in batches
+		self.buffer = []
+		self.compactions = 0
+
+
+	def __len__(self):
+		return self.count
+
+
+	def update(self, value):
+
+		self.count += 1
+		self.buffer.append(value)
+		if len(self.buffer) >= self.k:
+			self.flush()
+
+		return self
+
+
+	def update_many(self, values):
+
+		self.flush()
+		self.count += len(values)
+		self.levels[0] = np.concatenate((self.levels[0], np.asarray(values, dtype=np.int64)))
+		self.compact()
+
+		return self
+
+
+	def flush(self):
+
+		if self.buffer:
+			self.levels[0] = np.concatenate((self.levels[0], np.array(self.buffer, dtype=np.int64)))
+			self.buffer = []
+			self.compact()
+
+
+	def capacity(self, level):
+
+		## capacities decrease geometrically towards the lowest level (KLL)
+		return max(2, int(np.ceil(self.k * (2/3)**(len(self.levels)-1-level))))
+
+
+	def compact(self):
+
+		while True:
+			full = [h for h in range(len(self.levels)) if len(self.levels[h]) > self.capacity(h)]
+			if not full:
+				return
+			h = full[0]
+			if h+1 == len(self.levels):
+				self.levels.append(np.zeros(0, dtype=np.int64))
+
+			## an odd value out stays at its level, the rest are halved. Taking 
+			## the odd and the even positions in turn keeps the error unbiased 
+			values = np.sort(self.levels[h])
+			odd = len(values) % 2
+			self.levels[h] = values[:odd]
+			self.levels[h+1] = np.concatenate((self.levels[h+1], values[odd+self.compactions%2::2]))
+			self.compactions += 1
+
+
+	def merge(self, other):
+
+		self.flush()
+		for h in range(len(other.levels)):
+			if h == len(self.levels):
+				self.levels.append(np.zeros(0, dtype=np.int64))
+			self.levels[h] = np.concatenate((self.levels[h], other.levels[h]))
+		self.levels[0] = np.concatenate((self.levels[0], np.array(other.buffer, dtype=np.int64)))
+		self.count += other.count
+		self.compactions += other.compactions
+		self.compact()
+
+		return self
+
+
+	def merge_subtracted(self, sketches, offsets):
+
+		""" merges the sketches of (offset - value) for all values of each of 
+			sketches, e.g. the data transfer bounds of the ops of each epoch and 
+			target rank, given the sketches of their start times and the exit 
+			times of the fences of the targets (cf. FormaMoments.subtracted_from()). 
+			Shifting the values of a sketch keeps its accuracy, and all of them 
+			are merged at once, so that the levels are compacted once. 
+		"""
+
+		self.flush()
+		levels = [[level] for level in self.levels]
+		for sketch, offset in zip(sketches, offsets):
+			for h in range(len(sketch.levels)):
+				if h == len(levels):
+					levels.append([])
+				levels[h].append(offset - sketch.levels[h])
+			levels[0].append(offset - np.array(sketch.buffer, dtype=np.int64))
+			self.count += sketch.count
+			self.compactions += sketch.compactions
+		self.levels = [np.concatenate(level) for level in levels]
+		self.compact()
+
+		return self
+
+
+	def quantile(self, q):
+
+		""" returns the (approximate) q-th quantile of the stream, q in [0, 1] """
+
+		self.flush()
+		if self.count == 0:
+			return 0
+
+		if self.compactions == 0:
+			## all values are at hand, i.e. same as for the in-memory version
+			values = np.sort(self.levels[0])
+			if q == 0.5:
+				return float(forma_segment_median(values, 0, len(values)))
+			return float(forma_segment_quantile(values, 0, len(values), q))
+
+		values = np.concatenate(self.levels)
+		weights = np.concatenate([np.full(len(self.levels[h]), 1 << h, dtype=np.int64) for h in range(len(self.levels))])
+		order = np.argsort(values, kind='stable')
+		ranks = np.cumsum(weights[order])
+		position = min(int(np.searchsorted(ranks, q*self.count)), len(values)-1)
+
+		return float(values[order[position]])
+
+
+
+def forma_set_quantile_error(error):
+
+	""" sets the accuracy parameter of new FormaQuantiles, so that the rank 
+		error of their quantiles is in the order of error (as a fraction of 
+		the count of values), e.g. 0.01 for quantiles within 1% of the values 
+	"""
+
+	FormaQuantiles.default_k = max(8, int(np.ceil(2/error)))
+
+
+def forma_segment_median(values, first, count):
+
+	""" medians of the sorted segments values[first:first+count] (count > 0), 
+		same as np.median(), i.e. the average of the two middle values for 
+		even counts 
+	"""
+
+	lower = values[first + (count-1)//2].astype(np.float64)
+	upper = values[first + count//2].astype(np.float64)
+
+	return (lower + upper)/2
+
+
+def forma_segment_quantile(values, first, count, q):
+
+	""" q-th quantiles of the sorted segments values[first:first+count] 
+		(count > 0), interpolated linearly between the closest values, 
+		same as np.quantile() 
+	"""
+
+	position = np.multiply(count-1, q)
+	lower = np.floor(position).astype(np.int64)
+	upper = np.minimum(lower+1, count-1)
+	fraction = position - lower
+	a = values[first + lower].astype(np.float64)
+	b = values[first + upper].astype(np.float64)
+
+	return np.where(fraction >= 0.5, b - (b-a)*(1-fraction), a + (b-a)*fraction)
+
+
+
+## statistics of groups of values, for the in-memory (IM) version of foRMA, 
+## where all values are at hand. Instead of collecting the values of each 
+## group (per rank and opcode, per opcode, etc.) into a vector of its own 
+## and calculating its statistics separately, the statistics of all groups 
+## are calculated at once out of the opdata columns (cf. forma_grouped_stats())
+
+class FormaStats:
+
+	""" count, aggregate, min, max, mean, median and standard deviation 
+		of a group of values, as calculated by forma_grouped_stats()
+	"""
+
+	__slots__ = ('count', 'total', 'min', 'max', 'mean', 'median', 'std', 'tail', 'epoch_means')
+
+	def __init__(self):
+		self.count = 0
+		self.total = 0
+		self.min = 0
+		self.max = 0
+		self.mean = 0.0
+		self.median = 0.0
+		self.std = 0.0
+		## values at tail_quantiles
+		self.tail = [0.0]*len(tail_quantiles)
+		## FormaMoments of the means of the values of each epoch, cf. FormaMoments
+		self.epoch_means = None
+
+
+	def __len__(self):
+		return self.count
+
+
+	def stats_x4(self):
+		return [self.total, self.min, self.max, self.total/self.count]
+
+
+	def stats_x6(self):
+		return self.stats_x4() + [self.median, self.std]
+
+
+	def stats_tail(self):
+		return self.tail
+
+
+
+def forma_grouped_stats(keys, values, groups, value_order=None):
+
+	""" statistics of values per group, where keys holds the group (in range(groups)) 
+		of each value. Values are sorted once, and then (stably) by group, after 
+		which all statistics of all groups are reductions over contiguous segments. 
+		value_order is the order that sorts values (np.argsort(values)), which can 
+		be shared by several groupings of the same values. Returns 
+		[ count, total, min, max, mean, median, std, tail ], each an array of 
+		length groups (groups x len(tail_quantiles) for tail), i.e. the fields 
+		of FormaStats for all groups. 
+	"""
+
+	values = np.asarray(values, dtype=np.int64)
+	if value_order is None:
+		value_order = np.argsort(values)
+
+	## small keys are sorted by radix sort, i.e. in linear time
+	keys = np.asarray(keys)[value_order].astype(np.uint16 if groups <= (1 << 16) else np.int64)
+	group_order = np.argsort(keys, kind='stable')
+	keys = keys[group_order].astype(np.int64)
+	values = values[value_order[group_order]]
+
+	count = np.bincount(keys, minlength=groups)
+	first = np.cumsum(count) - count
+	nonempty = (count > 0)
+	last = np.where(nonempty, first + count - 1, 0)
+	first = np.where(nonempty, first, 0)
+
+	total = np.zeros(groups, dtype=np.int64)
+	vmin = np.zeros(groups, dtype=np.int64)
+	vmax = np.zeros(groups, dtype=np.int64)
+	median = np.zeros(groups)
+	tail = np.zeros((groups, len(tail_quantiles)))
+	m2 = np.zeros(groups)
+
+	if nonempty.any():
+		total[nonempty] = np.add.reduceat(values, first[nonempty])
+		vmin[nonempty] = values[first[nonempty]]
+		vmax[nonempty] = values[last[nonempty]]
+
+		median[nonempty] = forma_segment_median(values, first[nonempty], count[nonempty])
+		for i, q in enumerate(tail_quantiles):
+			tail[nonempty, i] = forma_segment_quantile(values, first[nonempty], count[nonempty], q)
+
+	mean = np.divide(total, count, out=np.zeros(groups), where=nonempty)
+
+	if nonempty.any():
+		deviation = values - mean[keys]
+		m2[nonempty] = np.add.reduceat(deviation*deviation, first[nonempty])
+	std = np.sqrt(np.divide(m2, count, out=np.zeros(groups), where=nonempty))
+
+	return [count, total, vmin, vmax, mean, median, std, tail]
+
+
+def forma_stats_of_group(stats, group):
+
+	""" returns a FormaStats for the given group of the output of forma_grouped_stats() """
+
+	group_stats = FormaStats()
+	if stats[0][group] > 0:
+		group_stats.count = int(stats[0][group])
+		group_stats.total = int(stats[1][group])
+		group_stats.min = int(stats[2][group])
+		group_stats.max = int(stats[3][group])
+		group_stats.mean = float(stats[4][group])
+		group_stats.median = float(stats[5][group])
+		group_stats.std = float(stats[6][group])
+		group_stats.tail = stats[7][group].tolist()
+
+	return group_stats
+
+
+def forma_epoch_totals(rank, window, epoch, opcode, values):
+
+	""" returns the group (rank*4 + opcode) of the values of each opcode of 
+		each epoch of each rank, as samples, along with their count and total, 
+		out of the rank, window, epoch and opcode of each value. Values are 
+		sorted by (rank, window, epoch), as the rows of FormaOpdata, so that 
+		epochs are told apart in one pass, without sorting the values. 
+	"""
+
+	if len(values) == 0:
+		return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+
+	first = np.nonzero(np.concatenate(([True], (rank[1:] != rank[:-1]) | (window[1:] != window[:-1]) | (epoch[1:] != epoch[:-1]))))[0]
+	sample = np.zeros(len(values), dtype=np.int64)
+	sample[first[1:]] = 1
+	np.cumsum(sample, out=sample)
+	sample = sample*4 + opcode
+
+	count = np.bincount(sample, minlength=len(first)*4)
+	total = np.bincount(sample, weights=values, minlength=len(first)*4)
+	group = np.repeat(np.asarray(rank[first], dtype=np.int64)*4, 4) + np.tile(np.arange(4), len(first))
+	nonempty = (count > 0)
+
+	return group[nonempty], count[nonempty], total[nonempty]
+
+
+def forma_grouped_epoch_means(group, count, total, groups):
+
+	""" returns a FormaMoments per group, of the means of the samples of the 
+		group (e.g. the values of each epoch, cf. forma_epoch_totals()), out 
+		of the group, count and total of the values of each sample 
+	"""
+
+	keep = (group >= 0) & (group < groups) & (count > 0)
+	group = group[keep]
+	means = total[keep]/count[keep]
+
+	samples = np.bincount(group, minlength=groups)
+	nonempty = (samples > 0)
+	sums = np.bincount(group, weights=means, minlength=groups)
+	mean = np.divide(sums, samples, out=np.zeros(groups), where=nonempty)
+	m2 = np.bincount(group, weights=(means - mean[group])**2, minlength=groups)
+	vmin = np.full(groups, np.inf)
+	np.minimum.at(vmin, group, means)
+	vmax = np.full(groups, -np.inf)
+	np.maximum.at(vmax, group, means)
+
+	epoch_means = [FormaMoments() for i in range(groups)]
+	for i in np.nonzero(nonempty)[0].tolist():
+		moments = epoch_means[i]
+		moments.count = int(samples[i])
+		moments.total = float(sums[i])
+		moments.min = float(vmin[i])
+		moments.max = float(vmax[i])
+		moments.mean = float(mean[i])
+		moments.m2 = float(m2[i])
+
+	return epoch_means
+
+
+
+
+def forma_concatenate(vectors):
+
+	""" concatenates value vectors or, in the incremental version, merges 
+		the corresponding FormaMoments 
+	"""
+
+	if vectors and isinstance(vectors[0], FormaMoments):
+		moments = FormaMoments()
+		for m in vectors:
+			moments.merge(m)
+		return moments
+
+	return np.concatenate(vectors)
+
+
 def forma_calculate_stats_x4(values_vector):
 
 	""" this is a vector that contains the output values in the 
@@ -40,12 +554,14 @@ def forma_calculate_stats_x4(values_vector):
 
 	output_stats = []
 
-	if values_vector == []:
+	if len(values_vector) == 0:
 		output_stats = [0]*4
+	elif isinstance(values_vector, (FormaMoments, FormaStats)):
+		output_stats = values_vector.stats_x4()
 	else:
-		output_stats.append(sum(values_vector))
-		output_stats.append(min(values_vector))
-		output_stats.append(max(values_vector))
+		output_stats.append(np.sum(values_vector))
+		output_stats.append(np.min(values_vector))
+		output_stats.append(np.max(values_vector))
 		output_stats.append(output_stats[0]/len(values_vector))
 
 	return output_stats
@@ -59,12 +575,14 @@ def forma_calculate_stats_x6(values_vector):
 	"""
 	output_stats = []
 
-	if values_vector == []:
+	if len(values_vector) == 0:
 		output_stats = [0]*6
+	elif isinstance(values_vector, (FormaMoments, FormaStats)):
+		output_stats = values_vector.stats_x6()
 	else:
-		output_stats.append(sum(values_vector))
-		output_stats.append(min(values_vector))
-		output_stats.append(max(values_vector))
+		output_stats.append(np.sum(values_vector))
+		output_stats.append(np.min(values_vector))
+		output_stats.append(np.max(values_vector))
 		output_stats.append(output_stats[0]/len(values_vector))
 		output_stats.append(np.median(values_vector))
 		output_stats.append(np.std(values_vector))
@@ -72,70 +590,434 @@ def forma_calculate_stats_x6(values_vector):
 	return output_stats
 
 
-def forma_merge_dt_op_durations_for_epoch(opdata_for_epoch):
+def forma_calculate_stats_tail(values_vector):
+
+	""" this is a vector that contains the values at tail_quantiles, 
+		namely: [ p90, p99, p99.9 ], or None where these are not available 
+		(incremental version)
+	"""
+
+	if len(values_vector) == 0:
+		output_stats = [0]*len(tail_quantiles)
+	elif isinstance(values_vector, (FormaMoments, FormaStats)):
+		output_stats = values_vector.stats_tail()
+	else:
+		output_stats = np.quantile(values_vector, tail_quantiles).tolist()
+
+	return output_stats
+
+
+def forma_grouped_stats_x4(keys, values, groups):
+
+	""" count, aggregate, min and max of values per group, where keys holds 
+		the group (in range(groups)) of each value, calculated by a single 
+		segmented reduction over the values sorted by group. Returns 
+		[ count, total, min, max ], each an array of length groups, with 
+		zeros for empty groups. 
+	"""
+
+	keys = np.asarray(keys, dtype=np.int64)
+	values = np.asarray(values, dtype=np.int64)[np.argsort(keys, kind='stable')]
+
+	count = np.bincount(keys, minlength=groups)
+	total = np.zeros(groups, dtype=np.int64)
+	vmin = np.zeros(groups, dtype=np.int64)
+	vmax = np.zeros(groups, dtype=np.int64)
+
+	nonempty = (count > 0)
+	if nonempty.any():
+		first = (np.cumsum(count) - count)[nonempty]
+		total[nonempty] = np.add.reduceat(values, first)
+		vmin[nonempty] = np.minimum.reduceat(values, first)
+		vmax[nonempty] = np.maximum.reduceat(values, first)
+
+	return [count, total, vmin, vmax]
+
+
+def forma_per_epoch_data(wins, epochs_per_window, durations, dt_bounds, data_vol):
+
+	""" splits statistics of op durations and data transfer bounds per epoch 
+		and opcode, as [ count, total, min, max ] arrays indexed by group 
+		(win_id*max_epochs + epoch)*4 + opcode, and data volume per epoch, 
+		indexed by win_id*max_epochs + epoch, into per window data, i.e. 
+		per_epoch_data[win_id] = [ dt_bounds, durations, data_vol ], where 
+		dt_bounds and durations are [ count, total, min, max ], each an 
+		array of shape (epochs, 3) and (epochs, 4) respectively, and data_vol 
+		is an array of length epochs. 
+	"""
+
+	max_epochs = len(data_vol) // max(wins, 1)
+	per_epoch_data = []
+
+	for win_id in range(wins):
+		epochs = epochs_per_window[win_id]
+		groups = slice(win_id*max_epochs*4, (win_id*max_epochs + epochs)*4)
+		nonempty = [(durations[0][groups] > 0).reshape(epochs, 4), (dt_bounds[0][groups] > 0).reshape(epochs, 4)[:, :3]]
+		window_durations = [np.where(nonempty[0], d[groups].reshape(epochs, 4), 0) for d in durations[:4]]
+		window_dt_bounds = [np.where(nonempty[1], d[groups].reshape(epochs, 4)[:, :3], 0) for d in dt_bounds[:4]]
+		per_epoch_data.append([window_dt_bounds, window_durations, data_vol[win_id*max_epochs:win_id*max_epochs+epochs]])
+
+	return per_epoch_data
+
 
-	per_opcode_dt_bounds_for_epoch = [[] for i in range(3)]
-	per_opcode_durations_for_epoch = [[] for i in range(4)]
-	epoch_data_vol_sum = 0
+def forma_break_down_per_epoch(wins, opdata):
+
+	""" in-memory counterpart of the per epoch breakdown of forma_merge_incremental() 
+		and forma_break_down_out_of_core(). Instead of gathering the ops of each 
+		epoch separately, the statistics of all epochs of all windows are 
+		calculated by one segmented reduction over the ops, grouped by 
+		(window, epoch, opcode). Returns per_epoch_data, cf. forma_per_epoch_data(). 
+	"""
 
-	# print(f'opdata for epoch is {opdata_for_epoch}')
+	max_epochs = max(opdata.epochs_per_window[0]+[0])
+	groups = wins*max_epochs*4
 
-	# print(f'per_opcode_dt_bounds_for_epoch before: {per_opcode_dt_bounds_for_epoch}')
+	opcodes = opdata.opcode.astype(np.int64)
+	keys = (opdata.window.astype(np.int64)*max_epochs + opdata.epoch)*4 + opcodes
+	ops = (opcodes != 3)
 
-	for op in opdata_for_epoch:
-		if op != []: # i.e. take into account this trace parsing fluke where we register the last MPI_Win_fence, which does not belong to an epoch
-			#print(f'operation is {op}')
-			per_opcode_durations_for_epoch[op[0]].append(op[2])
-			if op[0] != 3: 	# i.e. if type != MPI_Win_fence
-				per_opcode_dt_bounds_for_epoch[op[0]].append(op[4])
-				epoch_data_vol_sum = epoch_data_vol_sum + op[3]
+	durations = forma_grouped_stats_x4(keys, opdata.duration, groups)
+	dt_bounds = forma_grouped_stats_x4(keys[ops], opdata.dtbound[ops], groups)
+	data_vol = forma_grouped_stats_x4(keys[ops]//4, opdata.bytes[ops], wins*max_epochs)[1]
 
-	# print(f'per_opcode_dt_bounds_for_epoch after: {per_opcode_dt_bounds_for_epoch}')
+	return forma_per_epoch_data(wins, opdata.epochs_per_window[0], durations, dt_bounds, data_vol)
+
+
+def forma_epoch_stats_x4(stats):
+
+	""" returns the output of forma_calculate_stats_x4() for each opcode of each 
+		epoch, out of per epoch [ count, total, min, max ] (cf. forma_per_epoch_data())
+	"""
 
-	return per_opcode_dt_bounds_for_epoch, per_opcode_durations_for_epoch, epoch_data_vol_sum
+	return [[[t, vmin, vmax, t/c] if c > 0 else [0]*4 for c, t, vmin, vmax in zip(*epoch)] 
+			for epoch in zip(*[s.tolist() for s in stats])]
 
 
 
-def forma_break_down_per_rank_per_window(ranks, wins, opdata_per_rank):
+def forma_break_down_per_rank_per_window(ranks, wins, opdata):
 
 	""" for vectors that refer to RMA ops, we use the following 
 	convention for indexing: 0 - MPI_Get, 1 - MPI_Put, 2 - MPI_Acc
 	and if present, then 3 - MPI_Win_fence
 	"""
 	#total_ops_num = [0]*4
-	per_opcode_op_durations_per_rank = [[[] for i in range(4)] for j in range(ranks)]
-	per_opcode_dt_bounds_per_rank = [[[] for i in range(3)] for j in range(ranks)]
+
+	## one group per rank and opcode
+	opcodes = opdata.opcode.astype(np.int64)
+	keys = opdata.rank.astype(np.int64)*4 + opcodes
+	ops = (opcodes != 3)
+
+	durations = forma_grouped_stats(keys, opdata.duration, ranks*4, opdata.value_order('duration'))
+	dt_bounds = forma_grouped_stats(keys[ops], opdata.dtbound[ops], ranks*4, opdata.value_order('dtbound'))
+
+	per_opcode_op_durations_per_rank = [[forma_stats_of_group(durations, j*4+i) for i in range(4)] for j in range(ranks)]
+	per_opcode_dt_bounds_per_rank = [[forma_stats_of_group(dt_bounds, j*4+i) for i in range(3)] for j in range(ranks)]
+
+	## means of the values of each epoch, per rank and opcode (cf. forma_compare.py)
+	duration_means = forma_grouped_epoch_means(*forma_epoch_totals(opdata.rank, opdata.window, opdata.epoch, opcodes, opdata.duration), ranks*4)
+	dt_bound_means = forma_grouped_epoch_means(*forma_epoch_totals(opdata.rank[ops], opdata.window[ops], opdata.epoch[ops], opcodes[ops], opdata.dtbound[ops]), ranks*4)
+	for j in range(ranks):
+		for i in range(4):
+			per_opcode_op_durations_per_rank[j][i].epoch_means = duration_means[j*4+i]
+			if i != 3:
+				per_opcode_dt_bounds_per_rank[j][i].epoch_means = dt_bound_means[j*4+i]
+
+	data_vol = np.zeros(wins, dtype=np.int64)
+	np.add.at(data_vol, opdata.window[ops], opdata.bytes[ops])
+	per_window_data_vol = data_vol.tolist()
+
+	#print(f'per_opcode_op_durations_per_rank is {per_opcode_op_durations_per_rank}')
+
+	return per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank, per_window_data_vol
+
+
+def forma_break_down_per_opcode(opdata):
+
+	""" in-memory counterpart of merging the per rank breakdown across ranks 
+		(cf. forma_calc_stats_summary()), since medians cannot be merged. 
+		Returns the statistics of op durations per opcode, of data transfer 
+		bounds per opcode (except for fences) and of the durations of all ops, 
+		as FormaStats. 
+	"""
+
+	opcodes = opdata.opcode.astype(np.int64)
+	ops = (opcodes != 3)
+
+	durations = forma_grouped_stats(opcodes, opdata.duration, 4, opdata.value_order('duration'))
+	dt_bounds = forma_grouped_stats(opcodes[ops], opdata.dtbound[ops], 3, opdata.value_order('dtbound'))
+	all_durations = forma_grouped_stats(np.zeros(len(opcodes), dtype=np.int64), opdata.duration, 1, opdata.value_order('duration'))
+
+	return [forma_stats_of_group(durations, i) for i in range(4)], [forma_stats_of_group(dt_bounds, i) for i in range(3)], forma_stats_of_group(all_durations, 0)
+
+
+
+
+def forma_merge_incremental(ranks, wins, opdata, moments_per_rank):
+
+	""" incremental version counterpart of forma_calculate_dt_bounds() and 
+		forma_break_down_per_rank_per_window(). opdata only holds the fences 
+		of the execution, while moments_per_rank holds the running statistics 
+		gathered by FormaINCTrace for each rank. Returns the same per rank and 
+		per window breakdown, as FormaMoments instead of value vectors, plus 
+		per_epoch_data (cf. forma_per_epoch_data()). Op durations per rank come 
+		with the sketches of FormaINCTrace, while the sketches of data transfer 
+		bounds per rank are merged out of those of the start times of each epoch 
+		and target rank, shifted by the exit time of the fence of the target. 
+	"""
+
+	per_opcode_op_durations_per_rank = [[FormaMoments() for i in range(4)] for j in range(ranks)]
+	per_opcode_dt_bounds_per_rank = [[FormaMoments() for i in range(3)] for j in range(ranks)]
 	per_window_data_vol = [0 for i in range(wins)]
+	max_epochs = max(opdata.epochs_per_window[0]+[0])
+	durations_per_epoch = [FormaMoments() for i in range(wins*max_epochs*4)]
+	dt_bounds_per_epoch = [FormaMoments() for i in range(wins*max_epochs*4)]
+	data_vol_per_epoch = np.zeros(wins*max_epochs, dtype=np.int64)
+
+	## fence_end[rank][win][epoch] is the exit time of the fence that 
+	## closes epoch of window win on rank 
+	fence_rows = opdata.fence_rows(ranks, wins)
+	fence_end = np.where(fence_rows > -1, opdata.bytes[fence_rows], -1).tolist()
 
+	## same as in forma_calculate_dt_bounds(), the target rank of an MPI_Get 
+	## is the one of the last MPI_Put/MPI_Acc, in rank, window, epoch order
+	targetrank = 0
 
 	for rank in range(ranks):
+		duration_moments, start_moments, epoch_last_target, epoch_data_vol, duration_sketches = moments_per_rank[rank]
+		for opcode in range(4):
+			per_opcode_op_durations_per_rank[rank][opcode].sketch = duration_sketches[opcode]
+			per_opcode_op_durations_per_rank[rank][opcode].epoch_means = FormaMoments()
+			if opcode != 3:
+				per_opcode_dt_bounds_per_rank[rank][opcode].epoch_means = FormaMoments()
+
+		## sketches of start times and fence exit times of their targets, per opcode
+		dt_bound_sketches = [[] for i in range(3)]
+		dt_bound_offsets = [[] for i in range(3)]
+
+		start_moments_per_epoch = dict()
+		for (win_id, epoch, opcode, target), moments in start_moments.items():
+			start_moments_per_epoch.setdefault((win_id, epoch), []).append((opcode, target, moments))
+
 		for win_id in range(wins):
-			for epoch in (range(len(opdata_per_rank[rank][win_id])-1)):
-				#for op in range(len(epoch)):
-				for op in opdata_per_rank[rank][win_id][epoch]:
-					#total_ops_num[op[0]] = total_ops_num[op[0]] + 1
-					per_opcode_op_durations_per_rank[rank][op[0]].append(op[2])
-					if op[0] != 3:
-						per_opcode_dt_bounds_per_rank[rank][op[0]].append(op[4])
-						#per_opcode_data_vol[op[0]].append(op[3])
-						per_window_data_vol[win_id] = per_window_data_vol[win_id] + op[3]
+			for epoch in range(opdata.epochs_per_window[rank][win_id]):
+				group = (win_id*max_epochs + epoch)*4
+				for opcode in range(4):
+					moments = duration_moments.get((win_id, epoch, opcode))
+					if moments is not None:
+						per_opcode_op_durations_per_rank[rank][opcode].merge(moments)
+						per_opcode_op_durations_per_rank[rank][opcode].epoch_means.update(moments.mean)
+						durations_per_epoch[group+opcode].merge(moments)
+
+				epoch_dt_bounds = [FormaMoments() for i in range(3)]
+				for opcode, target, moments in start_moments_per_epoch.get((win_id, epoch), []):
+					if target == -1:
+						target = targetrank
+					dt_bounds = moments.subtracted_from(fence_end[target][win_id][epoch])
+					per_opcode_dt_bounds_per_rank[rank][opcode].merge(dt_bounds)
+					if moments.sketch is not None:
+						dt_bound_sketches[opcode].append(moments.sketch)
+						dt_bound_offsets[opcode].append(fence_end[target][win_id][epoch])
+					dt_bounds_per_epoch[group+opcode].merge(dt_bounds)
+					epoch_dt_bounds[opcode].merge(dt_bounds)
+				for opcode in range(3):
+					if epoch_dt_bounds[opcode].count > 0:
+						per_opcode_dt_bounds_per_rank[rank][opcode].epoch_means.update(epoch_dt_bounds[opcode].mean)
+
+				targetrank = epoch_last_target.get((win_id, epoch), targetrank)
+
+				epoch_data_vol_sum = epoch_data_vol.get((win_id, epoch), 0)
+				per_window_data_vol[win_id] = per_window_data_vol[win_id] + epoch_data_vol_sum
+				data_vol_per_epoch[group//4] += epoch_data_vol_sum
+
+		for opcode in range(3):
+			if dt_bound_sketches[opcode]:
+				per_opcode_dt_bounds_per_rank[rank][opcode].sketch = FormaQuantiles().merge_subtracted(dt_bound_sketches[opcode], dt_bound_offsets[opcode])
+
+	per_epoch_data = forma_per_epoch_data(wins, opdata.epochs_per_window[0], 
+										forma_grouped_moments_of(durations_per_epoch), 
+										forma_grouped_moments_of(dt_bounds_per_epoch), data_vol_per_epoch)
+
+	return per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank, per_window_data_vol, per_epoch_data
+
+
+
+def forma_grouped_moments(keys, values, groups):
+
+	""" moments of values per group, where keys holds the group (in range(groups)) 
+		of each value. Returns [ count, total, min, max, mean, m2 ], each an array 
+		of length groups, i.e. the fields of FormaMoments for all groups. 
+	"""
 
+	count = np.bincount(keys, minlength=groups)
+	total = np.zeros(groups, dtype=np.int64)
+	np.add.at(total, keys, values)
+	vmin = np.full(groups, np.iinfo(np.int64).max, dtype=np.int64)
+	np.minimum.at(vmin, keys, values)
+	vmax = np.full(groups, np.iinfo(np.int64).min, dtype=np.int64)
+	np.maximum.at(vmax, keys, values)
+	mean = np.divide(total, count, out=np.zeros(groups), where=(count > 0))
+	deviation = values - mean[keys]
+	m2 = np.zeros(groups)
+	np.add.at(m2, keys, deviation*deviation)
 
-	#print(f'per_opcode_op_durations_per_rank is {per_opcode_op_durations_per_rank}')
+	return [count, total, vmin, vmax, mean, m2]
 
-	return per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank, per_window_data_vol
 
+def forma_merge_grouped_moments(moments, other):
+
+	""" merges the output of two forma_grouped_moments() calls, 
+		cf. FormaMoments.merge() 
+	"""
+
+	count = moments[0] + other[0]
+	delta = other[4] - moments[4]
+	weight = np.divide(other[0], count, out=np.zeros(len(count)), where=(count > 0))
+	mean = moments[4] + delta*weight
+	m2 = moments[5] + other[5] + delta*delta*moments[0]*weight
 
+	return [count, moments[1]+other[1], np.minimum(moments[2], other[2]), np.maximum(moments[3], other[3]), mean, m2]
+
+
+def forma_grouped_moments_of(moments):
+
+	""" returns the same as forma_grouped_moments(), out of a list of 
+		FormaMoments, one per group 
+	"""
 
-def forma_calc_opduration_summary(ranks, total_exec_times_per_rank, per_opcode_op_durations):
+	fields = [('count', np.int64), ('total', np.int64), ('min', np.int64), ('max', np.int64), ('mean', np.float64), ('m2', np.float64)]
+
+	return [np.array([getattr(m, name) for m in moments], dtype=dtype) for name, dtype in fields]
+
+
+def forma_moments_of_group(moments, group):
+
+	""" returns a FormaMoments for the given group of the output of forma_grouped_moments() """
+
+	group_moments = FormaMoments()
+	if moments[0][group] > 0:
+		group_moments.count = int(moments[0][group])
+		group_moments.total = int(moments[1][group])
+		group_moments.min = int(moments[2][group])
+		group_moments.max = int(moments[3][group])
+		group_moments.mean = float(moments[4][group])
+		group_moments.m2 = float(moments[5][group])
+
+	return group_moments
+
+
+
+def forma_update_grouped_quantiles(sketches, keys, values):
+
+	""" adds values to the FormaQuantiles of the group they belong to, 
+		where keys holds the group (index in sketches) of each value
+	"""
+
+	order = np.argsort(keys, kind='stable')
+	keys = np.asarray(keys)[order]
+	values = np.asarray(values)[order]
+	groups, first = np.unique(keys, return_index=True)
+	last = np.append(first[1:], len(keys))
+
+	for group, i, j in zip(groups.tolist(), first.tolist(), last.tolist()):
+		sketches[group].update_many(values[i:j])
+
+
+def forma_break_down_out_of_core(ranks, wins, opdata):
+
+	""" out-of-core version counterpart of forma_break_down_per_rank_per_window(). 
+		Goes over the (memory-mapped) opdata store in chunks, and only keeps the 
+		moments per rank and opcode and per window, epoch and opcode. Returns the 
+		same as forma_merge_incremental(), i.e. the per rank breakdown as 
+		FormaMoments, plus the per epoch data needed by per_epoch_stats_to_file(). 
+		Op durations and data transfer bounds per rank are also sketched, for 
+		their medians and tail latencies. 
+	"""
+
+	max_epochs = max(opdata.epochs_per_window[0]+[0])
+	rank_groups = ranks*4
+	epoch_groups = wins*max_epochs*4
+
+	durations_per_rank = forma_grouped_moments(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), rank_groups)
+	dt_bounds_per_rank = forma_grouped_moments(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), rank_groups)
+	durations_per_epoch = forma_grouped_moments(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), epoch_groups)
+	dt_bounds_per_epoch = forma_grouped_moments(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), epoch_groups)
+	data_vol_per_epoch = np.zeros(wins*max_epochs, dtype=np.int64)
+	duration_sketches = [FormaQuantiles() for i in range(rank_groups)]
+	dt_bound_sketches = [FormaQuantiles() for i in range(rank_groups)]
+	duration_epoch_totals = []
+	dt_bound_epoch_totals = []
+
+	## chunks hold whole epochs, for the means of the values of each epoch
+	for chunk in opdata.epoch_chunks():
+		opcodes = opdata.opcode[chunk].astype(np.int64)
+		rank_keys = opdata.rank[chunk]*4 + opcodes
+		epoch_keys = (opdata.window[chunk].astype(np.int64)*max_epochs + opdata.epoch[chunk])*4 + opcodes
+		durations = opdata.duration[chunk]
+		ops = (opcodes != 3)
+		dt_bounds = opdata.dtbound[chunk][ops]
+
+		durations_per_rank = forma_merge_grouped_moments(durations_per_rank, forma_grouped_moments(rank_keys, durations, rank_groups))
+		durations_per_epoch = forma_merge_grouped_moments(durations_per_epoch, forma_grouped_moments(epoch_keys, durations, epoch_groups))
+		dt_bounds_per_rank = forma_merge_grouped_moments(dt_bounds_per_rank, forma_grouped_moments(rank_keys[ops], dt_bounds, rank_groups))
+		dt_bounds_per_epoch = forma_merge_grouped_moments(dt_bounds_per_epoch, forma_grouped_moments(epoch_keys[ops], dt_bounds, epoch_groups))
+		np.add.at(data_vol_per_epoch, epoch_keys[ops]//4, opdata.bytes[chunk][ops])
+		forma_update_grouped_quantiles(duration_sketches, rank_keys, durations)
+		forma_update_grouped_quantiles(dt_bound_sketches, rank_keys[ops], dt_bounds)
+		ranks_of, windows_of, epochs_of = opdata.rank[chunk], opdata.window[chunk], opdata.epoch[chunk]
+		duration_epoch_totals.append(forma_epoch_totals(ranks_of, windows_of, epochs_of, opcodes, durations))
+		dt_bound_epoch_totals.append(forma_epoch_totals(ranks_of[ops], windows_of[ops], epochs_of[ops], opcodes[ops], dt_bounds))
+
+	per_opcode_op_durations_per_rank = [[forma_moments_of_group(durations_per_rank, j*4+i) for i in range(4)] for j in range(ranks)]
+	per_opcode_dt_bounds_per_rank = [[forma_moments_of_group(dt_bounds_per_rank, j*4+i) for i in range(3)] for j in range(ranks)]
+	duration_means, dt_bound_means = [forma_grouped_epoch_means(*[np.concatenate(t) for t in zip(*totals)], rank_groups) if totals else [FormaMoments() for i in range(rank_groups)]
+										for totals in [duration_epoch_totals, dt_bound_epoch_totals]]
+	for j in range(ranks):
+		for i in range(4):
+			per_opcode_op_durations_per_rank[j][i].sketch = duration_sketches[j*4+i]
+			per_opcode_op_durations_per_rank[j][i].epoch_means = duration_means[j*4+i]
+			if i != 3:
+				per_opcode_dt_bounds_per_rank[j][i].sketch = dt_bound_sketches[j*4+i]
+				per_opcode_dt_bounds_per_rank[j][i].epoch_means = dt_bound_means[j*4+i]
+	per_window_data_vol = [int(np.sum(data_vol_per_epoch[j*max_epochs:(j+1)*max_epochs])) for j in range(wins)]
+	per_epoch_data = forma_per_epoch_data(wins, opdata.epochs_per_window[0], durations_per_epoch, dt_bounds_per_epoch, data_vol_per_epoch)
+
+	return per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank, per_window_data_vol, per_epoch_data
+
+
+def forma_break_down(version, ranks, wins, opdata, moments_per_rank=None):
+
+	""" breaks down the parsed traces per rank, window and opcode, as each 
+		version of foRMA does: returns per_opcode_op_durations_per_rank, 
+		per_opcode_dt_bounds_per_rank, per_window_data_vol, per_epoch_data 
+		(None in the in-memory version, cf. forma_break_down_per_epoch()) and 
+		per_opcode_summary (only in the in-memory version, otherwise None) 
+	"""
+
+	per_epoch_data = None
+	per_opcode_summary = None
+
+	if version == 'i':
+		per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank, per_window_data_vol, per_epoch_data = forma_merge_incremental(ranks, wins, opdata, moments_per_rank)
+	elif version == 'o':
+		per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank, per_window_data_vol, per_epoch_data = forma_break_down_out_of_core(ranks, wins, opdata)
+	else:
+		per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank, per_window_data_vol = forma_break_down_per_rank_per_window(ranks, wins, opdata)
+		per_opcode_summary = forma_break_down_per_opcode(opdata)
+
+	return per_opcode_op_durations_per_rank, per_opcode_dt_bounds_per_rank, per_window_data_vol, per_epoch_data, per_opcode_summary
+
+
+def forma_calc_opduration_summary(ranks, total_exec_times_per_rank, per_opcode_op_durations, all_op_durations=None):
 
 	opduration_stats = [[5]*6 for i in range(6)]
 
 	opduration_stats[0] = forma_calculate_stats_x6(total_exec_times_per_rank)
 
 	# print(f'passing {per_opcode_op_durations[0]+per_opcode_op_durations[1]+per_opcode_op_durations[2]+per_opcode_op_durations[3]} to calc_stats_x6')
-		
-	opduration_stats[1] = forma_calculate_stats_x6(per_opcode_op_durations[0]+per_opcode_op_durations[1]+per_opcode_op_durations[2]+per_opcode_op_durations[3])
+	
+	if all_op_durations is None:
+		all_op_durations = forma_concatenate(per_opcode_op_durations)
+	opduration_stats[1] = forma_calculate_stats_x6(all_op_durations)
 
 	for i in range(4):
 		opduration_stats[i+2] = forma_calculate_stats_x6(per_opcode_op_durations[i])
@@ -167,12 +1049,29 @@ def forma_calc_dtbounds_summary(per_opcode_dt_bounds):
 	return dtbound_stats
 
 
+def forma_calc_tail_summary(per_opcode_op_durations, per_opcode_dt_bounds):
+
+	tail_stats = [[0]*len(tail_quantiles) for i in range(7)]
+
+	for i in range(4):
+		tail_stats[i] = forma_calculate_stats_tail(per_opcode_op_durations[i])
+		if i != 3:
+			tail_stats[i+4] = forma_calculate_stats_tail(per_opcode_dt_bounds[i])
+
+	return tail_stats
+
+
 def forma_calc_stats_summary(ranks, wins, total_exec_times_per_rank, 
 							all_window_sizes, all_window_durations_per_rank,
 							epochs_per_window, 
 							per_opcode_op_durations_per_rank, 
 							per_opcode_dt_bounds_per_rank, 
-							per_window_data_vol):
+							per_window_data_vol, 
+							per_opcode_summary=None):
+
+	""" per_opcode_summary is the output of forma_break_down_per_opcode(), 
+		if available, otherwise the per rank breakdown is merged across ranks
+	"""
 
 	opduration_stats = []
 	windata_stats = []
@@ -187,19 +1086,23 @@ def forma_calc_stats_summary(ranks, wins, total_exec_times_per_rank,
 	per_opcode_dt_bounds = [[] for i in range(3)]
 	#per_window_data_vol = [0 for i in range(wins)]
 
-	for i in range(4):
-		for j in range(ranks):
-			for k in range(len(per_opcode_op_durations_per_rank[j][i])):
-				per_opcode_op_durations[i].append(per_opcode_op_durations_per_rank[j][i][k])
-				if i != 3:
-					per_opcode_dt_bounds[i].append(per_opcode_dt_bounds_per_rank[j][i][k])
+	all_op_durations = None
+
+	if per_opcode_summary is not None:
+		per_opcode_op_durations, per_opcode_dt_bounds, all_op_durations = per_opcode_summary
+	else:
+		for i in range(4):
+			per_opcode_op_durations[i] = forma_concatenate([per_opcode_op_durations_per_rank[j][i] for j in range(ranks)])
+			if i != 3:
+				per_opcode_dt_bounds[i] = forma_concatenate([per_opcode_dt_bounds_per_rank[j][i] for j in range(ranks)])
 	
 	#print(f'per_opcode_op_durations in new function: {per_opcode_op_durations}')
 	#print(f'per_opcode_dt_bounds in new function: {per_opcode_dt_bounds}')
 
 	opduration_stats = forma_calc_opduration_summary(ranks, 
 													total_exec_times_per_rank, 
-													per_opcode_op_durations)
+													per_opcode_op_durations, 
+													all_op_durations)
 
 	windata_stats = forma_calc_windata_summary(wins, 
 											all_window_sizes, all_window_durations_per_rank,
@@ -208,7 +1111,9 @@ def forma_calc_stats_summary(ranks, wins, total_exec_times_per_rank,
 
 	dtbound_stats = forma_calc_dtbounds_summary(per_opcode_dt_bounds)
 
-	return opduration_stats, windata_stats, dtbound_stats
+	tail_stats = forma_calc_tail_summary(per_opcode_op_durations, per_opcode_dt_bounds)
+
+	return opduration_stats, windata_stats, dtbound_stats, tail_stats
 
 
 def forma_calc_stats_summary_coarse(ranks, wins, total_exec_times_per_rank, all_window_sizes, epochs_per_window, opdata_per_rank):
@@ -270,6 +1175,11 @@ def forma_calculate_opduration_dtbounds_stats_for_rank(per_opcode_op_durations_f
 	return opduration_stats_for_rank, dt_bounds_stats_for_rank
 
 
+def forma_calculate_tail_stats_for_rank(per_opcode_op_durations_for_rank, per_opcode_dt_bounds_for_rank):
+
+	return forma_calc_tail_summary(per_opcode_op_durations_for_rank, per_opcode_dt_bounds_for_rank)
+
+
 def forma_calculate_opduration_stats_for_rank(per_opcode_op_durations_for_rank):
 
 	opduration_stats_for_rank = [[0]*6 for i in range(4)]
@@ -324,21 +1234,42 @@ def forma_calculate_opduration_dtbounds_stats_for_epoch(per_opcode_durations_for
 	return opduration_stats_for_epoch, dtbound_stats_for_epoch
 
 
-def forma_calculate_stragglers_for_fence(fence_arrival_times):
+def forma_fence_stragglers(fence_arrivals):
+
+	""" straggler analysis of all fences of a window at once, where fence_arrivals 
+		is the ranks x epochs matrix of the arrival times of ranks to the fence that 
+		closes each epoch. Returns [ arrival_order, first, first_rank, last, last_rank, skew ], 
+		where arrival_order is the epochs x ranks matrix of the ranks of each fence 
+		in order of arrival (ranks that arrive at the same time in rank order), and 
+		the rest are arrays of length epochs with the earliest and latest arrival, 
+		the ranks that arrived earliest and latest (i.e. the straggler) and the 
+		range of arrival times (skew) of each fence. 
+	"""
 
-	timestamps_ranks = [0]*6
+	arrival_order = np.argsort(fence_arrivals, axis=0, kind='stable').T
+	epochs = np.arange(fence_arrivals.shape[1])
 
-	arrival_order = [t[0] for t in sorted(enumerate(fence_arrival_times),key=lambda i:i[1])]
-	
+	first_rank = arrival_order[:, 0]
+	last_rank = arrival_order[:, -1]
+	first = fence_arrivals[first_rank, epochs]
+	last = fence_arrivals[last_rank, epochs]
 
-	timestamps_ranks[1] = fence_arrival_times[arrival_order[0]]
-	timestamps_ranks[2] = arrival_order[0]
-	timestamps_ranks[3] = fence_arrival_times[arrival_order[-1]]
-	timestamps_ranks[4] = arrival_order[-1]
+	return [arrival_order, first, first_rank, last, last_rank, last - first]
+
+
+def forma_fence_straggler_summary(ranks, first_rank, last_rank, skew):
+
+	""" aggregates of (the concatenation of) outputs of forma_fence_stragglers(), 
+		namely the number of fences at which each rank arrived first and last 
+		(as lists of length ranks), and the statistics of the skew of all 
+		fences, as FormaStats 
+	"""
 
-	timestamps_ranks[5] = timestamps_ranks[3] - timestamps_ranks[1]
+	first_counts = np.bincount(first_rank, minlength=ranks).tolist()
+	last_counts = np.bincount(last_rank, minlength=ranks).tolist()
+	skew_stats = forma_stats_of_group(forma_grouped_stats(np.zeros(len(skew), dtype=np.int64), skew, 1), 0)
 
-	return timestamps_ranks, arrival_order
+	return first_counts, last_counts, skew_stats
 
 
 """ deprecated functions below, however, some code snippets might be useful """
@@ -0,0 +1,259 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import argparse
+import sys
+import os
+import struct
+
+import numpy as np
+
+import forma_dumpi as fdr
+
+
+## foRMA synthetic trace generator. Writes the SST Dumpi trace files (and the
+## .meta file) of a made-up execution with fence-based RMA synchronization,
+## for testing and benchmarking foRMA without access to real traces. Every
+## rank creates wins windows, then goes through epochs epochs on each of them
+## (epochs of different windows are interleaved), issuing ops RMA operations
+## (MPI_Get, MPI_Put or MPI_Accumulate, at random) to random target ranks in
+## every epoch, and finally frees the windows. Fences are shared by all ranks,
+## but each rank arrives at them with some random skew.
+##
+## Traces are laid out as described in forma_dumpi.py, with the thread id and
+## wall clock times (only) in every record. Records are generated and encoded
+## in bulk, as NumPy structured arrays, one per function id, which are then
+## scattered into the stream of records in trace order.
+
+## config mask of all records: thread id present, wall clock times only
+synth_mask = fdr.dumpi_thread_bit | fdr.dumpi_wall_time_bit
+
+## MPI datatype sizes stored in the trace, and the ones used by the RMA ops
+synth_type_sizes = [1, 1, 1, 2, 2, 4, 4, 8, 8, 4, 8, 16] + [8]*28
+synth_types = {fdr.dumpi_get: 7, fdr.dumpi_put: 5, fdr.dumpi_accumulate: 7}
+
+## MPI handles of the communicator and of the first window
+synth_comm = 2
+synth_first_win = 11
+
+synth_value_dtypes = {'B': 'u1', 'H': '>u2', 'i': '>i4'}
+
+nsec = 1000000000
+
+
+def forma_synth_record_dtype(fid):
+
+	""" returns the NumPy dtype of the records of function fid """
+
+	header = [('fid', '>u2'), ('mask', 'u1'), ('thread', '>u2'),
+			('start_sec', '>u2'), ('start_nsec', '>u4'), ('stop_sec', '>u2'), ('stop_nsec', '>u4')]
+
+	if fid == fdr.dumpi_init:
+		payload = [('argc', '>i4')]
+	elif fid == fdr.dumpi_finalize:
+		payload = []
+	else:
+		payload = [(name, synth_value_dtypes[fmt]) for name, fmt in fdr.dumpi_tracked_fields[fid]]
+
+	return np.dtype(header + payload)
+
+
+def forma_synth_rank_records(rng, ranks, wins, epochs, ops, fence_times):
+
+	""" returns the records of a single rank, in trace order, as a dictionary
+		of per-record arrays (fid, start, stop and the payload fields of the
+		tracked calls, zero where a record has no such field)
+	"""
+
+	op_fids = np.array([fdr.dumpi_get, fdr.dumpi_put, fdr.dumpi_accumulate])
+
+	## fences, one per (round, window), where round epochs only closes the last epoch
+	fence_start = fence_times + rng.integers(0, 800, size=fence_times.shape)
+	fence_stop = fence_start + 100 + rng.integers(0, 500, size=fence_times.shape)
+
+	## ops of each epoch follow the fence that opens it, one after the other
+	op_duration = 20 + rng.integers(0, 400, size=(epochs, wins, ops))
+	op_gap = 5 + rng.integers(0, 100, size=(epochs, wins, ops))
+	op_start = fence_stop[:epochs, :, None] + 50 + np.cumsum(op_duration + op_gap, axis=2) - (op_duration + op_gap)
+
+	## the body of the trace: per round and window, the fence and then the ops of the epoch
+	slots = 1 + ops
+	body = {'fid': np.zeros((epochs+1, wins, slots), dtype=np.int64)}
+	body['fid'][:, :, 0] = fdr.dumpi_win_fence
+	body['fid'][:epochs, :, 1:] = op_fids[rng.integers(0, 3, size=(epochs, wins, ops))]
+	body['start'] = np.zeros((epochs+1, wins, slots), dtype=np.int64)
+	body['start'][:, :, 0] = fence_start
+	body['start'][:epochs, :, 1:] = op_start
+	body['stop'] = np.zeros((epochs+1, wins, slots), dtype=np.int64)
+	body['stop'][:, :, 0] = fence_stop
+	body['stop'][:epochs, :, 1:] = op_start + op_duration
+	body['win'] = np.broadcast_to(synth_first_win + np.arange(wins)[None, :, None], (epochs+1, wins, slots))
+
+	count = 1 + rng.integers(0, 64, size=(epochs+1, wins, slots))
+	body['origincount'] = count
+	body['targetcount'] = count
+	body['targetrank'] = rng.integers(0, ranks, size=(epochs+1, wins, slots))
+
+	## no ops after the fence that closes the last epoch
+	keep = np.ones((epochs+1, wins, slots), dtype=bool)
+	keep[epochs, :, 1:] = False
+	body = {name: np.asarray(values)[keep] for name, values in body.items()}
+
+	## MPI_Init and MPI_Win_create before the body, MPI_Win_free and MPI_Finalize after it
+	t_first = int(fence_times.min()) - 1000*(wins+1)
+	t_last = int(fence_times.max()) + 10000
+	head_fids = [fdr.dumpi_init] + [fdr.dumpi_win_create]*wins
+	head_start = np.array([100] + [t_first + 1000*(w+1) for w in range(wins)]) + rng.integers(0, 100, size=wins+1)
+	tail_fids = [fdr.dumpi_win_free]*wins + [fdr.dumpi_finalize]
+	tail_start = np.array([t_last]*wins + [t_last + 10000]) + rng.integers(0, 200, size=wins+1)
+
+	records = dict()
+	records['fid'] = np.concatenate([head_fids, body['fid'], tail_fids]).astype(np.int64)
+	records['start'] = np.concatenate([head_start, body['start'], tail_start]).astype(np.int64)
+	records['stop'] = records['start'] + np.concatenate([[500], 200 + rng.integers(0, 300, size=wins),
+														np.zeros(len(body['fid']), dtype=np.int64), [300]*wins, [700]])
+	records['stop'][wins+1:wins+1+len(body['fid'])] = body['stop']
+
+	windows = np.arange(wins)
+	for name in ['win', 'origincount', 'targetcount', 'targetrank']:
+		records[name] = np.zeros(len(records['fid']), dtype=np.int64)
+		records[name][wins+1:wins+1+len(body['fid'])] = body[name]
+	records['win'][1:wins+1] = synth_first_win + windows
+	records['win'][-wins-1:-1] = synth_first_win + windows
+	records['size'] = np.zeros(len(records['fid']), dtype=np.int64)
+	records['size'][1:wins+1] = 4096*(windows+1)
+
+	return records
+
+
+def forma_synth_encode(records):
+
+	""" returns the stream of records (without the end of stream id) as bytes """
+
+	fids = records['fid']
+	sizes = np.zeros(len(fids), dtype=np.int64)
+	dtypes = {int(fid): forma_synth_record_dtype(int(fid)) for fid in np.unique(fids)}
+	for fid, dtype in dtypes.items():
+		sizes[fids == fid] = dtype.itemsize
+	offsets = np.cumsum(sizes) - sizes
+
+	stream = np.zeros(int(sizes.sum()), dtype=np.uint8)
+	for fid, dtype in dtypes.items():
+		rows = np.nonzero(fids == fid)[0]
+		encoded = np.zeros(len(rows), dtype=dtype)
+		encoded['fid'] = fid
+		encoded['mask'] = synth_mask
+		for when in ['start', 'stop']:
+			encoded[when+'_sec'] = records[when][rows] // nsec
+			encoded[when+'_nsec'] = records[when][rows] % nsec
+		for name in dtype.names[7:]:
+			if name in records:
+				encoded[name] = records[name][rows]
+			elif name in ['origintype', 'targettype']:
+				encoded[name] = synth_types[fid]
+			elif name == 'dispunit':
+				encoded[name] = 1
+			elif name == 'comm':
+				encoded[name] = synth_comm
+		## scatter the bytes of each encoded record to its place in the stream
+		stream[offsets[rows, None] + np.arange(dtype.itemsize)] = encoded.view(np.uint8).reshape(len(rows), dtype.itemsize)
+
+	return stream.tobytes()
+
+
+def forma_synth_write_rank(tracefile, records):
+
+	""" writes the trace file of a rank out of its records, and returns its size """
+
+	counts = np.bincount(records['fid'], minlength=fdr.dumpi_all_functions)[:fdr.dumpi_all_functions]
+
+	out = bytearray(struct.pack('>Q', fdr.dumpi_magic))
+	header = len(out)
+	out += bytes([0, 8, 0]) + struct.pack('>Q', 0)
+	out += struct.pack('>H', 5) + b'synth' + struct.pack('>H', 5) + b'forma' + struct.pack('>ii', 0, 0)
+	body = len(out)
+	out += struct.pack('>ii', 0, 0)
+	out += forma_synth_encode(records)
+	out += struct.pack('>H', fdr.dumpi_end_of_stream)
+	footer = len(out)
+	out += struct.pack('>Q', fdr.dumpi_footer_magic)
+	out += struct.pack(f'>{fdr.dumpi_all_functions}i', *counts.tolist())
+	out += struct.pack(f'>{fdr.dumpi_all_functions}i', *([0]*fdr.dumpi_all_functions))
+	type_sizes = len(out)
+	out += struct.pack('>i', len(synth_type_sizes)) + struct.pack(f'>{len(synth_type_sizes)}i', *synth_type_sizes)
+	out += struct.pack('>8Q', fdr.dumpi_magic, type_sizes, 0, 0, header, body, footer, 0)
+
+	with open(tracefile, 'wb') as f:
+		f.write(out)
+
+	return len(out)
+
+
+def forma_synth_traces(dirname, timestamp, ranks, wins, epochs, ops, seed=0):
+
+	""" writes the trace files of a synthetic execution with ranks ranks,
+		each going through epochs epochs on each of wins windows, with ops
+		RMA ops per epoch, to dirname. Returns the total size of the trace
+		files in Bytes. Traces only depend on the parameters and seed.
+	"""
+
+	rng = np.random.default_rng(seed)
+	os.makedirs(dirname, exist_ok=True)
+
+	## fences of all windows of a round follow each other, and rounds are
+	## long enough to fit all ops of an epoch
+	round_length = wins*(2000 + ops*600)
+	fence_times = (nsec + 1000*(wins+1) + np.arange(epochs+1)[:, None]*round_length
+					+ np.arange(wins)[None, :]*(2000 + ops*600))
+
+	total_bytes = 0
+	for rank in range(ranks):
+		records = forma_synth_rank_records(rng, ranks, wins, epochs, ops, fence_times)
+		total_bytes += forma_synth_write_rank(os.path.join(dirname, f'dumpi-{timestamp}-{rank:04d}.bin'), records)
+
+	with open(os.path.join(dirname, f'dumpi-{timestamp}.meta'), 'w') as f:
+		f.write(f'hostname=synth\nnumprocs={ranks}\nusername=forma\nstartime=0\n' +
+				f'fileprefix=dumpi-{timestamp}\nversion=1\nsubversion=0\nsubsubversion=0\n')
+
+	return total_bytes
+
+
+def main():
+
+	forma_synth_arg_parse = argparse.ArgumentParser(description="foRMA synthetic trace generator -- writes the SST Dumpi traces of a made-up execution with fence-based RMA synchronization.")
+	forma_synth_arg_parse.add_argument("directory", help="Directory to which the trace files are written (created if it does not exist).", type=str)
+	forma_synth_arg_parse.add_argument("timestamp", help="Timestamp that makes up the filenames of the trace files.", type=str)
+	forma_synth_arg_parse.add_argument("--ranks", help="Number of ranks (default: 4).", type=int, default=4)
+	forma_synth_arg_parse.add_argument("--wins", help="Number of memory windows (default: 2).", type=int, default=2)
+	forma_synth_arg_parse.add_argument("--epochs", help="Number of epochs per window (default: 10).", type=int, default=10)
+	forma_synth_arg_parse.add_argument("--ops", help="Number of RMA ops per rank per epoch (default: 10).", type=int, default=10)
+	forma_synth_arg_parse.add_argument("--seed", help="Seed of the random generator (default: 0).", type=int, default=0)
+
+	args = forma_synth_arg_parse.parse_args()
+	if args.ranks < 1 or args.wins < 1 or args.epochs < 1 or args.ops < 0:
+		print('There has to be at least one rank, window and epoch, and no negative number of ops.')
+		sys.exit(2)
+
+	total_bytes = forma_synth_traces(args.directory, args.timestamp, args.ranks, args.wins, args.epochs, args.ops, args.seed)
+	print(f'Wrote {args.ranks} trace files ({total_bytes} Bytes) to {args.directory}.')
+
+
+if __name__ == "__main__":
+	main()
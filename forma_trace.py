@@ -9,21 +9,45 @@ import ctypes
 
 import logging
 
+import numpy as np
+
 from pydumpi import dtypes
 from pydumpi import DumpiTrace
 
+import forma_opdata as fod
+import forma_stats as fs
+import forma_dumpi as fdr
+
 
 ## foRMA in-memory (IM) trace, one of the versions of the callback 
 ## implementations where all opdata are kept in dedicated vectors and 
-## statistics are calculated a posteriori
+## statistics are calculated a posteriori. The vectors are the typed 
+## column buffers of a FormaOpdata store (cf. forma_opdata.py)
 
 class FormaIMTrace(DumpiTrace):
 
-	def __init__(self, file_name): #, csv_filename, pickle_filename, parquet_filename):
+	def __init__(self, file_name, call_counts=None, progress=None, selection=None, fences_only=False): #, csv_filename, pickle_filename, parquet_filename):
 		super().__init__(file_name)
+
+		## ops of windows and epochs that are not in selection (a FormaSelection, 
+		## cf. forma_select.py), and, if fences_only is set, ops other than fences, 
+		## are dropped instead of being logged (cf. selected())
+		self.selection = selection if selection else None
+		self.fences_only = fences_only
+		self.filtered = self.selection is not None or fences_only
+
+		## when ops are dropped, the target rank that an MPI_Get inherits from 
+		## the last MPI_Put/MPI_Acc before it (cf. forma_calculate_dt_bounds()) 
+		## may be that of a dropped op, so epoch_last_target holds the target 
+		## rank of the last MPI_Put/MPI_Acc of each (win_id, epoch), whether 
+		## logged or not (cf. track_target() and forma_select_dt_bounds())
+		self.epoch_last_target = dict()
 		self.fence_count = 0
 		self.win_count = 0
 
+		## first error found in the trace, cf. fail()
+		self.error = None
+
 		self.source_file = ctypes.create_string_buffer(64)
 		
 		## DataVolumes per epoch per detected window for current trace. 
@@ -32,7 +56,14 @@ class FormaIMTrace(DumpiTrace):
 		self.wintb = dict()
 
 		self.epochcount_per_window = []
-		self.opdata_per_window = []
+
+		## typed column buffers, indexed by column name; each op is logged 
+		## together with the window ID and epoch it belongs to. If the call 
+		## counts of the footer of the trace are known (cf. forma_dumpi_call_counts()), 
+		## the buffers are preallocated for the ops of the trace and 
+		## opdata_rows is the number of buffer rows filled in so far
+		self.opdata_buffers = fod.FormaOpdata.new_buffers(self.buffer_rows(call_counts))
+		self.opdata_rows = 0
 
 		self.total_exec_time = 0
 		self.all_window_sizes = []
@@ -45,6 +76,16 @@ class FormaIMTrace(DumpiTrace):
 
 		self.myProfile = ctypes.POINTER(dtypes.DumpiProfile)
 
+		## called with the number of records processed so far (cf. forma_progress.py). 
+		## The callbacks below only see the tracked calls, whose count is scaled 
+		## to the number of records of the trace, as counted in its footer
+		self.progress = progress
+		self.progress_scale = 1.0
+		if call_counts is not None:
+			tracked_calls = sum([call_counts[fid] for fid in [fdr.dumpi_init, fdr.dumpi_finalize, fdr.dumpi_get, fdr.dumpi_put, 
+																fdr.dumpi_accumulate, fdr.dumpi_win_create, fdr.dumpi_win_fence, fdr.dumpi_win_free]])
+			self.progress_scale = sum(call_counts)/max(tracked_calls, 1)
+
 		# self.myCsv = open(csv_filename, 'w')
 		# self.writer = csv.writer(self.myCsv)
 
@@ -61,6 +102,251 @@ class FormaIMTrace(DumpiTrace):
 		# self.avroWriter = DataFileWriter(open(file_name+".avro", "wb"), DatumWriter(), schema)
 		
 
+	def report_progress(self):
+
+		""" reports the (estimated) number of records processed so far """
+
+		self.progress(int(sum(self.callcount_per_opcode)*self.progress_scale))
+
+
+	def fail(self, message):
+
+		""" records an error found in the trace. The callbacks are called back 
+			from libundumpi, through which exceptions cannot be raised, so the 
+			error is raised by forma_parse_rank() once the trace has been read. 
+			Only the first error is kept. 
+		"""
+
+		if self.error is None:
+			self.error = message
+
+
+	def buffer_rows(self, call_counts):
+
+		""" returns the number of ops to preallocate buffers for, given the 
+			call counts of the footer of the trace (indexed by function id)
+		"""
+		if call_counts is None:
+			return 0
+		if self.fences_only:
+			return call_counts[fdr.dumpi_win_fence]
+		return sum([call_counts[fid] for fid in [fdr.dumpi_get, fdr.dumpi_put, fdr.dumpi_accumulate, fdr.dumpi_win_fence]])
+
+
+	def selected(self, win_id, win_epoch, opcode):
+
+		""" returns True if an op of opcode on epoch win_epoch of window win_id 
+			is to be logged, i.e. if it is not dropped by the selection 
+		"""
+		if self.fences_only and opcode != 3:
+			return False
+		return self.selection is None or self.selection.keeps(win_id, win_epoch)
+
+
+	def selected_rows(self, win_ids, epochs, opcodes):
+
+		""" vectorized selected(), for arrays of window ids, epochs and opcodes """
+		keep = np.ones(len(opcodes), dtype=bool)
+		if self.fences_only:
+			keep &= (opcodes == 3)
+		if self.selection is not None:
+			keep &= self.selection.keeps_rows(win_ids, epochs)
+		return keep
+
+
+	def track_target(self, win_id, win_epoch, opdata):
+
+		""" records the target rank of opdata, of the form [opcode, start, duration, 
+			bytes, targetrank], an MPI_Put/MPI_Acc, as the last one of its epoch
+		"""
+		self.epoch_last_target[(win_id, win_epoch)] = opdata[4]
+
+
+	def log_opdata(self, win_id, win_epoch, opdata):
+
+		""" stores opdata, of the form [opcode, start, duration, bytes, targetrank], 
+			in the next row of the column buffers of the trace
+		"""
+		buffers = self.opdata_buffers
+		row = self.opdata_rows
+		if row == len(buffers['opcode']):
+			fod.FormaOpdata.grow_buffers(buffers, row+1)
+		buffers['opcode'][row] = opdata[0]
+		buffers['start'][row] = opdata[1]
+		buffers['duration'][row] = opdata[2]
+		buffers['bytes'][row] = opdata[3]
+		buffers['targetrank'][row] = opdata[4]
+		buffers['window'][row] = win_id
+		buffers['epoch'][row] = win_epoch
+		self.opdata_rows = row+1
+
+
+	def log_opdata_bulk(self, columns):
+
+		""" stores many ops at once; columns holds one array per buffer 
+			column (cf. FormaOpdata.buffer_columns), with the ops in trace order
+		"""
+		buffers = self.opdata_buffers
+		row = self.opdata_rows
+		rows = len(columns['opcode'])
+		if row+rows > len(buffers['opcode']):
+			fod.FormaOpdata.grow_buffers(buffers, row+rows)
+		for name, dtype, typecode in fod.FormaOpdata.columns:
+			if name in columns:
+				np.frombuffer(buffers[name], dtype=dtype)[row:row+rows] = columns[name]
+		self.opdata_rows = row+rows
+
+
+	def read_native(self):
+
+		""" reads the trace with the native reader of forma_dumpi instead of 
+			read_stream(), i.e. without going through the callbacks below, but 
+			with the same effect on the trace, applied to all records at once. 
+			Raises fdr.FormaDumpiUnsupported if the trace cannot be read natively, 
+			in which case the trace is left untouched. 
+		"""
+		dumpi = fdr.FormaDumpiFile(self.file_name, self.progress)
+
+		## MPI_Win_create and MPI_Win_free are few, so they go through the 
+		## window lookaside translation buffer one by one, as in the callbacks. 
+		## win_events holds [record, window handle, win_id] for each of them, 
+		## win_id being -1 for MPI_Win_free
+		win_calls = []
+		for fid in [fdr.dumpi_win_create, fdr.dumpi_win_free]:
+			rows = dumpi.records([fid])
+			start, stop = dumpi.wall_time(rows)
+			duration = fdr.forma_dumpi_duration(start, stop)
+			sizes = dumpi.field(rows, 'size') if fid == fdr.dumpi_win_create else np.zeros(len(rows), dtype=np.int64)
+			win_calls += zip(rows.tolist(), [fid]*len(rows), dumpi.field(rows, 'win').tolist(), 
+							sizes.tolist(), start.tolist(), stop.tolist(), duration.tolist())
+
+		wintb = dict()
+		win_events = []
+		collisions = []
+		all_window_sizes = []
+		all_window_durations = []
+		for row, fid, win, size, start, stop, duration in sorted(win_calls):
+			if fid == fdr.dumpi_win_create:
+				if wintb.get(win, -1) != -1:
+					collisions.append(win)
+				wintb[win] = len(all_window_sizes)
+				all_window_sizes.append(size)
+				all_window_durations.append([duration, start, 0])
+				win_events.append([row, win, wintb[win]])
+			else:
+				if win not in wintb:
+					raise fdr.FormaDumpiUnsupported(f'window {win} not in wintb')
+				win_id = wintb[win]
+				wintb[win] = -1
+				all_window_durations[win_id] = [all_window_durations[win_id][0], stop - all_window_durations[win_id][1], duration]
+				win_events.append([row, win, -1])
+		win_count = len(all_window_sizes)
+
+		## RMA ops and fences, in trace order
+		rows = dumpi.records([fdr.dumpi_get, fdr.dumpi_put, fdr.dumpi_accumulate, fdr.dumpi_win_fence])
+		fids = dumpi.fids[rows]
+		fence = (fids == fdr.dumpi_win_fence)
+		ops = ~fence
+		start, stop = dumpi.wall_time(rows)
+
+		## window of each op, as given by wintb at the time of the op, i.e. the 
+		## win_id of the last event on its window handle before it, found by a 
+		## binary search of the events, sorted by window handle and record
+		handles = dumpi.field(rows, 'win')
+		event_rows, event_handles, event_ids = [np.array([e[i] for e in win_events], dtype=np.int64) for i in range(3)]
+		handle_codes = np.unique(np.concatenate((event_handles, handles)), return_inverse=True)[1].reshape(-1)
+		event_codes, op_codes = handle_codes[:len(win_events)], handle_codes[len(win_events):]
+		span = int(np.max(np.concatenate((event_rows, rows)), initial=0)) + 1
+		event_order = np.lexsort((event_rows, event_codes))
+		last_event = np.searchsorted((event_codes*span + event_rows)[event_order], op_codes*span + rows) - 1
+		win_ids = np.full(len(rows), -1, dtype=np.int64)
+		found = (last_event >= 0) & (event_codes[event_order][np.maximum(last_event, 0)] == op_codes)
+		win_ids[found] = event_ids[event_order][last_event[found]]
+		if (win_ids < 0).any():
+			raise fdr.FormaDumpiUnsupported('RMA op on a window that is not in wintb')
+
+		## epoch of each op, i.e. the number of fences on its window so far, minus 1, 
+		## and for fences the number of fences before them, minus 1 (cf. on_win_fence())
+		order = np.argsort(win_ids, kind='stable')
+		fences_so_far = np.cumsum(fence[order])
+		group_start = np.searchsorted(win_ids[order], win_ids[order])
+		fences_so_far -= np.concatenate(([0], fences_so_far))[group_start]
+		epochs = np.empty(len(rows), dtype=np.int64)
+		epochs[order] = fences_so_far - 1 - fence[order]
+		epochcount_per_window = (np.bincount(win_ids[fence], minlength=win_count) - 1).tolist()
+
+		opcodes = np.full(len(rows), 3, dtype=np.int64)
+		opcodes[fids == fdr.dumpi_get] = 0
+		opcodes[fids == fdr.dumpi_put] = 1
+		opcodes[fids == fdr.dumpi_accumulate] = 2
+
+		## for MPI_Win_fence, bytes holds the exit time of the fence
+		nbytes = stop.copy()
+		targetranks = np.zeros(len(rows), dtype=np.int64)
+		origintypes = dumpi.field(rows[ops], 'origintype')
+		if (origintypes >= len(dumpi.type_sizes)).any():
+			raise fdr.FormaDumpiUnsupported('unknown datatype')
+		nbytes[ops] = dumpi.field(rows[ops], 'origincount') * dumpi.type_sizes[origintypes]
+		targetranks[ops] = dumpi.field(rows[ops], 'targetrank')
+
+		## target rank of the last MPI_Put/MPI_Acc of each (window, epoch), cf. 
+		## track_target(); target ranks of the ops themselves are kept as parsed
+		epoch_last_target = dict()
+		if self.filtered:
+			setters = np.nonzero(ops & (opcodes != 0))[0][::-1]
+			keys = np.stack((win_ids[setters], epochs[setters]), axis=1)
+			keys, first = np.unique(keys, axis=0, return_index=True)
+			for (win_id, epoch), target in zip(keys.tolist(), targetranks[setters[first]].tolist()):
+				epoch_last_target[(win_id, epoch)] = target
+
+		## fences that open the first epoch of a window are not logged
+		logged = ops | (epochs > -1)
+		if self.filtered:
+			logged &= self.selected_rows(win_ids, epochs, opcodes)
+
+		## total execution time, from the start of MPI_Init to the end of MPI_Finalize
+		total_exec_time = self.total_exec_time
+		init_rows = dumpi.records([fdr.dumpi_init, fdr.dumpi_finalize])
+		init_start, init_stop = dumpi.wall_time(init_rows)
+		for fid, start_ns, stop_ns in zip(dumpi.fids[init_rows].tolist(), init_start.tolist(), init_stop.tolist()):
+			if fid == fdr.dumpi_init:
+				total_exec_time = start_ns
+			else:
+				total_exec_time = stop_ns - total_exec_time
+
+		callcount = [np.count_nonzero(dumpi.fids == fid) for fid in [fdr.dumpi_get, fdr.dumpi_put, fdr.dumpi_accumulate, 
+					fdr.dumpi_win_fence, fdr.dumpi_win_create, fdr.dumpi_win_free, fdr.dumpi_init, fdr.dumpi_finalize]]
+
+		## the trace has been read, update it
+		for win in collisions:
+			print(f'COLLISION ON WINDOW ID {win}')
+		self.fence_count += int(np.count_nonzero(fence))
+		self.win_count += win_count
+		self.wintb = wintb
+		self.epochcount_per_window = epochcount_per_window
+		self.all_window_sizes = all_window_sizes
+		self.all_window_durations = all_window_durations
+		self.total_exec_time = total_exec_time
+		self.callcount_per_opcode = [i+int(c) for i, c in zip(self.callcount_per_opcode, callcount)]
+
+		self.log_opdata_bulk({'opcode': opcodes[logged], 'start': start[logged], 
+							'duration': fdr.forma_dumpi_duration(start, stop)[logged], 
+							'bytes': nbytes[logged], 'targetrank': targetranks[logged], 
+							'window': win_ids[logged], 'epoch': epochs[logged]})
+
+		## only once ops are logged, since FormaINCTrace.log_opdata() tracks the 
+		## target ranks known so far in the same dictionary, as the callbacks do
+		if self.filtered:
+			self.epoch_last_target = epoch_last_target
+
+
+	def get_opdata(self):
+
+		""" returns the ops logged for this trace as a FormaOpdata store """
+
+		return fod.FormaOpdata.from_buffers(self.opdata_buffers, self.epochcount_per_window, self.opdata_rows)
+
+
 	def on_init(self, data, thread, cpu_time, wall_time, perf_info):
 		#time_diff = wall_time.stop - wall_time.start
 		## capture start time of init and end time of finalize in order 
@@ -114,28 +400,29 @@ class FormaIMTrace(DumpiTrace):
 
 		self.callcount_per_opcode[3] = self.callcount_per_opcode[3] + 1
 
+		if self.progress is not None and self.fence_count % 64 == 0:
+			self.report_progress()
 
 		## identify window key to use on windows dictionary by looking into wintb
 		#win_id = self.wintb[data.win]
 		try:
 			win_id = self.wintb[data.win]
 		except KeyError:
-			print(f'Key {data.win} not in wintb!')
-			sys.exit(1)
+			self.fail(f'Key {data.win} not in wintb!')
+			return
 
 		""" for vectors that refer to RMA ops, we use the following 
 		convention for indexing: 0 - MPI_Get, 1 - MPI_Put, 2 - MPI_Acc
 		and if present, then 3 - MPI_Win_fence
 		"""
 		#opdata = [3, wall_time.start.to_ns(), cpu_duration, cpu_time.stop.to_ns()]
-		opdata = [3, wall_time.start.to_ns(), wall_duration, wall_time.stop.to_ns()]
+		opdata = [3, wall_time.start.to_ns(), wall_duration, wall_time.stop.to_ns(), 0]
 		
 
-		## log opdata into corresponding list entry in self.opdata_per_window
-		self.opdata_per_window[win_id].append([])
+		## log opdata as the last op of the epoch that the fence closes
 		win_epoch = self.epochcount_per_window[win_id]
-		if (win_epoch>-1): 
-			self.opdata_per_window[win_id][win_epoch].append(opdata)
+		if (win_epoch>-1) and (not self.filtered or self.selected(win_id, win_epoch, 3)): 
+			self.log_opdata(win_id, win_epoch, opdata)
 
 		## increase epoch count on corresponding window
 		## first fence ever on 
@@ -179,9 +466,6 @@ class FormaIMTrace(DumpiTrace):
 		## so that on_fence can safely increment the epoch count
 		self.epochcount_per_window.append(-1)
 
-		## same for self.opdata_per_window
-		self.opdata_per_window.append([])
-
 		self.all_window_sizes.append(data.size)
 
 		self.all_window_durations.append([wall_duration, wall_time.start.to_ns(), 0])
@@ -195,12 +479,12 @@ class FormaIMTrace(DumpiTrace):
 		try:
 			win_id = self.wintb[data.win]
 		except KeyError:
-			print(f'Key {data.win} not in wintb!'+
+			self.fail(f'Key {data.win} not in wintb! '+
 				'Window ID error. Please make sure that you are using a well-formed trace.\n'+
 				'(Make sure that you are using entire and corrrectly formated SST Dumpi tracefiles '+
 				'and notice that the current version of foRMA relies on detecting only MPI_Win_create '+
 				'calls for window creation.')
-			sys.exit(1)
+			return
 
 		self.wintb[data.win] = -1
 
@@ -222,8 +506,8 @@ class FormaIMTrace(DumpiTrace):
 		try:
 			win_id = self.wintb[data.win]
 		except KeyError:
-			print(f'Key {data.win} not in wintb!')
-			sys.exit(1)
+			self.fail(f'Key {data.win} not in wintb!')
+			return
 
 		self.callcount_per_opcode[0] = self.callcount_per_opcode[0] + 1
 
@@ -237,7 +521,9 @@ class FormaIMTrace(DumpiTrace):
 		opdata = [0, wall_time.start.to_ns(), wall_duration, data.origincount*self.type_sizes[data.origintype], data.targetrank]
 
 		win_epoch = self.epochcount_per_window[win_id]
-		self.opdata_per_window[win_id][win_epoch].append(opdata)
+		if self.filtered and not self.selected(win_id, win_epoch, 0):
+			return
+		self.log_opdata(win_id, win_epoch, opdata)
 
 		# self.writer.writerow(opdata)
 		# pickle.dump(opdata, self.myPickle)
@@ -256,8 +542,8 @@ class FormaIMTrace(DumpiTrace):
 		try:
 			win_id = self.wintb[data.win]
 		except KeyError:
-			print(f'Key {data.win} not in wintb!')
-			sys.exit(1)
+			self.fail(f'Key {data.win} not in wintb!')
+			return
 
 
 		self.callcount_per_opcode[1] = self.callcount_per_opcode[1] + 1
@@ -272,7 +558,11 @@ class FormaIMTrace(DumpiTrace):
 		opdata = [1, wall_time.start.to_ns(), wall_duration, data.origincount*self.type_sizes[data.origintype], data.targetrank]
 
 		win_epoch = self.epochcount_per_window[win_id]
-		self.opdata_per_window[win_id][win_epoch].append(opdata)
+		if self.filtered:
+			self.track_target(win_id, win_epoch, opdata)
+			if not self.selected(win_id, win_epoch, 1):
+				return
+		self.log_opdata(win_id, win_epoch, opdata)
 
 		# self.writer.writerow(opdata)
 		# pickle.dump(opdata, self.myPickle)
@@ -291,8 +581,8 @@ class FormaIMTrace(DumpiTrace):
 		try:
 			win_id = self.wintb[data.win]
 		except KeyError:
-			print(f'Key {data.win} not in wintb!')
-			sys.exit(1)
+			self.fail(f'Key {data.win} not in wintb!')
+			return
 
 
 		self.callcount_per_opcode[2] = self.callcount_per_opcode[2] + 1
@@ -307,7 +597,11 @@ class FormaIMTrace(DumpiTrace):
 		opdata = [2, wall_time.start.to_ns(), wall_duration, data.origincount*self.type_sizes[data.origintype], data.targetrank]
 
 		win_epoch = self.epochcount_per_window[win_id]
-		self.opdata_per_window[win_id][win_epoch].append(opdata)
+		if self.filtered:
+			self.track_target(win_id, win_epoch, opdata)
+			if not self.selected(win_id, win_epoch, 2):
+				return
+		self.log_opdata(win_id, win_epoch, opdata)
 
 		# self.writer.writerow(opdata)
 		# pickle.dump(opdata, self.myPickle)
@@ -316,3 +610,113 @@ class FormaIMTrace(DumpiTrace):
 		# self.pqwriter.write_table(table)
 
 		# self.avroWriter.append({"opcode": 2, "wt_start": wall_time.start.to_ns(), "wt_duration": wall_duration, "numbytes": data.origincount*self.type_sizes[data.origintype], "tg_rank": data.targetrank})
+
+
+
+## foRMA incremental (INC) trace, the version of the callback implementations 
+## where opdata are used directly for incremental statistics calculation 
+## during parsing. The callbacks are the ones of FormaIMTrace, but each op 
+## only updates the running statistics (FormaMoments) of the epoch it belongs 
+## to, instead of being logged. Fences are still logged in the opdata store, 
+## since their timestamps are needed for data transfer bounds and fence 
+## statistics. Memory is thus proportional to windows x epochs (times the 
+## number of distinct target ranks per epoch, and the bounded size of the 
+## sketches of start times) instead of the number of ops.
+
+class FormaINCTrace(FormaIMTrace):
+
+	def __init__(self, file_name, call_counts=None, progress=None, selection=None, fences_only=False):
+		super().__init__(file_name, call_counts, progress, selection, fences_only)
+
+		## moments of op durations, indexed by (win_id, epoch, opcode)
+		self.duration_moments = dict()
+
+		## moments of op start times, indexed by (win_id, epoch, opcode, targetrank). 
+		## Data transfer bounds are calculated from these once the fence exit times 
+		## of all ranks are known. An MPI_Get is accounted to the target rank of the 
+		## last MPI_Put/MPI_Acc before it (cf. forma_calculate_dt_bounds()), which 
+		## is only known here if that op belongs to the same epoch. Otherwise, -1 
+		## is used as target rank, and is resolved in forma_merge_incremental(). 
+		## Start times are also sketched, for the medians and tail latencies of 
+		## data transfer bounds.
+		self.start_moments = dict()
+
+		## target rank of the last op other than MPI_Get, indexed by (win_id, epoch), 
+		## cf. FormaIMTrace.track_target()
+		self.epoch_last_target = dict()
+
+		## bytes transferred, indexed by (win_id, epoch)
+		self.epoch_data_vol = dict()
+
+		## sketches of op durations per opcode, for the medians and tail latencies 
+		## of the rank. Ops are added once the fence that closes their epoch is 
+		## logged, since ops of epochs that are never closed are not accounted for. 
+		## Until then, (opcode, duration) of the ops are kept, indexed by (win_id, epoch)
+		self.duration_sketches = [fs.FormaQuantiles() for i in range(4)]
+		self.open_epoch_durations = dict()
+
+
+	def buffer_rows(self, call_counts):
+
+		""" only fences are kept in the buffers (cf. FormaIMTrace.buffer_rows()) """
+		if call_counts is None:
+			return 0
+		return call_counts[fdr.dumpi_win_fence]
+
+
+	def log_opdata(self, win_id, win_epoch, opdata):
+
+		""" updates the moments of the epoch that opdata, of the form 
+			[opcode, start, duration, bytes, targetrank], belongs to
+		"""
+		key = (win_id, win_epoch, opdata[0])
+		moments = self.duration_moments.get(key)
+		if moments is None:
+			moments = self.duration_moments[key] = fs.FormaMoments()
+		moments.update(opdata[2])
+
+		if opdata[0] == 3:
+			for opcode, duration in self.open_epoch_durations.pop((win_id, win_epoch), []):
+				self.duration_sketches[opcode].update(duration)
+			self.duration_sketches[3].update(opdata[2])
+			super().log_opdata(win_id, win_epoch, opdata)
+			return
+
+		if win_epoch > -1:
+			self.open_epoch_durations.setdefault((win_id, win_epoch), []).append((opdata[0], opdata[2]))
+
+		if opdata[0] != 0:
+			targetrank = opdata[4]
+			self.epoch_last_target[(win_id, win_epoch)] = targetrank
+		else:
+			targetrank = self.epoch_last_target.get((win_id, win_epoch), -1)
+
+		key = (win_id, win_epoch, opdata[0], targetrank)
+		moments = self.start_moments.get(key)
+		if moments is None:
+			moments = self.start_moments[key] = fs.FormaMoments()
+			moments.sketch = fs.FormaQuantiles()
+		moments.update(opdata[1])
+		moments.sketch.update(opdata[1])
+
+		self.epoch_data_vol[(win_id, win_epoch)] = self.epoch_data_vol.get((win_id, win_epoch), 0) + opdata[3]
+
+
+	def log_opdata_bulk(self, columns):
+
+		""" updates the moments of many ops at once (cf. FormaIMTrace.log_opdata_bulk()) """
+
+		names = ['opcode', 'start', 'duration', 'bytes', 'targetrank', 'window', 'epoch']
+		for opcode, start, duration, nbytes, targetrank, win_id, win_epoch in zip(*[columns[n].tolist() for n in names]):
+			self.log_opdata(win_id, win_epoch, [opcode, start, duration, nbytes, targetrank])
+
+
+	def get_moments(self):
+
+		""" returns the running statistics gathered for this trace, namely: 
+			[ duration_moments, start_moments, epoch_last_target, epoch_data_vol, 
+			  duration_sketches ]
+		"""
+
+		return [self.duration_moments, self.start_moments, self.epoch_last_target, self.epoch_data_vol, 
+				self.duration_sketches]
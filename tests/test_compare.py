@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import math
+import sys
+import os
+
+import numpy as np
+import pytest
+
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import forma_api as fapi
+import forma_compare as fcmp
+import forma_synth as fy
+
+
+## Run-to-run comparison (cf. forma_compare.py), on two synthetic executions
+## of the same generator (cf. forma_synth.py), which differ by chance only.
+
+timestamp = '2026.01.01'
+
+
+@pytest.fixture(scope='module')
+def trace_dirs(tmp_path_factory):
+
+	dirnames = []
+	for seed in [3, 4]:
+		dirname = str(tmp_path_factory.mktemp('trace'))
+		fy.forma_synth_traces(dirname, timestamp, ranks=4, wins=2, epochs=8, ops=12, seed=seed)
+		dirnames.append(dirname)
+
+	return dirnames
+
+
+def stats(count, epochs, epoch_mean, epoch_std):
+
+	""" returns the statistics of the rows of a run, as forma_compare_table() takes them """
+
+	count = np.array(count)
+	return {'count': count, 'mean': np.array(epoch_mean, dtype=np.float64), 'median': np.full(len(count), np.nan), 'p99': np.full(len(count), np.nan),
+			'epochs': np.array(epochs), 'epoch_mean': np.array(epoch_mean, dtype=np.float64), 'epoch_std': np.array(epoch_std, dtype=np.float64)}
+
+
+def test_welch():
+
+	## equal counts and standard deviations: z = delta/sqrt(2*std**2/(count-1))
+	z, p_value = fcmp.forma_compare_test([10, 10, 100], [0, 5, 5], [1, 2, 2], [10, 10, 100], [1, 5, 4], [1, 2, 2])
+
+	assert z.tolist() == pytest.approx([1/math.sqrt(2/9), 0, -1/math.sqrt(8/99)])
+	assert p_value.tolist() == pytest.approx([math.erfc(abs(v)/math.sqrt(2)) for v in z.tolist()])
+	assert p_value[0] == pytest.approx(0.0339, abs=1e-4)
+	assert p_value[1] == 1
+
+
+def test_welch_edge_cases():
+
+	## constant values on both sides (any difference is significant), and too few values
+	z, p_value = fcmp.forma_compare_test([5, 5, 5, 1, 0], [3, 3, 3, 3, 3], [0, 0, 0, 1, 1], [5, 5, 5, 5, 5], [4, 3, 2, 4, 4], [0, 0, 0, 1, 1])
+
+	assert z[:3].tolist() == [np.inf, 0, -np.inf]
+	assert p_value[:3].tolist() == [0, 1, 0]
+	assert np.isnan(z[3:]).all() and np.isnan(p_value[3:]).all()
+
+
+def test_table():
+
+	keys = [('opcode', np.arange(5, dtype=np.int8))]
+	a = stats([10]*5, [8]*5, [100, 100, 100, 0, 100], [1]*5)
+	b = stats([10]*5, [8]*5, [120, 80, 102, 10, 100], [1]*5)
+	table = fcmp.forma_compare_table(keys, a, b, 0.01, 0.05)
+
+	assert table['opcode'].tolist() == list(range(5))
+	assert table['delta'].tolist() == [20, -20, 2, 10, 0]
+	assert table['change'].tolist() == pytest.approx([0.2, -0.2, 0.02, np.inf, 0])
+	assert table['a_epochs'].tolist() == table['b_epochs'].tolist() == [8]*5
+	## a change below min_change is not flagged, however small the p-value
+	assert (table['p_value'][:4] < 0.01).all()
+	assert table['flag'].tolist() == ['slower', 'faster', '', 'slower', '']
+	for name in fcmp.compare_stats:
+		assert table['a_'+name].tolist() == pytest.approx(a[name].tolist(), nan_ok=True)
+
+
+def test_untested_rows():
+
+	## a doubled mean, out of too few epochs on either side
+	keys = [('rank', np.arange(3, dtype=np.int32))]
+	a = stats([10, 10, 10], [1, 8, 8], [100, 100, 100], [0, 5, 5])
+	b = stats([10, 10, 10], [8, 1, 8], [200, 200, 200], [5, 0, 5])
+	table = fcmp.forma_compare_table(keys, a, b, 0.01, 0.05)
+
+	assert np.isnan(table['p_value'][:2]).all()
+	assert table['flag'].tolist() == ['', '', 'slower']
+
+
+@pytest.fixture(scope='module')
+def compare_tables(trace_dirs):
+
+	""" the comparison tables of both executions, per version """
+
+	return {version: fcmp.forma_compare(*[fapi.forma_analyze(d, timestamp, version=version, cache=False) for d in trace_dirs]) for version in ['m', 'i', 'o']}
+
+
+@pytest.mark.parametrize('version', ['m', 'i', 'o'])
+def test_ranks_tested(compare_tables, version):
+
+	## every version has the means of the epochs of each rank to test, 
+	## and only rows that are tested are flagged
+	for name in fcmp.compare_tables:
+		table = compare_tables[version][name]
+		assert not np.isnan(table['p_value'][(table['a_count'] > 0) & (table['b_count'] > 0)]).any()
+		assert (table['p_value'][table['flag'] != ''] < fcmp.compare_alpha).all()
+
+
+@pytest.mark.parametrize('version', ['i', 'o'])
+def test_versions(compare_tables, version):
+
+	for name in fcmp.compare_tables:
+		table, expected = compare_tables[version][name], compare_tables['m'][name]
+		for column in ['a_epochs', 'b_epochs', 'flag']:
+			assert table[column].tolist() == expected[column].tolist()
+		assert np.allclose(table['p_value'], expected['p_value'], equal_nan=True)
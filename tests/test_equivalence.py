@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import subprocess
+import sys
+import os
+
+import pytest
+
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import forma_synth as fy
+
+
+## Equivalences that foRMA claims, checked on the output files of -s -a for a
+## synthetic execution (cf. forma_synth.py): ways of getting to the same
+## analysis (parallel parsing, either reader, the cache, partial aggregates)
+## give byte-identical reports, and a selection gives the same reports
+## whether it is parsed or restricted out of a cached full parse.
+##
+## The reports of every version also hold, line by line and in the same order,
+## the golden reports of the original foRMA for the same execution (golden/,
+## written by the first version of forma.py, with pydumpi and in memory), as
+## later versions only add sections to them (e.g. tail latencies).
+
+timestamp = '2026.01.01'
+report_files = ['epochs.txt', 'fences.txt', 'calls.txt']
+golden_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+
+
+@pytest.fixture(scope='module')
+def trace_dir(tmp_path_factory):
+
+	dirname = str(tmp_path_factory.mktemp('trace'))
+	fy.forma_synth_traces(dirname, timestamp, ranks=4, wins=2, epochs=8, ops=12, seed=3)
+
+	return dirname
+
+
+def forma_reports(out_dir, *args, trace_dir=None):
+
+	""" runs foRMA in out_dir with -s -a and returns its reports, indexed by
+		file name (the trace files of trace_dir are analysed, unless --merge
+		is given)
+	"""
+
+	os.makedirs(out_dir, exist_ok=True)
+	cmd = [sys.executable, os.path.join(repo_dir, 'forma.py')] + ([trace_dir, timestamp] if trace_dir is not None else []) + ['-s', '-a'] + list(args)
+	run = subprocess.run(cmd, cwd=out_dir, capture_output=True, text=True)
+	assert run.returncode == 0, run.stdout + run.stderr
+
+	reports = dict()
+	for filename in report_files:
+		with open(os.path.join(out_dir, filename), 'rb') as f:
+			reports[filename] = f.read()
+
+	return reports
+
+
+@pytest.mark.parametrize('version', [[], ['-i'], ['-o']])
+def test_parallel_parsing(trace_dir, tmp_path, version):
+
+	serial = forma_reports(str(tmp_path/'serial'), '--no-cache', '-j', '1', *version, trace_dir=trace_dir)
+	parallel = forma_reports(str(tmp_path/'parallel'), '--no-cache', '-j', '3', *version, trace_dir=trace_dir)
+
+	assert serial == parallel
+
+
+def missing_lines(lines, other):
+
+	""" returns the first of lines that is not in other, after the lines before
+		it (None if other holds all of lines, in the same order)
+	"""
+
+	rest = iter(other)
+	for line in lines:
+		if line not in rest:
+			return line
+
+	return None
+
+
+@pytest.mark.parametrize('version', [[], ['-i'], ['-o']])
+def test_golden(trace_dir, tmp_path, version):
+
+	reports = forma_reports(str(tmp_path), '--no-cache', *version, trace_dir=trace_dir)
+
+	for filename in report_files:
+		with open(os.path.join(golden_dir, filename)) as f:
+			golden = f.read().splitlines()
+		assert missing_lines(golden, reports[filename].decode().splitlines()) is None, filename
+
+
+@pytest.mark.parametrize('version', [[], ['-i']])
+def test_readers(trace_dir, tmp_path, version):
+
+	native = forma_reports(str(tmp_path/'native'), '--no-cache', '--reader', 'native', *version, trace_dir=trace_dir)
+	pydumpi = forma_reports(str(tmp_path/'pydumpi'), '--no-cache', '--reader', 'pydumpi', *version, trace_dir=trace_dir)
+
+	assert native == pydumpi
+
+
+def test_cache(trace_dir, tmp_path):
+
+	cache_dir = str(tmp_path/'cache')
+	parsed = forma_reports(str(tmp_path/'parsed'), '--no-cache', trace_dir=trace_dir)
+	cold = forma_reports(str(tmp_path/'cold'), '--cache-dir', cache_dir, trace_dir=trace_dir)
+	warm = forma_reports(str(tmp_path/'warm'), '--cache-dir', cache_dir, trace_dir=trace_dir)
+
+	assert os.listdir(cache_dir)
+	assert parsed == cold == warm
+
+
+def test_merge(trace_dir, tmp_path):
+
+	## partial aggregates of uneven groups of ranks, merged out of order
+	partials = [str(tmp_path/'part-0.npz'), str(tmp_path/'part-1.npz')]
+	for partial, ranks in zip(partials, ['0', '1-3']):
+		cmd = [sys.executable, os.path.join(repo_dir, 'forma.py'), trace_dir, timestamp, '--partial', partial, '--ranks', ranks]
+		run = subprocess.run(cmd, cwd=str(tmp_path), capture_output=True, text=True)
+		assert run.returncode == 0, run.stdout + run.stderr
+
+	incremental = forma_reports(str(tmp_path/'incremental'), '--no-cache', '-i', trace_dir=trace_dir)
+	merged = forma_reports(str(tmp_path/'merged'), '--merge', *reversed(partials))
+
+	assert incremental == merged
+
+
+@pytest.mark.parametrize('selection', [['--windows', '1'], ['--epoch-range', '0:1'], ['--windows', '1', '--epoch-range', '2:5'],
+										['--ranks', '2'], ['--ranks', '1-2', '--windows', '0'], ['--ranks', '3', '--epoch-range', '4:']])
+def test_selection(trace_dir, tmp_path, selection):
+
+	## a selection parsed on its own (dropping ops while parsing, and reading
+	## the fences of other ranks) against the same selection restricted out of
+	## a full parse, loaded from the cache
+	cache_dir = str(tmp_path/'cache')
+	forma_reports(str(tmp_path/'full'), '--cache-dir', cache_dir, trace_dir=trace_dir)
+	assert os.listdir(cache_dir)
+
+	parsed = forma_reports(str(tmp_path/'parsed'), '--no-cache', *selection, trace_dir=trace_dir)
+	cached = forma_reports(str(tmp_path/'cached'), '--cache-dir', cache_dir, *selection, trace_dir=trace_dir)
+
+	assert parsed == cached
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import subprocess
+import sys
+import os
+
+import numpy as np
+import pytest
+
+from pydumpi import DumpiTrace
+
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import forma_opdata as fod
+import forma_synth as fy
+
+
+## The ops table of --export, checked against the ops of a synthetic execution
+## (cf. forma_synth.py) as read straight from its trace files by pydumpi.
+
+timestamp = '2026.01.01'
+ranks = 4
+
+
+class RankOps(DumpiTrace):
+
+	""" collects (start, opcode, targetrank) of each MPI_Get/MPI_Put/MPI_Acc of a trace file """
+
+	def __init__(self, file_name):
+		super().__init__(file_name)
+		self.ops = []
+
+	def on_get(self, data, thread, cpu_time, wall_time, perf_info):
+		self.ops.append((wall_time.start.to_ns(), 0, data.targetrank))
+
+	def on_put(self, data, thread, cpu_time, wall_time, perf_info):
+		self.ops.append((wall_time.start.to_ns(), 1, data.targetrank))
+
+	def on_accumulate(self, data, thread, cpu_time, wall_time, perf_info):
+		self.ops.append((wall_time.start.to_ns(), 2, data.targetrank))
+
+
+@pytest.fixture(scope='module')
+def trace_dir(tmp_path_factory):
+
+	dirname = str(tmp_path_factory.mktemp('trace'))
+	fy.forma_synth_traces(dirname, timestamp, ranks=ranks, wins=2, epochs=8, ops=12, seed=3)
+
+	return dirname
+
+
+@pytest.fixture(scope='module')
+def trace_ops(trace_dir):
+
+	""" the ops of each rank, as (start, opcode, targetrank) """
+
+	trace_ops = []
+	for rank in range(ranks):
+		with RankOps(os.path.join(trace_dir, f'dumpi-{timestamp}-{rank:04d}.bin')) as trace:
+			trace.read_stream()
+		trace_ops.append(sorted(trace.ops))
+
+	return trace_ops
+
+
+def forma_export_ops(out_dir, trace_dir, *args):
+
+	""" runs foRMA with --export npz in out_dir and returns its ops table, as
+		(start, opcode, targetrank) of the ops of each rank
+	"""
+
+	os.makedirs(out_dir, exist_ok=True)
+	cmd = [sys.executable, os.path.join(repo_dir, 'forma.py'), trace_dir, timestamp, '-s', '--no-cache', '--export', 'npz'] + list(args)
+	run = subprocess.run(cmd, cwd=out_dir, capture_output=True, text=True)
+	assert run.returncode == 0, run.stdout + run.stderr
+
+	table = np.load(os.path.join(out_dir, 'forma-export', 'ops.npz'))
+	ops = (table['opcode'] != 3)
+	rows = zip(table['rank'][ops].tolist(), table['start'][ops].tolist(), table['opcode'][ops].tolist(), table['targetrank'][ops].tolist())
+	export_ops = dict()
+	for rank, start, opcode, targetrank in rows:
+		export_ops.setdefault(rank, []).append((start, opcode, targetrank))
+
+	return {rank: sorted(o) for rank, o in export_ops.items()}
+
+
+@pytest.mark.parametrize('args', [[], ['--reader', 'pydumpi'], ['-o']])
+def test_target_ranks(trace_dir, trace_ops, tmp_path, args):
+
+	export_ops = forma_export_ops(str(tmp_path), trace_dir, *args)
+
+	assert [export_ops[rank] for rank in range(ranks)] == trace_ops
+
+
+@pytest.mark.parametrize('args', [['--ranks', '2'], ['--windows', '1', '--epoch-range', '3:6'], ['--ranks', '1,3', '--epoch-range', '2']])
+def test_selected_target_ranks(trace_dir, trace_ops, tmp_path, args):
+
+	## selected ranks are numbered from 0
+	export_ops = forma_export_ops(str(tmp_path), trace_dir, *args)
+	selected = [int(r) for r in args[1].split(',')] if args[0] == '--ranks' else list(range(ranks))
+
+	assert export_ops
+	for pos, ops in export_ops.items():
+		assert set(ops) <= set(trace_ops[selected[pos]])
+
+
+@pytest.mark.parametrize('args', [[], ['-o']])
+def test_ops_columns(trace_dir, trace_ops, tmp_path, args):
+
+	forma_export_ops(str(tmp_path), trace_dir, *args)
+	table = np.load(os.path.join(str(tmp_path), 'forma-export', 'ops.npz'))
+
+	assert [(name, table[name].dtype) for name in table.files] == [(c[0], np.dtype(c[1])) for c in fod.FormaOpdata.columns]
+	## rows are sorted by rank, then window, then epoch
+	keys = np.stack([table['rank'], table['window'], table['epoch']], axis=1)
+	assert (np.diff(np.lexsort(keys.T[::-1])) == 1).all()
+	assert np.bincount(table['rank'][table['opcode'] != 3], minlength=ranks).tolist() == [len(ops) for ops in trace_ops]
+
+	## fences bound no data transfer, ops end before the fence that closes their epoch
+	fences = (table['opcode'] == 3)
+	assert (table['dtbound'][fences] == 0).all()
+	assert (table['dtbound'][~fences] >= table['duration'][~fences]).all()
@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import subprocess
+import sys
+import os
+
+import pytest
+
+from pydumpi import DumpiTrace
+
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import forma_dumpi as fdr
+import forma_footer as ff
+import forma_synth as fy
+
+
+## Call counts of the footers of trace files (cf. forma_footer.py), against
+## the calls of a synthetic execution (cf. forma_synth.py) as read by pydumpi.
+
+timestamp = '2026.01.01'
+ranks = 5
+counted = ['MPI_Get', 'MPI_Put', 'MPI_Accumulate', 'MPI_Win_fence', 'MPI_Win_create', 'MPI_Init']
+
+
+class RankCalls(DumpiTrace):
+
+	""" counts the calls of each of counted in a trace file """
+
+	def __init__(self, file_name):
+		super().__init__(file_name)
+		self.calls = {name: 0 for name in counted}
+
+	def on_get(self, data, thread, cpu_time, wall_time, perf_info):
+		self.calls['MPI_Get'] += 1
+
+	def on_put(self, data, thread, cpu_time, wall_time, perf_info):
+		self.calls['MPI_Put'] += 1
+
+	def on_accumulate(self, data, thread, cpu_time, wall_time, perf_info):
+		self.calls['MPI_Accumulate'] += 1
+
+	def on_win_fence(self, data, thread, cpu_time, wall_time, perf_info):
+		self.calls['MPI_Win_fence'] += 1
+
+	def on_win_create(self, data, thread, cpu_time, wall_time, perf_info):
+		self.calls['MPI_Win_create'] += 1
+
+	def on_init(self, data, thread, cpu_time, wall_time, perf_info):
+		self.calls['MPI_Init'] += 1
+
+
+@pytest.fixture(scope='module')
+def tracefiles(tmp_path_factory):
+
+	dirname = str(tmp_path_factory.mktemp('trace'))
+	fy.forma_synth_traces(dirname, timestamp, ranks=ranks, wins=3, epochs=6, ops=9, seed=5)
+
+	return [os.path.join(dirname, f'dumpi-{timestamp}-{rank:04d}.bin') for rank in range(ranks)]
+
+
+@pytest.fixture(scope='module')
+def trace_calls(tracefiles):
+
+	""" the calls of each of counted in each trace file """
+
+	trace_calls = []
+	for tracefile in tracefiles:
+		with RankCalls(tracefile) as trace:
+			trace.read_stream()
+		trace_calls.append(trace.calls)
+
+	return trace_calls
+
+
+def test_fids():
+
+	assert [ff.forma_footer_fid(name) for name in ['MPI_Get', 'mpi_put', 'MPI_ACCUMULATE', 'MPI_Win_fence', 'MPI_Init', 'MPI_Finalize']] == \
+			[fdr.dumpi_get, fdr.dumpi_put, fdr.dumpi_accumulate, fdr.dumpi_win_fence, fdr.dumpi_init, fdr.dumpi_finalize]
+	assert ff.forma_footer_fid('MPI_Nonexistent') is None
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_counts(tracefiles, trace_calls, threads):
+
+	call_counts_per_rank = ff.forma_footer_scan(tracefiles, threads)
+	fids = [ff.forma_footer_fid(name) for name in counted]
+
+	for call_counts, calls in zip(call_counts_per_rank, trace_calls):
+		assert [call_counts[fid] for fid in fids] == [calls[name] for name in counted]
+	assert ff.forma_footer_totals(call_counts_per_rank, fids) == [sum([calls[name] for calls in trace_calls]) for name in counted]
+
+
+def test_unreadable_footer(tracefiles, trace_calls, tmp_path):
+
+	## a truncated trace file is skipped from the totals
+	truncated = str(tmp_path/'truncated.bin')
+	with open(tracefiles[0], 'rb') as f:
+		data = f.read()
+	with open(truncated, 'wb') as f:
+		f.write(data[:len(data)//2])
+
+	call_counts_per_rank = ff.forma_footer_scan([truncated] + tracefiles[1:], 2)
+	fid = ff.forma_footer_fid('MPI_Get')
+
+	assert call_counts_per_rank[0] is None
+	assert ff.forma_footer_totals(call_counts_per_rank, [fid]) == [sum([calls['MPI_Get'] for calls in trace_calls[1:]])]
+
+
+def test_command_line(tracefiles, trace_calls, tmp_path):
+
+	calls_file = str(tmp_path/'calls.txt')
+	results_file = str(tmp_path/'results.txt')
+	with open(calls_file, 'w') as f:
+		f.write('# RMA calls\nMPI_Get\nMPI_Win_fence\n')
+	with open(results_file, 'w') as f:
+		f.write('previous results\n')
+
+	cmd = [sys.executable, os.path.join(repo_dir, 'forma_footer.py'), calls_file, os.path.dirname(tracefiles[0]), timestamp, results_file]
+	run = subprocess.run(cmd, capture_output=True, text=True)
+	assert run.returncode == 0, run.stdout + run.stderr
+
+	with open(results_file) as f:
+		assert f.read().splitlines() == ['previous results'] + \
+				[f'footer_reader: {name} : {sum([calls[name] for calls in trace_calls])}' for name in ['MPI_Get', 'MPI_Win_fence']]
@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+
+
+###################################################################################
+# RMA timing profiling using data from SST-Dumpi traces
+#
+# In order to extract timing information from the traces, the following are assumed
+# about the corresponding executions:
+#
+# - Synchronization is based on MPI_Win_fence. PSCW and locks are not supported.
+# - Windows created by ranks belong to the same communicator.
+# - RMA epochs on different windows may overlap.
+#
+#	My convention:
+#	-> using # to comment out code
+#	-> using ## to add comments and explanation
+#
+###################################################################################
+
+
+import sys
+import os
+
+import numpy as np
+import pytest
+
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import forma_stats as fs
+
+
+## Quantile sketches (cf. FormaQuantiles), against the quantiles of the values
+## they are built of.
+
+quantiles = [0.1, 0.5, 0.9, 0.99, 0.999]
+
+
+@pytest.fixture
+def quantile_error():
+
+	""" sets the quantile error of new sketches, as --quantile-error does, and restores it """
+
+	k = fs.FormaQuantiles.default_k
+	yield fs.forma_set_quantile_error
+	fs.FormaQuantiles.default_k = k
+
+
+def rank_error(values, value, q):
+
+	""" returns how far the rank of value is from the q-th quantile of values, as a fraction of their count """
+
+	ranks = np.searchsorted(np.sort(values), value, side='left'), np.searchsorted(np.sort(values), value, side='right')
+	if ranks[0] <= q*len(values) <= ranks[1]:
+		return 0.0
+
+	return min([abs(r - q*len(values)) for r in ranks])/len(values)
+
+
+def test_exact():
+
+	## as long as no level is compacted, quantiles are those of the in-memory version
+	values = np.random.default_rng(1).integers(0, 10**6, size=150)
+	sketch = fs.FormaQuantiles(200)
+	for v in values.tolist():
+		sketch.update(v)
+
+	assert sketch.compactions == 0
+	assert sketch.quantile(0.5) == np.median(values)
+	for q in fs.tail_quantiles:
+		assert sketch.quantile(q) == pytest.approx(np.quantile(values, q))
+
+
+@pytest.mark.parametrize('error', [0.05, 0.01])
+def test_error_bound(quantile_error, error):
+
+	quantile_error(error)
+	rng = np.random.default_rng(2)
+	for trial in range(3):
+		values = rng.integers(0, 10**6, size=100000)
+		sketch = fs.FormaQuantiles().update_many(values)
+
+		assert sketch.compactions > 0
+		assert len(sketch) == len(values)
+		for q in quantiles:
+			assert rank_error(values, sketch.quantile(q), q) <= error
+
+
+@pytest.mark.parametrize('error', [0.05, 0.01])
+def test_merge_error_bound(quantile_error, error):
+
+	## sketches of parts of the values (some updated one value at a time), merged
+	quantile_error(error)
+	values = np.random.default_rng(3).lognormal(8, 1, size=60000).astype(np.int64)
+	parts = np.array_split(values, 4)
+	sketches = [fs.FormaQuantiles().update_many(part) for part in parts[:3]] + [fs.FormaQuantiles()]
+	for v in parts[3].tolist():
+		sketches[3].update(v)
+
+	merged = fs.FormaQuantiles()
+	for sketch in sketches:
+		merged.merge(sketch)
+
+	assert len(merged) == len(values)
+	for q in quantiles:
+		assert rank_error(values, merged.quantile(q), q) <= error
+
+
+@pytest.mark.parametrize('error', [0.05, 0.01])
+def test_merge_subtracted(quantile_error, error):
+
+	## sketches of start times of many small groups (some compacted), each 
+	## shifted by an offset of its own, as data transfer bounds in the incremental version
+	quantile_error(error)
+	rng = np.random.default_rng(5)
+	sizes = rng.integers(1, 3*fs.FormaQuantiles.default_k, size=300)
+	offsets = rng.integers(10**6, 2*10**6, size=len(sizes))
+	starts = [rng.integers(0, 10**6, size=size) for size in sizes.tolist()]
+	sketches = [fs.FormaQuantiles() for size in sizes]
+	for sketch, values in zip(sketches, starts):
+		for v in values.tolist():
+			sketch.update(v)
+
+	values = np.concatenate([offset - values for offset, values in zip(offsets.tolist(), starts)])
+	merged = fs.FormaQuantiles().merge_subtracted(sketches, offsets.tolist())
+
+	assert len(merged) == len(values)
+	for q in quantiles:
+		assert rank_error(values, merged.quantile(q), q) <= error
+
+	## as long as no sketch is compacted, same as the quantiles of the values
+	exact = [i for i, sketch in enumerate(sketches) if sketch.compactions == 0][:3]
+	values = np.concatenate([offsets[i] - starts[i] for i in exact])
+	merged = fs.FormaQuantiles(len(values)+1).merge_subtracted([sketches[i] for i in exact], [offsets[i] for i in exact])
+	assert merged.compactions == 0
+	assert merged.quantile(0.5) == np.median(values)
+
+
+def test_moments():
+
+	## FormaMoments merged out of parts, against the statistics of all values
+	values = np.random.default_rng(4).integers(0, 1000, size=1000)
+	moments = fs.FormaMoments()
+	for part in np.array_split(values, 7):
+		part_moments = fs.FormaMoments()
+		for v in part.tolist():
+			part_moments.update(v)
+		moments.merge(part_moments)
+
+	total, vmin, vmax, mean, median, std = moments.stats_x6()
+	assert [total, vmin, vmax] == [values.sum(), values.min(), values.max()]
+	assert mean == pytest.approx(values.mean())
+	assert std == pytest.approx(values.std())
+	assert median is None